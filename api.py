@@ -0,0 +1,257 @@
+# api.py
+# JSON API(/api/v1)：給手機 App 與外部系統用，不用再解析 HTML 頁面
+#   * 登入方式和網頁一樣(POST /login 拿到的 session cookie)，權限檢查也和對應的網頁相同
+#   * 列表都是游標分頁：回傳 next_cursor / prev_cursor，下一頁帶 ?after=...，上一頁帶 ?before=...
+#   * ?fields=id,title 只回傳需要的欄位
+#   * 有安裝 orjson 就用 orjson 輸出(快很多)，沒有就用內建 json
+import json
+from datetime import datetime
+from decimal import Decimal
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse
+from psycopg.rows import dict_row
+
+from auth import current_user
+from db import getReadDB
+from pagination import SortKey, BROWSE_ORDER, DEFAULT_PAGE_SIZE, fetch_page
+from ratings import RATING_ROLES, RATINGS_ORDER, summary_stats
+from reputation import PROPOSAL_SORTS, proposals_sql
+from search import SEARCH_ORDER, build_tsquery
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"無法轉成 JSON：{type(value).__name__}")
+
+class APIResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode()
+
+router = APIRouter(prefix="/api/v1", default_response_class=APIResponse)
+
+#各資源可以回傳的欄位(也是沒有指定 fields 時的預設)
+PROJECT_FIELDS = ("id", "title", "description", "status", "client_id", "client_username",
+                  "contractor_id", "contractor_username", "bid_deadline", "closed_at", "rating_open",
+                  "created_at", "updated_at")
+BROWSE_FIELDS = ("id", "title", "description", "bid_deadline", "created_at")
+PROPOSAL_FIELDS = ("id", "contractor_id", "contractor_username", "message", "price", "accepted",
+                   "proposal_filename", "proposal_size", "file_url", "created_at",
+                   "rating_avg", "rating_count", "completed_count", "reject_rate", "reputation", "combined_score")
+CLOSURE_FIELDS = ("id", "version", "filename", "size", "sha256", "file_url", "created_at")
+ISSUE_FIELDS = ("id", "title", "description", "status", "opener_id", "opener_name",
+                "created_at", "resolved_at", "comments")
+RATING_FIELDS = ("id", "project_id", "project_title", "rater_id", "rater_username",
+                 "score_1", "score_2", "score_3", "comment", "created_at")
+
+CLOSURES_ORDER = [SortKey("version", desc=True, kind=int)]
+ISSUES_ORDER = [SortKey("i.created_at", desc=True, kind=datetime), SortKey("i.id", desc=True, kind=int)]
+
+def select_fields(fields: str | None, allowed: tuple) -> tuple:
+    if not fields:
+        return allowed
+    wanted = tuple(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in wanted if f not in allowed]
+    if unknown:
+        raise HTTPException(400, f"未知的欄位：{', '.join(unknown)}")
+    return wanted
+
+def pick(row: dict, fields: tuple) -> dict:
+    return {f: row.get(f) for f in fields}
+
+def page_body(page: dict, fields: tuple) -> dict:
+    return {
+        "items": [pick(r, fields) for r in page["items"]],
+        "limit": page["limit"],
+        "next_cursor": page["next_cursor"],
+        "prev_cursor": page["prev_cursor"],
+    }
+
+async def require_user(request: Request, conn) -> dict:
+    user = await current_user(request, conn)
+    if not user:
+        raise HTTPException(401, "請先登入")
+    return user
+
+async def load_project(cur, project_id: int) -> dict:
+    await cur.execute("""
+        SELECT p.id, p.title, p.description, p.status, p.client_id, uc.username AS client_username,
+               p.contractor_id, ur.username AS contractor_username, p.bid_deadline, p.closed_at, p.rating_open,
+               p.created_at, p.updated_at
+        FROM projects p
+        JOIN users uc ON uc.id = p.client_id
+        LEFT JOIN users ur ON ur.id = p.contractor_id
+        WHERE p.id=%s;
+    """, (project_id,))
+    project = await cur.fetchone()
+    if not project:
+        raise HTTPException(404, "找不到案件")
+    return project
+
+#和案件詳情頁一樣：案主或接案人(角色)才能看
+def check_can_view(user: dict, project: dict):
+    if not ((user["role"] == "client" and project["client_id"] == user["id"]) or user["role"] == "contractor"):
+        raise HTTPException(403, "無權限")
+
+#和下載結案檔案、Issue 一樣：只有此案的委託人或承作的接案人
+def check_participant(user: dict, project: dict):
+    if user["id"] not in (project["client_id"], project["contractor_id"]):
+        raise HTTPException(403, "無權限")
+
+# ---------------- 案件 ----------------
+#瀏覽/搜尋公開案件(和 /browse 一樣只開放給接案人)
+@router.get("/projects")
+async def api_browse_projects(request: Request,
+                              q: str | None = Query(None), after: str | None = Query(None),
+                              before: str | None = Query(None), limit: int = Query(DEFAULT_PAGE_SIZE),
+                              fields: str | None = Query(None), conn=Depends(getReadDB)):
+    user = await require_user(request, conn)
+    if user["role"] != "contractor":
+        raise HTTPException(403, "只有接案人可以瀏覽案件")
+    tsquery = build_tsquery(q) if q else None
+    selected = select_fields(fields, BROWSE_FIELDS + (("rank",) if tsquery else ()))
+    async with conn.cursor(row_factory=dict_row) as cur:
+        if tsquery:
+            page = await fetch_page(cur, """
+                SELECT id, title, description, created_at, bid_deadline,
+                       ts_rank_cd(search_vector, query)::float8 AS rank
+                FROM projects, to_tsquery('simple', %s) AS query
+                WHERE status='open'
+                  AND search_vector @@ query
+            """, (tsquery,), SEARCH_ORDER, limit, after=after, before=before)
+        else:
+            page = await fetch_page(cur, """
+                SELECT id, title, description, created_at, bid_deadline
+                FROM projects
+                WHERE status='open'
+            """, (), BROWSE_ORDER, limit, after=after, before=before)
+    return page_body(page, selected)
+
+@router.get("/projects/{project_id}")
+async def api_project_detail(request: Request, project_id: int, fields: str | None = Query(None),
+                             conn=Depends(getReadDB)):
+    user = await require_user(request, conn)
+    selected = select_fields(fields, PROJECT_FIELDS)
+    async with conn.cursor(row_factory=dict_row) as cur:
+        project = await load_project(cur, project_id)
+    check_can_view(user, project)
+    return pick(project, selected)
+
+# ---------------- 提案 ----------------
+#委託人看得到全部提案；接案人只看得到自己提的
+@router.get("/projects/{project_id}/proposals")
+async def api_project_proposals(request: Request, project_id: int,
+                                after: str | None = Query(None), before: str | None = Query(None),
+                                limit: int = Query(DEFAULT_PAGE_SIZE), fields: str | None = Query(None),
+                                sort: str = Query("recent"), conn=Depends(getReadDB)):
+    user = await require_user(request, conn)
+    selected = select_fields(fields, PROPOSAL_FIELDS)
+    if sort not in PROPOSAL_SORTS:
+        raise HTTPException(400, f"不支援的排序：{sort}")
+    async with conn.cursor(row_factory=dict_row) as cur:
+        project = await load_project(cur, project_id)
+        check_can_view(user, project)
+        only_mine = project["client_id"] != user["id"]
+        #提案連同接案人信譽一起查，可依 recent / price / reputation / combined 排序
+        page = await fetch_page(cur, proposals_sql(only_mine), (project_id, user["id"]) if only_mine else (project_id,),
+                                PROPOSAL_SORTS[sort], limit, after=after, before=before, where_joiner="WHERE")
+    for p in page["items"]:
+        p["file_url"] = f"/proposals/{p['id']}/file"
+    return page_body(page, selected)
+
+# ---------------- 結案檔案 ----------------
+@router.get("/projects/{project_id}/closures")
+async def api_project_closures(request: Request, project_id: int,
+                               after: str | None = Query(None), before: str | None = Query(None),
+                               limit: int = Query(DEFAULT_PAGE_SIZE), fields: str | None = Query(None),
+                               conn=Depends(getReadDB)):
+    user = await require_user(request, conn)
+    selected = select_fields(fields, CLOSURE_FIELDS)
+    async with conn.cursor(row_factory=dict_row) as cur:
+        project = await load_project(cur, project_id)
+        check_participant(user, project)
+        page = await fetch_page(cur, """
+            SELECT id, version, filename, size, sha256, created_at
+            FROM closure_files
+            WHERE project_id=%s
+        """, (project_id,), CLOSURES_ORDER, limit, after=after, before=before)
+    for f in page["items"]:
+        f["file_url"] = f"/files/{f['id']}"
+    return page_body(page, selected)
+
+# ---------------- Issue ----------------
+#每個 Issue 附上它的留言(這一頁的留言一次查完)
+@router.get("/projects/{project_id}/issues")
+async def api_project_issues(request: Request, project_id: int,
+                             after: str | None = Query(None), before: str | None = Query(None),
+                             limit: int = Query(DEFAULT_PAGE_SIZE), fields: str | None = Query(None),
+                             conn=Depends(getReadDB)):
+    user = await require_user(request, conn)
+    selected = select_fields(fields, ISSUE_FIELDS)
+    async with conn.cursor(row_factory=dict_row) as cur:
+        project = await load_project(cur, project_id)
+        check_participant(user, project)
+        page = await fetch_page(cur, """
+            SELECT i.id, i.title, i.description, i.status, i.opener_id, u.username AS opener_name,
+                   i.created_at, i.resolved_at
+            FROM issues i JOIN users u ON u.id = i.opener_id
+            WHERE i.project_id=%s
+        """, (project_id,), ISSUES_ORDER, limit, after=after, before=before)
+        comments: dict[int, list] = {}
+        if "comments" in selected and page["items"]:
+            await cur.execute("""
+                SELECT ic.id, ic.issue_id, ic.author_id, u.username AS author_name, ic.content, ic.created_at
+                FROM issue_comments ic JOIN users u ON u.id = ic.author_id
+                WHERE ic.issue_id = ANY(%s)
+                ORDER BY ic.created_at, ic.id;
+            """, ([i["id"] for i in page["items"]],))
+            for c in await cur.fetchall():
+                comments.setdefault(c.pop("issue_id"), []).append(c)
+    for i in page["items"]:
+        i["comments"] = comments.get(i["id"], [])
+    return page_body(page, selected)
+
+# ---------------- 評價 ----------------
+@router.get("/users/{user_id}/ratings/{role}")
+async def api_user_ratings(request: Request, user_id: int, role: str,
+                           after: str | None = Query(None), before: str | None = Query(None),
+                           limit: int = Query(DEFAULT_PAGE_SIZE), fields: str | None = Query(None),
+                           conn=Depends(getReadDB)):
+    if role not in RATING_ROLES:
+        raise HTTPException(404, "找不到頁面")
+    await require_user(request, conn)
+    selected = select_fields(fields, RATING_FIELDS)
+    async with conn.cursor(row_factory=dict_row) as cur:
+        await cur.execute("""
+            SELECT u.id, u.username, s.cnt, s.sum_1, s.sum_2, s.sum_3, s.hist_1, s.hist_2, s.hist_3
+            FROM users u
+            LEFT JOIN rating_summary s ON s.user_id = u.id AND s.role = %s
+            WHERE u.id=%s;
+        """, (role, user_id))
+        target = await cur.fetchone()
+        if not target:
+            raise HTTPException(404, "找不到使用者")
+        page = await fetch_page(cur, """
+            SELECT r.id, r.project_id, p.title AS project_title, r.rater_id, u.username AS rater_username,
+                   r.score_1, r.score_2, r.score_3, r.comment, r.created_at
+            FROM ratings r
+            JOIN users    u ON u.id = r.rater_id
+            JOIN projects p ON p.id = r.project_id
+            WHERE r.target_id=%s AND r.target_role=%s
+        """, (user_id, role), RATINGS_ORDER, limit, after=after, before=before)
+    stats = summary_stats(target)
+    return {
+        "user": {"id": target["id"], "username": target["username"], "role": role},
+        "summary": {"count": stats["cnt"], "dims": RATING_ROLES[role]["dims"],
+                    "averages": [stats["avg1"], stats["avg2"], stats["avg3"]], "histograms": stats["hist"]},
+        **page_body(page, selected),
+    }
@@ -0,0 +1,87 @@
+# archive.py
+# 案件的 ZIP 匯出：把所有版本的結案檔案(可選：提案書、Issue 與留言)邊產生邊送出
+#   * zipfile 寫到一個不能 seek 的 _Sink，每寫一段就取出來 yield，不用暫存檔，記憶體用量固定
+#   * 檔案從 storage 後端分塊讀，本機或 S3 都一樣
+#   * 整個產生過程在 threadpool 裡跑(讀檔、壓縮都是同步的)，不卡 event loop
+import json
+import zipfile
+
+from starlette.concurrency import iterate_in_threadpool
+
+from metrics import count_bytes
+from storage import open_stored, READ_CHUNK
+
+#已經壓縮過的檔案(zip、pdf、圖片)再壓也小不了多少，用最快的等級
+COMPRESS_LEVEL = 1
+
+class _Sink:
+    def __init__(self):
+        self._parts: list[bytes] = []
+        self.pending = 0    #還沒取走的 bytes
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self.pending += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        self.pending = 0
+        return data
+
+def _safe_name(name: str) -> str:
+    return (name or "file").replace("/", "_").replace("\\", "_")
+
+def _date_time(dt) -> tuple:
+    return dt.timetuple()[:6] if dt and dt.year >= 1980 else (1980, 1, 1, 0, 0, 0)
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+#要放進 ZIP 的檔案：(ZIP 內的名稱, 儲存區的檔案, 時間)
+def archive_entries(data: dict, include_proposals: bool) -> list[tuple]:
+    entries = [(f"closures/v{f['version']}_{_safe_name(f['filename'])}", open_stored(f["sha256"], f["filepath"]), f["created_at"])
+               for f in data["closures"]]
+    if include_proposals:
+        entries += [(f"proposals/{p['id']}_{_safe_name(p['contractor_username'])}_{_safe_name(p['proposal_filename'])}",
+                     open_stored(p["proposal_sha256"], p["proposal_filepath"]), p["created_at"])
+                    for p in data["proposals"]]
+    return entries
+
+def issues_json(data: dict) -> bytes:
+    issues = [{**i, "comments": data["comments_by_issue"].get(i["id"], [])} for i in data["issues"]]
+    return json.dumps(issues, ensure_ascii=False, indent=2, default=_json_default).encode()
+
+def _generate(entries: list[tuple], extra: dict[str, bytes]):
+    sink = _Sink()
+    missing = []
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+        for name, stored, created_at in entries:
+            st = stored.stat() if stored is not None else None
+            if st is None:
+                missing.append(name)
+                continue
+            info = zipfile.ZipInfo(name, date_time=_date_time(created_at))
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info._compresslevel = COMPRESS_LEVEL   #自己建的 ZipInfo 不會套用 ZipFile 的 compresslevel
+            with zf.open(info, "w", force_zip64=st.size > 2**31) as out:
+                for chunk in stored.iter_range(0, st.size):
+                    out.write(chunk)
+                    if sink.pending >= READ_CHUNK:
+                        yield sink.take()
+            yield sink.take()
+        for name, content in extra.items():
+            zf.writestr(name, content)
+        if missing:
+            zf.writestr("missing.txt", "以下檔案在儲存區找不到，沒有放進壓縮檔：\n" + "\n".join(missing) + "\n")
+    yield sink.take()     #最後的 central directory
+
+async def stream_archive(entries: list[tuple], extra: dict[str, bytes]):
+    async for chunk in iterate_in_threadpool(_generate(entries, extra)):
+        if chunk:
+            count_bytes("download", "archive", len(chunk))
+            yield chunk
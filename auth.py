@@ -3,10 +3,18 @@ from fastapi import Request
 from starlette.middleware.sessions import SessionMiddleware
 from dotenv import load_dotenv
 from psycopg.rows import dict_row
+from collections import OrderedDict
 import os
+import time
 
 load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret")
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))    #最多快取幾位使用者
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))      #快取有效秒數(0 代表不快取)
+
+#使用者資料快取：{ user_id: (過期時間, row) }，依最近使用順序排列(LRU)
+_user_cache: "OrderedDict[int, tuple[float, dict]]" = OrderedDict()
+_user_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
 
 def setup_session(app):
     app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, session_cookie="jp_session")
@@ -15,12 +23,53 @@ def login_user(request: Request, user_id: int):
     request.session["user_id"] = user_id
 
 def logout_user(request: Request):
+    uid = request.session.get("user_id")
+    if uid:
+        invalidate_user(uid)
     request.session.clear()
 
+#使用者資料有異動(改名、改角色、刪除)時呼叫，讓下一次請求重新讀DB
+def invalidate_user(user_id: int):
+    if _user_cache.pop(user_id, None) is not None:
+        _user_cache_stats["invalidations"] += 1
+
+def clear_user_cache():
+    _user_cache.clear()
+
+def user_cache_stats() -> dict:
+    return {**_user_cache_stats, "size": len(_user_cache), "max_size": USER_CACHE_SIZE, "ttl": USER_CACHE_TTL}
+
+def _cache_get(uid: int) -> dict | None:
+    entry = _user_cache.get(uid)
+    if entry is None:
+        return None
+    expires_at, row = entry
+    if expires_at < time.monotonic():   #過期就丟掉
+        del _user_cache[uid]
+        return None
+    _user_cache.move_to_end(uid)    #標記為最近使用
+    return row
+
+def _cache_put(uid: int, row: dict):
+    _user_cache[uid] = (time.monotonic() + USER_CACHE_TTL, row)
+    _user_cache.move_to_end(uid)
+    while len(_user_cache) > USER_CACHE_SIZE:   #超過上限就把最久沒用的踢掉
+        _user_cache.popitem(last=False)
+        _user_cache_stats["evictions"] += 1
+
 async def current_user(request: Request, conn) -> dict | None:
     uid = request.session.get("user_id")
     if not uid:
         return None
+    if USER_CACHE_TTL > 0 and USER_CACHE_SIZE > 0:
+        row = _cache_get(uid)
+        if row is not None:
+            _user_cache_stats["hits"] += 1
+            return dict(row)    #回傳複本，避免呼叫端改到快取內容
+        _user_cache_stats["misses"] += 1
     async with conn.cursor(row_factory=dict_row) as cur:
         await cur.execute("SELECT id, username, role, created_at FROM users WHERE id=%s;", (uid,))
-        return await cur.fetchone()
+        row = await cur.fetchone()
+    if row is not None and USER_CACHE_TTL > 0 and USER_CACHE_SIZE > 0:
+        _cache_put(uid, dict(row))
+    return row
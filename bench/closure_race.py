@@ -0,0 +1,71 @@
+# bench/closure_race.py
+# 併發檢查：同一個案件同時上傳多個結案檔案，確認版本號不會重複、也不會跳號
+#   python bench/seed.py --reset --scale 0.01
+#   python bench/closure_race.py [--uploads 20]
+# 直接在程式內呼叫網站(httpx.ASGITransport)，不用另外啟動 uvicorn；會真的新增結案檔案，請只對測試資料庫執行
+import argparse
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("RATE_LIMIT", "0")    #同一個人連續上傳會被流量限制擋下來
+
+import httpx
+import psycopg
+
+from db import DATABASE_URL
+from seed import BENCH_PASSWORD
+
+def pick_project(conn) -> tuple[int, str, int]:
+    row = conn.execute("""
+        SELECT p.id, u.username, p.closure_version FROM projects p JOIN users u ON u.id = p.contractor_id
+        WHERE p.status = 'in_progress' LIMIT 1;
+    """).fetchone()
+    if row is None:
+        raise RuntimeError("找不到 in_progress 的案件，請先執行 bench/seed.py")
+    return row
+
+async def upload_all(project_id: int, username: str, n: int) -> list[int]:
+    import main
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+        if r.status_code != 302:
+            raise RuntimeError(f"登入失敗：{username} ({r.status_code})")
+        #全部同時送出
+        responses = await asyncio.gather(*(
+            client.post(f"/projects/{project_id}/upload",
+                        files={"file": (f"race{i}.zip", b"PK\x03\x04" + str(i).encode(), "application/zip")})
+            for i in range(n)))
+    return [r.status_code for r in responses]
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="同一個案件同時上傳結案檔案，檢查版本號")
+    parser.add_argument("--uploads", type=int, default=20, help="同時上傳幾個檔案")
+    args = parser.parse_args(argv)
+
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        project_id, username, before = pick_project(conn)
+    codes = asyncio.run(upload_all(project_id, username, args.uploads))
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        versions = [r[0] for r in conn.execute(
+            "SELECT version FROM closure_files WHERE project_id=%s AND version > %s ORDER BY version;",
+            (project_id, before)).fetchall()]
+        counter = conn.execute("SELECT closure_version FROM projects WHERE id=%s;", (project_id,)).fetchone()[0]
+
+    problems = []
+    if any(code != 302 for code in codes):
+        problems.append(f"有上傳失敗：{sorted(set(codes))}")
+    if versions != list(range(before + 1, before + args.uploads + 1)):
+        problems.append(f"版本號不連續或重複：{versions}")
+    if counter != before + args.uploads:
+        problems.append(f"案件的版本計數是 {counter}，應該是 {before + args.uploads}")
+    print(f"案件 {project_id}：同時上傳 {args.uploads} 個檔案，版本 {before + 1} ~ {counter}")
+    for p in problems:
+        print(f"FAIL  {p}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+# bench/cursors.py
+# 游標檢查：被竄改的分頁游標(?after= / ?before=)一律當作沒給，從第一頁開始，不能變成 500
+#   python bench/cursors.py
+# 不需要資料庫：對網站用到的每一種排序，確認
+#   * 正常的游標編碼後再解碼，值不變
+#   * 型別不對、格式不對的游標解碼結果是 None(不會代進 SQL)
+# 有問題就列出來，結束碼為 1(可以放進 CI)；實際送出竄改游標的請求在 bench/plans.py
+import base64
+import json
+import sys
+from datetime import datetime
+from decimal import Decimal
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pagination import BROWSE_ORDER, decode_cursor, encode_cursor
+
+#網站用到的排序：{名稱: SortKey 清單}
+def all_orders() -> dict[str, list]:
+    import api
+    import main
+    from ratings import RATINGS_ORDER
+    from reputation import PROPOSAL_SORTS
+    from search import SEARCH_ORDER
+    orders = {"browse": BROWSE_ORDER, "search": SEARCH_ORDER, "ratings": RATINGS_ORDER,
+              "client_dashboard": main.CLIENT_DASHBOARD_ORDER, "contractor_dashboard": main.CONTRACTOR_DASHBOARD_ORDER,
+              "closures": api.CLOSURES_ORDER, "issues": api.ISSUES_ORDER}
+    orders.update({f"proposals_{name}": keys for name, keys in PROPOSAL_SORTS.items()})
+    return orders
+
+#依欄位型別產生一筆正常的值
+SAMPLES = {datetime: datetime(2030, 1, 1, 10, 0), int: 42, float: 0.5, Decimal: Decimal("1000.50"), str: "abc", None: 1}
+
+def raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+#每個欄位輪流換成壞掉的值，其他欄位維持正常
+BAD_VALUES = ["abc", {}, {"x": 1}, {"dt": "不是時間"}, {"dt": 5}, {"dec": "abc"}, {"dec": "NaN"},
+              [1, 2], True, "a\x00b"]
+#整個游標壞掉
+BAD_CURSORS = ["!!!", raw_cursor({"a": 1}), raw_cursor("abc"), raw_cursor([]), base64.urlsafe_b64encode(b"\xff").decode()]
+
+def check(name: str, keys: list) -> list[str]:
+    problems = []
+    row = {k.column: SAMPLES.get(k.kind, 1) for k in keys}
+    good = encode_cursor(row, keys)
+    if decode_cursor(good, keys) != [row[k.column] for k in keys]:
+        problems.append(f"{name}：正常的游標解碼後不一樣")
+    encoded = json.loads(base64.urlsafe_b64decode(good + "=" * (-len(good) % 4)))
+    for i, k in enumerate(keys):
+        for bad in BAD_VALUES:
+            if k.accepts(bad):
+                continue    #例如沒指定型別的欄位本來就能放 "abc"
+            values = list(encoded)
+            values[i] = bad
+            if decode_cursor(raw_cursor(values), keys) is not None:
+                problems.append(f"{name}：{k.column} = {bad!r} 沒有被擋下來")
+    for bad in BAD_CURSORS + [raw_cursor(encoded + [1])]:
+        if decode_cursor(bad, keys) is not None:
+            problems.append(f"{name}：游標 {bad!r} 沒有被擋下來")
+    return problems
+
+def main(argv: list[str]) -> int:
+    problems = []
+    orders = all_orders()
+    for name, keys in orders.items():
+        problems += check(name, keys)
+    for p in problems:
+        print(f"FAIL  {p}")
+    print(f"共 {len(orders)} 種排序，{len(problems)} 個問題")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
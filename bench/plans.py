@@ -0,0 +1,218 @@
+# bench/plans.py
+# 查詢計畫檢查：在大量資料(bench/seed.py 灌的)上，確認網站下的每一句 SQL 都有用到索引
+#   python bench/seed.py --reset
+#   python bench/plans.py [--cost-budget 5000]
+# 做法：用 TestClient 在程式內把主要頁面與表單都走一遍，透過 metrics.QUERY_LISTENERS 收集實際執行的 SQL 與參數，
+#      再對每一句 SQL 跑 EXPLAIN (FORMAT JSON)(不會真的執行)檢查：
+#        * 大表(proposals、ratings、issue_comments ...)不能出現 Seq Scan
+#        * 估計成本不能超過 --cost-budget
+#      有問題的 SQL 會連同呼叫位置一起列出，結束碼為 1(可以放進 CI)；走的過程中有請求回 500 也算失敗
+# 走一遍表單會新增少量資料(提案、留言、Issue ...)，請只對測試資料庫執行
+import argparse
+import base64
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg
+
+from db import DATABASE_URL
+from seed import BENCH_PASSWORD
+
+#不能出現 Seq Scan 的資料表
+CHECKED_TABLES = {"users", "projects", "proposals", "closure_files", "ratings",
+                  "issues", "issue_comments", "rating_summary", "contractor_reputation"}
+COST_BUDGET = 5000.0
+#型別不對的游標：["abc", 1, 2] 和沒有 dt/d/dec 的 dict
+FORGED_CURSOR = base64.urlsafe_b64encode(b'["abc",1,2]').decode()
+FORGED_DICT_CURSOR = base64.urlsafe_b64encode(b'[{"x":1},1,2]').decode()
+#已知可以接受的例外：{SQL 開頭: 原因}
+ALLOWED = {
+    "SELECT COUNT(*) AS c FROM projects WHERE status='open'":
+        "接案人首頁的 open 案件數：已經走 projects_open_browse_idx 部分索引，但要數過所有 open 案件，成本隨資料量成長",
+    "SELECT id, title, description, updated_at FROM projects WHERE status='open'":
+        "推薦索引第一次建立時載入所有 open 案件(每個 worker 啟動時一次，之後改用 updated_at 增量同步)",
+}
+
+#從資料庫挑出要拿來測試的案件與帳號
+def pick_targets(conn) -> dict:
+    def one(sql):
+        row = conn.execute(sql).fetchone()
+        if row is None:
+            raise RuntimeError(f"找不到測試資料，請先執行 bench/seed.py：{sql}")
+        return row
+    submitted = one("""
+        SELECT p.id, uc.username, p.contractor_id, ur.username, p.client_id,
+               (SELECT id FROM closure_files WHERE project_id = p.id LIMIT 1),
+               (SELECT id FROM proposals WHERE project_id = p.id LIMIT 1),
+               (SELECT id FROM issues WHERE project_id = p.id AND status = 'open' LIMIT 1)
+        FROM projects p JOIN users uc ON uc.id = p.client_id JOIN users ur ON ur.id = p.contractor_id
+        WHERE p.status = 'submitted'
+          AND EXISTS (SELECT 1 FROM issues i WHERE i.project_id = p.id AND i.status = 'open')
+          AND EXISTS (SELECT 1 FROM proposals pr WHERE pr.project_id = p.id)
+        LIMIT 1;
+    """)
+    closed = one("""
+        SELECT p.id, uc.username, p.contractor_id FROM projects p JOIN users uc ON uc.id = p.client_id
+        WHERE p.status = 'closed' AND p.rating_open
+          AND NOT EXISTS (SELECT 1 FROM ratings r WHERE r.project_id = p.id AND r.rater_id = p.client_id)
+        LIMIT 1;
+    """)
+    in_progress = one("""
+        SELECT p.id, ur.username FROM projects p JOIN users ur ON ur.id = p.contractor_id
+        WHERE p.status = 'in_progress' LIMIT 1;
+    """)
+    open_project = one("""
+        SELECT p.id, uc.username FROM projects p JOIN users uc ON uc.id = p.client_id
+        WHERE p.status = 'open' AND (p.bid_deadline IS NULL OR p.bid_deadline > NOW() + interval '1 day') LIMIT 1;
+    """)
+    expired = one("""
+        SELECT p.id, uc.username, (SELECT id FROM proposals WHERE project_id = p.id LIMIT 1)
+        FROM projects p JOIN users uc ON uc.id = p.client_id
+        WHERE p.status = 'bid_closed'
+          AND EXISTS (SELECT 1 FROM proposals pr WHERE pr.project_id = p.id)
+        LIMIT 1;
+    """)
+    return {"submitted": submitted, "closed": closed, "in_progress": in_progress,
+            "open": open_project, "expired": expired}
+
+#要走過的頁面與表單：(登入帳號, method, 網址, 參數)
+def build_requests(t: dict) -> list[tuple]:
+    pid, client, contractor_id, contractor, client_id, closure_id, proposal_id, issue_id = t["submitted"]
+    closed_id, closed_client, closed_contractor_id = t["closed"]
+    ip_id, ip_contractor = t["in_progress"]
+    open_id, open_client = t["open"]
+    expired_id, expired_client, expired_proposal = t["expired"]
+    pdf = ("bench.pdf", b"%PDF-1.4\n%%EOF\n", "application/pdf")
+    return [
+        (None, "POST", "/register", {"data": {"username": "plan_check_user", "password": BENCH_PASSWORD, "role": "client"}}),
+        (client, "GET", "/dashboard", {}),
+        (client, "GET", f"/projects/{pid}", {}),
+        (client, "GET", f"/projects/{pid}", {"params": {"fragment": "issues"}}),     #即時更新只抓一個區塊
+        (expired_client, "GET", f"/projects/{expired_id}", {"params": {"sort": "combined"}}),
+        (client, "GET", f"/proposals/{proposal_id}/file", {}),
+        (client, "GET", f"/files/{closure_id}", {}),
+        (client, "GET", f"/projects/{pid}/issues/new", {}),
+        (client, "POST", f"/projects/{pid}/issues/create", {"data": {"title": "查詢計畫檢查", "description": "bench"}}),
+        (client, "POST", f"/issues/{issue_id}/comment", {"data": {"content": "查詢計畫檢查"}}),
+        (client, "POST", f"/issues/{issue_id}/resolve", {}),
+        (client, "POST", f"/projects/{pid}/decision", {"data": {"decision": "reject"}}),
+        (client, "GET", f"/ratings/contractor/{contractor_id}", {}),
+        (closed_client, "GET", f"/projects/{closed_id}/rate", {"params": {"target": "contractor"}}),
+        (closed_client, "POST", f"/projects/{closed_id}/rate",
+         {"data": {"target": "contractor", "score_1": "5", "score_2": "5", "score_3": "5", "comment": "bench"}}),
+        (open_client, "GET", f"/projects/{open_id}/edit", {}),
+        (open_client, "POST", "/projects/create", {"data": {"title": "查詢計畫檢查", "description": "bench", "bid_deadline": "2030-01-01T10:00"}}),
+        (expired_client, "POST", f"/projects/{expired_id}/select", {"data": {"proposal_id": str(expired_proposal)}}),
+        (contractor, "GET", "/dashboard", {}),
+        (contractor, "GET", "/dashboard", {"params": {"fragment": "projects"}}),
+        (contractor, "GET", "/browse", {}),
+        (contractor, "GET", "/browse", {"params": {"q": "網站前端"}}),
+        (contractor, "GET", f"/projects/{pid}", {}),
+        (contractor, "GET", f"/projects/{open_id}/propose", {}),
+        (contractor, "POST", f"/projects/{open_id}/propose", {"data": {"message": "bench", "price": "1000"},
+                                                               "files": {"proposal_file": pdf}}),
+        (ip_contractor, "GET", f"/projects/{ip_id}/upload", {}),
+        (ip_contractor, "POST", f"/projects/{ip_id}/upload", {"files": {"file": ("v.zip", b"PK", "application/zip")}}),
+        (ip_contractor, "GET", f"/ratings/client/{client_id}", {}),
+        #JSON API
+        (client, "GET", f"/api/v1/projects/{pid}", {}),
+        (client, "GET", f"/api/v1/projects/{pid}/proposals", {}),
+        (expired_client, "GET", f"/api/v1/projects/{expired_id}/proposals", {"params": {"sort": "reputation"}}),
+        (client, "GET", f"/api/v1/projects/{pid}/closures", {}),
+        (client, "GET", f"/api/v1/projects/{pid}/issues", {}),
+        (client, "GET", f"/api/v1/users/{contractor_id}/ratings/contractor", {}),
+        (contractor, "GET", "/api/v1/projects", {}),
+        (contractor, "GET", "/api/v1/projects", {"params": {"q": "網站前端"}}),
+        #竄改過的游標要從第一頁開始，不能變成 500(各種壞掉的游標見 bench/cursors.py)
+        (contractor, "GET", "/browse", {"params": {"after": FORGED_CURSOR}}),
+        (contractor, "GET", "/api/v1/projects", {"params": {"after": FORGED_CURSOR}}),
+        (contractor, "GET", "/api/v1/projects", {"params": {"before": FORGED_DICT_CURSOR}}),
+        (contractor, "GET", f"/api/v1/projects/{pid}/proposals", {}),
+    ]
+
+#用 TestClient 把頁面走一遍，收集每一句 SQL：{SQL: (參數, 呼叫位置)}，以及回 500 的請求
+def capture_statements(requests: list[tuple]) -> tuple[dict, list[str]]:
+    from fastapi.testclient import TestClient
+    import auth
+    import main
+    from metrics import QUERY_LISTENERS
+    from sqltrace import call_site, sql_text
+
+    statements: dict[str, tuple] = {}
+    errors: list[str] = []
+    def listener(cur, query, params, seconds):
+        text = sql_text(cur, query)
+        if text not in statements:
+            statements[text] = (params, call_site(skip=(__file__,)))
+    QUERY_LISTENERS.append(listener)
+    try:
+        with TestClient(main.app, raise_server_exceptions=False) as client:
+            current = None
+            for username, method, url, kwargs in requests:
+                if username != current:
+                    client.cookies.clear()
+                    if username:
+                        client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+                    current = username
+                auth.clear_user_cache()     #每次都讓 current_user 真的查一次 DB，才收集得到那句 SQL
+                r = client.request(method, url, follow_redirects=False, **kwargs)
+                if r.status_code >= 500:
+                    errors.append(f"{method} {url} {kwargs.get('params', '')} → {r.status_code}")
+    finally:
+        QUERY_LISTENERS.remove(listener)
+    return statements, errors
+
+def _walk(node):
+    yield node
+    for child in node.get("Plans", []):
+        yield from _walk(child)
+
+#回傳 (估計成本, 問題清單)
+def check_plan(conn, text: str, params, cost_budget: float) -> tuple[float, list[str]]:
+    row = conn.execute(f"EXPLAIN (FORMAT JSON) {text}", params).fetchone()
+    plan = row[0] if not isinstance(row[0], str) else json.loads(row[0])
+    root = plan[0]["Plan"]
+    problems = []
+    for node in _walk(root):
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in CHECKED_TABLES:
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+    cost = root["Total Cost"]
+    if cost > cost_budget:
+        problems.append(f"cost {cost:.0f} > {cost_budget:.0f}")
+    return cost, problems
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="檢查網站每一句 SQL 的查詢計畫")
+    parser.add_argument("--cost-budget", type=float, default=COST_BUDGET, help="估計成本上限")
+    parser.add_argument("--verbose", action="store_true", help="列出每一句 SQL 的結果(包含通過的)")
+    args = parser.parse_args(argv)
+
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        targets = pick_targets(conn)
+    statements, errors = capture_statements(build_requests(targets))
+
+    failed = len(errors)
+    for e in errors:
+        print(f"FAIL  {e}")
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        for text, (params, site) in statements.items():
+            if text.upper().startswith(("BEGIN", "COMMIT", "ROLLBACK", "SET ", "SHOW ")):
+                continue
+            try:
+                cost, problems = check_plan(conn, text, params, args.cost_budget)
+            except psycopg.Error as e:
+                cost, problems = 0.0, [f"EXPLAIN 失敗：{e}"]
+            allowed = next((why for prefix, why in ALLOWED.items() if text.startswith(prefix)), None)
+            if problems and not allowed:
+                failed += 1
+                print(f"FAIL  cost={cost:>9.1f}  {site}\n      {'; '.join(problems)}\n      {text[:200]}")
+            elif args.verbose:
+                print(f"{'ok  ' if not problems else 'skip'}  cost={cost:>9.1f}  {site}  {text[:120]}")
+    print(f"共 {len(statements)} 句 SQL，{failed - len(errors)} 句未通過，{len(errors)} 個請求回 500")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,118 @@
+# bench/query_count.py
+# 查詢次數檢查：案件詳情頁不管有多少提案、Issue、留言，SQL 次數與 round-trip 都要固定(避免 N+1 又跑回來)
+#   python bench/seed.py --reset --scale 0.01
+#   python bench/query_count.py
+# 做法：直接在程式內呼叫網站(httpx.ASGITransport)，透過 metrics.QUERY_LISTENERS 數每個請求下了幾句 SQL；
+#      pipeline 裡連續送出的 SQL 只算一個 round-trip。超過 ROUND_TRIP_BUDGET，
+#      或資料多的案件比資料少的案件多下了 SQL，就算失敗，結束碼為 1(可以放進 CI)
+# 只會讀資料，不會寫入
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+import psycopg
+from psycopg import pq
+
+from db import DATABASE_URL
+from seed import BENCH_PASSWORD
+
+#案件詳情頁：current_user 查使用者一次(快取清掉的情況) + load_project_detail 的 pipeline 一次
+ROUND_TRIP_BUDGET = 2
+
+#挑兩個案件：提案、Issue、留言最多的，和什麼都沒有的；兩者的 SQL 次數要一樣
+def pick_projects(conn) -> list[tuple[int, str, str]]:
+    busy = conn.execute("""
+        SELECT p.id, uc.username, ur.username
+        FROM projects p
+        JOIN users uc ON uc.id = p.client_id
+        JOIN users ur ON ur.id = p.contractor_id
+        JOIN issues i ON i.project_id = p.id
+        JOIN issue_comments ic ON ic.issue_id = i.id
+        WHERE EXISTS (SELECT 1 FROM proposals pr WHERE pr.project_id = p.id)
+        GROUP BY p.id, uc.username, ur.username
+        ORDER BY COUNT(DISTINCT i.id) DESC, COUNT(*) DESC
+        LIMIT 1;
+    """).fetchone()
+    empty = conn.execute("""
+        SELECT p.id, uc.username, NULL FROM projects p JOIN users uc ON uc.id = p.client_id
+        WHERE p.status = 'open'
+          AND NOT EXISTS (SELECT 1 FROM proposals pr WHERE pr.project_id = p.id)
+          AND NOT EXISTS (SELECT 1 FROM issues i WHERE i.project_id = p.id)
+        LIMIT 1;
+    """).fetchone()
+    if busy is None or empty is None:
+        raise RuntimeError("找不到測試資料，請先執行 bench/seed.py")
+    return [busy, empty]
+
+#每個請求下了幾句 SQL、幾個 round-trip
+class QueryCounter:
+    def __init__(self):
+        self.statements = 0
+        self.round_trips = 0
+        self._in_pipeline: dict[int, bool] = {}
+
+    def __call__(self, cur, query, params, seconds):
+        conn = cur.connection
+        in_pipeline = conn.pgconn.pipeline_status != pq.PipelineStatus.OFF
+        if not (in_pipeline and self._in_pipeline.get(id(conn))):
+            self.round_trips += 1
+        self._in_pipeline[id(conn)] = in_pipeline
+        self.statements += 1
+
+    def reset(self):
+        self.statements = self.round_trips = 0
+        self._in_pipeline.clear()
+
+async def count_pages(targets: list[tuple[str, str]]) -> list[tuple[str, str, int, int]]:
+    import auth
+    import main
+    from metrics import QUERY_LISTENERS
+
+    counter = QueryCounter()
+    results = []
+    QUERY_LISTENERS.append(counter)
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        for username, url in targets:
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+                r = await client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+                if r.status_code != 302:
+                    raise RuntimeError(f"登入失敗：{username} ({r.status_code})")
+                auth.clear_user_cache()     #算上 current_user 查 DB 的那一次(最壞情況)
+                counter.reset()
+                r = await client.get(url)
+                if r.status_code != 200:
+                    raise RuntimeError(f"GET {url} → {r.status_code}")
+                results.append((username, url, counter.statements, counter.round_trips))
+    finally:
+        QUERY_LISTENERS.remove(counter)
+    return results
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="檢查案件詳情頁的 SQL 次數與 round-trip")
+    parser.add_argument("--budget", type=int, default=ROUND_TRIP_BUDGET, help="round-trip 上限")
+    args = parser.parse_args(argv)
+
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        (busy_id, busy_client, busy_contractor), (empty_id, empty_client, _) = pick_projects(conn)
+    targets = [(busy_client, f"/projects/{busy_id}"), (busy_contractor, f"/projects/{busy_id}"),
+               (empty_client, f"/projects/{empty_id}")]
+    results = asyncio.run(count_pages(targets))
+
+    problems = []
+    for username, url, statements, round_trips in results:
+        print(f"{username:>20}  GET {url}：{statements} 句 SQL，{round_trips} 個 round-trip")
+        if round_trips > args.budget:
+            problems.append(f"{username} GET {url}：{round_trips} 個 round-trip > {args.budget}")
+    if len({statements for _, _, statements, _ in results}) > 1:
+        problems.append("資料多的案件下了比較多句 SQL(可能是 N+1)")
+    for p in problems:
+        print(f"FAIL  {p}")
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
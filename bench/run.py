@@ -0,0 +1,206 @@
+# bench/run.py
+# 對正在執行的網站(uvicorn)跑壓力測試，輸出每個情境的吞吐量與 p50/p95/p99 延遲
+#   1. python bench/seed.py --reset                 先灌假資料
+#   2. RATE_LIMIT=0 uvicorn main:app --workers 4    另開一個終端機啟動網站(關掉流量限制，不然提案/上傳會收到 429)
+#   3. python bench/run.py --duration 30 --concurrency 20 --json before.json
+#   4. 改完程式後再跑一次：python bench/run.py --json after.json --compare before.json
+# 情境：browse(逛案件，含翻頁)、search(全文搜尋)、detail(案件詳情)、propose(上傳 PDF 提案)、
+#       upload(上傳結案檔案)、download(下載結案檔案)
+# propose / upload 會真的寫入資料，跑完建議重新 seed
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import httpx
+import psycopg
+
+from db import DATABASE_URL
+from seed import BENCH_PASSWORD, DOMAINS, TASKS
+
+SCENARIOS = ("browse", "search", "detail", "propose", "upload", "download")
+_NEXT_RE = re.compile(r'href="([^"]*after=[^"]*)"')
+PROPOSAL_PDF = b"%PDF-1.4\n" + b"0" * 200_000 + b"\n%%EOF\n"
+CLOSURE_ZIP = b"PK\x03\x04" + b"1" * 1_000_000
+
+#從 DB 挑出各情境要用的目標(哪個案件、用哪個帳號登入)
+def load_targets(limit: int = 2000) -> dict:
+    with psycopg.connect(DATABASE_URL) as conn:
+        conn.execute("SELECT setseed(0.5);")    #每次挑到一樣的目標，前後結果才能比較
+        def rows(sql):
+            return conn.execute(sql, (limit,)).fetchall()
+        return {
+            "contractors": [r[0] for r in rows("SELECT username FROM users WHERE role='contractor' ORDER BY random() LIMIT %s;")],
+            "projects": [r[0] for r in rows("SELECT id FROM projects ORDER BY random() LIMIT %s;")],
+            "open_projects": [r[0] for r in rows("""
+                SELECT id FROM projects WHERE status='open' AND (bid_deadline IS NULL OR bid_deadline > NOW() + interval '1 day')
+                ORDER BY random() LIMIT %s;""")],
+            #(案件, 接案人帳號)
+            "in_progress": rows("""
+                SELECT p.id, u.username FROM projects p JOIN users u ON u.id = p.contractor_id
+                WHERE p.status='in_progress' ORDER BY random() LIMIT %s;"""),
+            #(結案檔案, 委託人帳號)
+            "closure_files": rows("""
+                SELECT cf.id, u.username FROM closure_files cf
+                JOIN projects p ON p.id = cf.project_id JOIN users u ON u.id = p.client_id
+                ORDER BY random() LIMIT %s;"""),
+        }
+
+async def login(client: httpx.AsyncClient, username: str):
+    r = await client.post("/login", data={"username": username, "password": BENCH_PASSWORD})
+    if r.status_code != 302:
+        raise RuntimeError(f"登入失敗：{username} ({r.status_code})")
+
+# ---------------- 各情境：每次呼叫送出一個請求 ----------------
+#每個虛擬使用者(worker)先用 setup 登入，之後重複呼叫 step 直到時間到
+class Scenario:
+    def __init__(self, targets: dict, rng: random.Random):
+        self.targets = targets
+        self.rng = rng
+
+    async def setup(self, client):
+        await login(client, self.rng.choice(self.targets["contractors"]))
+
+class Browse(Scenario):
+    def __init__(self, targets, rng):
+        super().__init__(targets, rng)
+        self.next_url = None
+        self.depth = 0
+
+    async def step(self, client):
+        r = await client.get(self.next_url or "/browse")
+        m = _NEXT_RE.search(r.text)
+        #最多往下翻 5 頁，再從第一頁開始
+        self.depth = 0 if self.next_url is None else self.depth + 1
+        self.next_url = m.group(1).replace("&amp;", "&") if m and self.depth < 5 else None
+        return r
+
+class Search(Scenario):
+    async def step(self, client):
+        q = self.rng.choice([self.rng.choice(DOMAINS), self.rng.choice(TASKS),
+                             f"{self.rng.choice(DOMAINS)} {self.rng.choice(TASKS)}"])
+        return await client.get("/browse", params={"q": q})
+
+class Detail(Scenario):
+    async def step(self, client):
+        return await client.get(f"/projects/{self.rng.choice(self.targets['projects'])}")
+
+class Propose(Scenario):
+    async def step(self, client):
+        pid = self.rng.choice(self.targets["open_projects"])
+        return await client.post(f"/projects/{pid}/propose",
+                                 data={"message": "壓力測試提案", "price": str(self.rng.randint(5, 300) * 1000)},
+                                 files={"proposal_file": ("proposal.pdf", PROPOSAL_PDF, "application/pdf")})
+
+class Upload(Scenario):
+    async def setup(self, client):
+        self.project_id, username = self.rng.choice(self.targets["in_progress"])
+        await login(client, username)
+
+    async def step(self, client):
+        return await client.post(f"/projects/{self.project_id}/upload",
+                                 files={"file": ("closure.zip", CLOSURE_ZIP, "application/zip")})
+
+class Download(Scenario):
+    async def setup(self, client):
+        self.file_id, username = self.rng.choice(self.targets["closure_files"])
+        await login(client, username)
+
+    async def step(self, client):
+        return await client.get(f"/files/{self.file_id}")
+
+SCENARIO_CLASSES = {"browse": Browse, "search": Search, "detail": Detail,
+                    "propose": Propose, "upload": Upload, "download": Download}
+
+# ---------------- 執行與統計 ----------------
+def percentile(sorted_values: list[float], p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, math.ceil(p / 100 * len(sorted_values)) - 1)    #nearest-rank
+    return sorted_values[k]
+
+async def run_scenario(name: str, base_url: str, targets: dict, concurrency: int,
+                       duration: float, seed: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(i: int):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + i)
+        scenario = SCENARIO_CLASSES[name](targets, rng)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+            await scenario.setup(client)
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    r = await scenario.step(client)
+                    ok = r.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": (latencies[-1] if latencies else 0.0) * 1000,
+    }
+
+def print_report(results: dict, baseline: dict | None = None):
+    #表頭用英文，中文字寬度不一會對不齊
+    header = f"{'scenario':<10}{'requests':>9}{'errors':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}"
+    if baseline:
+        header += f"{'p95 diff':>10}"
+    print(header)
+    for name, r in results.items():
+        line = (f"{name:<10}{r['requests']:>9}{r['errors']:>7}{r['rps']:>9.1f}"
+                f"{r['p50_ms']:>9.1f}{r['p95_ms']:>9.1f}{r['p99_ms']:>9.1f}{r['max_ms']:>9.1f}")
+        old = (baseline or {}).get(name)
+        if old and old["p95_ms"]:
+            line += f"{(r['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100:>+9.1f}%"
+        print(line)
+
+async def main_async(args) -> dict:
+    targets = load_targets()
+    results = {}
+    for name in args.scenarios:
+        print(f"執行 {name}：{args.concurrency} 個並行使用者，{args.duration} 秒 ...", flush=True)
+        results[name] = await run_scenario(name, args.base_url, targets, args.concurrency, args.duration, args.seed)
+    return results
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="對執行中的網站跑壓力測試")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20, help="並行的虛擬使用者數")
+    parser.add_argument("--duration", type=float, default=20, help="每個情境跑幾秒")
+    parser.add_argument("--seed", type=int, default=1, help="亂數種子(每次挑一樣的目標)")
+    parser.add_argument("--json", help="把結果存成 JSON，之後可以用 --compare 比較")
+    parser.add_argument("--compare", help="和之前存下的 JSON 結果比較")
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    baseline = json.loads(Path(args.compare).read_text(encoding="utf-8")) if args.compare else None
+    print_report(results, baseline)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,215 @@
+# bench/seed.py
+# 壓力測試用的假資料：用 COPY 一次灌入大量使用者、案件、提案、結案檔案、評價、Issue 與留言(中文內容)
+#   python bench/seed.py --reset                     預設規模(20 萬使用者、30 萬案件、100 萬提案)
+#   python bench/seed.py --reset --scale 0.01        小規模，先確認流程
+# 會清空現有資料！只能對本機的測試資料庫執行
+# 所有使用者的密碼都是 BENCH_PASSWORD；帳號是 client000001、contractor000001 ...
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from hashlib import sha256
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import psycopg
+from passlib.hash import pbkdf2_sha256
+
+from db import DATABASE_URL
+from ratings import REBUILD_SUMMARY_SQL
+from reputation import REBUILD_REPUTATION_SQL
+from scheduler import RATING_DEADLINE_DAYS
+from storage import put_blob, TMP_DIR
+
+BENCH_PASSWORD = "bench1234"
+SEED = 20240601
+
+#產生中文標題/描述用的詞庫
+DOMAINS = ["電商", "餐廳", "診所", "補習班", "旅行社", "咖啡店", "健身房", "書店", "物流", "房仲",
+           "民宿", "花店", "寵物店", "設計工作室", "律師事務所", "會計師事務所", "農場", "烘焙坊"]
+TASKS = ["網站前端開發", "後端 API 開發", "手機 App 開發", "資料庫設計", "LINE 聊天機器人", "官網改版",
+         "會員系統", "金流串接", "後台管理系統", "預約系統", "庫存管理系統", "數據分析報表",
+         "SEO 優化", "UI/UX 設計", "爬蟲程式", "Python 自動化腳本", "React 前端", "FastAPI 後端"]
+SENTENCES = ["需要支援手機與平板瀏覽", "希望兩個月內上線", "已有設計稿，需要切版", "需串接綠界或藍新金流",
+             "資料需要每日自動備份", "後台要能匯出 Excel 報表", "需要多語系（中文、英文、日文）",
+             "請附上過去的作品集", "預算可以再討論", "需要提供一年保固與維護",
+             "使用者登入要支援 Google 與 LINE", "請說明預計的開發時程與里程碑",
+             "希望使用 PostgreSQL 資料庫", "需要整合現有的 ERP 系統", "畫面風格簡潔、以白色為主"]
+MESSAGES = ["您好，我有相關經驗，可以在期限內完成", "曾做過類似的系統，附上提案書請參考",
+            "可以先開會討論需求細節", "價格含一個月的免費維護", "可配合分階段驗收"]
+COMMENTS = ["已修正，請再確認", "這個部分還是有問題", "了解，我今天處理", "畫面在手機上跑版了",
+            "請提供測試帳號", "已重新上傳新版本", "沒問題了，謝謝"]
+
+def title(rng):
+    return f"{rng.choice(DOMAINS)}{rng.choice(TASKS)}"
+
+def description(rng):
+    return "。".join(rng.sample(SENTENCES, rng.randint(2, 5))) + "。"
+
+def _sample_blob(content: bytes) -> tuple[str, int, str]:
+    digest = sha256(content).hexdigest()
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=TMP_DIR, delete=False) as f:
+        f.write(content)
+    path = put_blob(Path(f.name), digest)
+    return digest, len(content), str(path)
+
+def _copy(cur, table: str, columns: tuple, rows):
+    n = 0
+    with cur.copy(f"COPY {table} ({', '.join(columns)}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            n += 1
+    print(f"  {table}: {n} 筆")
+    return n
+
+def seed(conn, scale: float = 1.0, seed: int = SEED):
+    rng = random.Random(seed)
+    n_clients = max(10, int(80_000 * scale))
+    n_contractors = max(10, int(120_000 * scale))
+    n_projects = max(20, int(300_000 * scale))
+    n_proposals = max(50, int(1_000_000 * scale))
+    now = datetime.now().replace(microsecond=0)
+    start = now - timedelta(days=730)
+
+    def past():
+        return start + timedelta(seconds=rng.randint(0, 730 * 86400))
+
+    password_hash = pbkdf2_sha256.hash(BENCH_PASSWORD)  #全部共用同一個雜湊，不然光算雜湊就要好幾個小時
+    pdf_sha, pdf_size, pdf_path = _sample_blob(b"%PDF-1.4\n" + b"0" * 200_000 + b"\n%%EOF\n")
+    zip_sha, zip_size, zip_path = _sample_blob(b"PK\x03\x04" + rng.randbytes(1_000_000))
+
+    client_ids = range(1, n_clients + 1)
+    contractor_ids = range(n_clients + 1, n_clients + n_contractors + 1)
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            TRUNCATE users, projects, proposals, closure_files, ratings, issues, issue_comments, rating_summary,
+                     contractor_reputation
+            RESTART IDENTITY CASCADE;
+        """)
+        t0 = time.perf_counter()
+        _copy(cur, "users", ("id", "username", "password_hash", "role", "created_at"), (
+            *((i, f"client{i:06d}", password_hash, "client", past()) for i in client_ids),
+            *((i, f"contractor{i - n_clients:06d}", password_hash, "contractor", past()) for i in contractor_ids),
+        ))
+
+        #案件狀態分布：40% open(其中 1/10 已過投標截止 → bid_closed)、20% in_progress、10% submitted、5% reject、25% closed
+        statuses = ["open"] * 8 + ["in_progress"] * 4 + ["submitted"] * 2 + ["reject"] + ["closed"] * 5
+        projects = []
+        for pid in range(1, n_projects + 1):
+            status = rng.choice(statuses)
+            created = past()
+            closed_at = None
+            if status == "open":
+                r = rng.random()
+                deadline = None if r < 0.1 else (now - timedelta(days=rng.randint(1, 30)) if r < 0.2
+                                                 else now + timedelta(days=rng.randint(1, 60)))
+                if deadline and deadline < now:
+                    status = "bid_closed"
+                contractor = None
+            else:
+                deadline = created + timedelta(days=rng.randint(7, 30))
+                contractor = rng.choice(contractor_ids)
+                if status == "closed":
+                    closed_at = min(deadline + timedelta(days=2), now)
+            rating_open = closed_at is not None and closed_at > now - timedelta(days=RATING_DEADLINE_DAYS)
+            #被退回過幾次：reject 狀態至少一次，已交件/結案的有三成被退回過
+            rejects = 0
+            if status == "reject" or (status in ("submitted", "closed") and rng.random() < 0.3):
+                rejects = rng.randint(1, 3)
+            projects.append((pid, title(rng), description(rng), status, rng.choice(client_ids),
+                             contractor, deadline, created, created, closed_at, rating_open, rejects))
+        _copy(cur, "projects", ("id", "title", "description", "status", "client_id", "contractor_id",
+                                "bid_deadline", "created_at", "updated_at", "closed_at", "rating_open", "reject_count"), projects)
+
+        def proposals():
+            for i in range(1, n_proposals + 1):
+                p = projects[rng.randrange(n_projects)]
+                contractor = p[5] if p[5] and rng.random() < 0.2 else rng.choice(contractor_ids)
+                yield (i, p[0], contractor, rng.choice(MESSAGES), rng.randint(5, 300) * 1000,
+                       "proposal.pdf", pdf_path, pdf_sha, pdf_size, contractor == p[5], p[7] + timedelta(hours=rng.randint(1, 72)))
+        _copy(cur, "proposals", ("id", "project_id", "contractor_id", "message", "price",
+                                 "proposal_filename", "proposal_filepath", "proposal_sha256", "proposal_size",
+                                 "accepted", "created_at"), proposals())
+
+        delivered = [p for p in projects if p[3] in ("submitted", "reject", "closed")]
+        def closures():
+            i = 0
+            for p in delivered:
+                for v in range(1, rng.randint(1, 3) + 1):
+                    i += 1
+                    yield (i, p[0], p[5], v, f"v{v}.zip", zip_path, zip_sha, zip_size, p[6] + timedelta(days=v))
+        _copy(cur, "closure_files", ("id", "project_id", "contractor_id", "version", "filename", "filepath",
+                                     "sha256", "size", "created_at"), closures())
+        cur.execute("""
+            UPDATE projects p SET closure_version = c.v
+            FROM (SELECT project_id, MAX(version) AS v FROM closure_files GROUP BY project_id) c
+            WHERE p.id = c.project_id;
+        """)
+
+        def ratings():
+            i = 0
+            for p in delivered:
+                if p[3] != "closed":
+                    continue
+                when = p[6] + timedelta(days=rng.randint(3, 14))
+                for target, target_role, rater, rater_role in ((p[5], "contractor", p[4], "client"),
+                                                              (p[4], "client", p[5], "contractor")):
+                    if rng.random() < 0.8:
+                        i += 1
+                        yield (i, p[0], target, target_role, rater, rater_role,
+                               rng.randint(1, 5), rng.randint(2, 5), rng.randint(3, 5),
+                               rng.choice(COMMENTS) if rng.random() < 0.6 else None, when)
+        _copy(cur, "ratings", ("id", "project_id", "target_id", "target_role", "rater_id", "rater_role",
+                               "score_1", "score_2", "score_3", "comment", "created_at"), ratings())
+
+        issue_rows = []
+        for p in delivered:
+            if p[3] in ("reject", "submitted") or rng.random() < 0.2:
+                for _ in range(rng.randint(1, 2)):
+                    resolved = p[3] == "closed" or rng.random() < 0.5
+                    when = p[6] + timedelta(days=rng.randint(1, 10))
+                    issue_rows.append((len(issue_rows) + 1, p[0], p[4], rng.choice(TASKS) + "問題",
+                                       rng.choice(SENTENCES), "resolved" if resolved else "open", when,
+                                       when + timedelta(days=2) if resolved else None, p[4], p[5]))
+        _copy(cur, "issues", ("id", "project_id", "opener_id", "title", "description", "status",
+                              "created_at", "resolved_at"), (r[:8] for r in issue_rows))
+
+        def comments():
+            i = 0
+            for issue in issue_rows:
+                for k in range(rng.randint(0, 4)):
+                    i += 1
+                    yield (i, issue[0], issue[8] if k % 2 else issue[9], rng.choice(COMMENTS),
+                           issue[6] + timedelta(hours=k + 1))
+        _copy(cur, "issue_comments", ("id", "issue_id", "author_id", "content", "created_at"), comments())
+
+        cur.execute(REBUILD_SUMMARY_SQL)
+        cur.execute(REBUILD_REPUTATION_SQL)
+        #COPY 時指定了 id，要把序號調到最大值之後
+        for table in ("users", "projects", "proposals", "closure_files", "ratings", "issues", "issue_comments"):
+            cur.execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 1)) FROM {table};")
+        print(f"匯入完成，花費 {time.perf_counter() - t0:.1f} 秒")
+    conn.commit()
+    conn.autocommit = True
+    conn.execute("VACUUM ANALYZE;")  #更新統計資訊，讓查詢計畫和正式環境一致
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="匯入壓力測試用的假資料")
+    parser.add_argument("--reset", action="store_true", help="確認要清空現有資料")
+    parser.add_argument("--scale", type=float, default=1.0, help="資料量倍率(1 = 30 萬案件)")
+    parser.add_argument("--seed", type=int, default=SEED, help="亂數種子(相同種子產生相同資料)")
+    args = parser.parse_args(argv)
+    if not args.reset:
+        print("這會清空資料庫所有資料，確認的話請加上 --reset")
+        return 2
+    with psycopg.connect(DATABASE_URL) as conn:
+        seed(conn, args.scale, args.seed)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
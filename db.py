@@ -1,30 +1,207 @@
 from psycopg_pool import AsyncConnectionPool #使用connection pool
 from psycopg.rows import dict_row
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from psycopg_pool import PoolTimeout, TooManyRequests
+import asyncio
+import itertools
+import math
+import os
+import time
+
+from metrics import MetricsCursor, record_pool_wait
 # db.py
+load_dotenv()
 defaultDB="job_platform_final"
 dbUser="postgres"
 dbPassword="931212"
 dbHost="localhost"
 dbPort=5432
 
-DATABASE_URL = f"postgresql://{dbUser}:{dbPassword}@{dbHost}:{dbPort}/{defaultDB}"
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{dbUser}:{dbPassword}@{dbHost}:{dbPort}/{defaultDB}"
+#唯讀副本(read replica)，多台用逗號隔開；沒設定時讀取也走主資料庫
+DATABASE_READ_URLS = [u.strip() for u in os.getenv("DATABASE_READ_URLS", "").split(",") if u.strip()]
+READ_PIN_SECONDS = float(os.getenv("DB_READ_PIN_SECONDS", "5"))    #送出表單後幾秒內讀取都走主資料庫(副本可能還沒同步)
+
+#connection pool 設定(都可以用環境變數調整)
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "4"))             #啟動時先連好、平常至少保留幾條連線
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "4"))             #最多幾條連線(預設和原本一樣固定 4 條；每個 worker 各自一個 pool)
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))            #等不到連線幾秒後放棄
+POOL_MAX_WAITING = int(os.getenv("DB_POOL_MAX_WAITING", "0"))       #最多幾個請求排隊等連線(0 = 不限)
+POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))         #閒置幾秒後關掉多出 min_size 的連線
+POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", "3600"))  #連線用多久後換新的
+POOL_CHECK = os.getenv("DB_POOL_CHECK", "1") != "0"                 #借出連線前先確認還活著(DB 重啟後不會拿到斷掉的連線)
+#負載保護：最近等連線的時間超過幾秒，而且還有請求在排隊時，新的請求直接回 503 + Retry-After，不再排進去(0 = 不擋)
+POOL_SHED_WAIT = float(os.getenv("DB_POOL_SHED_WAIT", "1"))
+POOL_SHED_HALF_LIFE = 2.0   #等待時間的移動平均每幾秒衰減一半(擋下請求的期間沒有新的樣本，要靠時間慢慢降回來)
 
 _pool: AsyncConnectionPool | None = None
+_read_pools: list[AsyncConnectionPool] = []
+_read_turn = itertools.count()  #輪流使用各個副本
+_pool_lock = asyncio.Lock()
+
+#每個 pool 等連線的狀況：最近等待時間的移動平均、目前有幾個請求在排隊、擋下了幾次
+class _WaitTracker:
+    __slots__ = ("avg", "at", "waiting", "shed")
+
+    def __init__(self):
+        self.avg = 0.0
+        self.at = time.monotonic()
+        self.waiting = 0
+        self.shed = 0
+
+    def current(self) -> float:
+        return self.avg * 0.5 ** ((time.monotonic() - self.at) / POOL_SHED_HALF_LIFE)
+
+    def observe(self, seconds: float):
+        self.avg = self.current() * 0.8 + seconds * 0.2
+        self.at = time.monotonic()
 
-async def getDB():
+    def overloaded(self) -> bool:
+        return POOL_SHED_WAIT > 0 and self.waiting > 0 and self.current() > POOL_SHED_WAIT
+
+_waits: dict[str, _WaitTracker] = {}
+
+def _make_pool(conninfo: str, name: str) -> AsyncConnectionPool:
+    return AsyncConnectionPool(
+        conninfo=conninfo,
+        kwargs={"row_factory": dict_row, "cursor_factory": MetricsCursor},   #MetricsCursor：記錄每句 SQL 的次數與時間
+        min_size=POOL_MIN_SIZE,
+        max_size=max(POOL_MAX_SIZE, POOL_MIN_SIZE),
+        timeout=POOL_TIMEOUT,
+        max_waiting=POOL_MAX_WAITING,
+        max_idle=POOL_MAX_IDLE,
+        max_lifetime=POOL_MAX_LIFETIME,
+        check=AsyncConnectionPool.check_connection if POOL_CHECK else None,
+        name=name,
+        open=False
+    )
+
+#建立 pool(主資料庫與各個副本各一個)並等 min_size 條連線都連好(預熱)，第一批請求就不用等建立連線
+async def open_pool() -> AsyncConnectionPool:
     global _pool
-    if _pool is None:
-        _pool = AsyncConnectionPool(
-            conninfo=DATABASE_URL,
-            kwargs={"row_factory": dict_row},
-            open=False
-        )
-        await _pool.open()
-    async with _pool.connection() as conn:
+    async with _pool_lock:
+        if _pool is None:
+            pools = [_make_pool(DATABASE_URL, "main")]
+            pools += [_make_pool(url, f"read{i + 1}") for i, url in enumerate(DATABASE_READ_URLS)]
+            for pool in pools:
+                await pool.open(wait=True, timeout=POOL_TIMEOUT)
+            _pool = pools[0]
+            _read_pools[:] = pools[1:]
+    return _pool
+
+def _overloaded(wait: float) -> HTTPException:
+    return HTTPException(503, "系統忙碌中，請稍後再試", headers={"Retry-After": str(max(1, math.ceil(wait)))})
+
+@asynccontextmanager
+async def _borrow(pool: AsyncConnectionPool):
+    tracker = _waits.setdefault(pool.name, _WaitTracker())
+    if tracker.overloaded():    #前面的人已經等很久了，與其排到逾時不如馬上請使用者稍後再試
+        tracker.shed += 1
+        raise _overloaded(tracker.current())
+    start = time.perf_counter()
+    tracker.waiting += 1
+    waiting = True
+    try:
+        async with pool.connection() as conn:
+            tracker.waiting -= 1
+            waiting = False
+            waited = time.perf_counter() - start
+            record_pool_wait(waited)    #等 pool 借出連線花了多久
+            tracker.observe(waited)
+            yield conn
+    except (PoolTimeout, TooManyRequests) as e:
+        if not waiting:
+            raise
+        tracker.shed += 1   #等到逾時或排隊人數已滿(DB_POOL_MAX_WAITING)
+        tracker.observe(time.perf_counter() - start)
+        raise _overloaded(tracker.current()) from e
+    finally:
+        if waiting:
+            tracker.waiting -= 1
+
+#讀寫用：一律走主資料庫；送出表單(POST 等)時記錄在 session，接下來幾秒的讀取也走主資料庫，才看得到剛寫入的資料
+async def getDB(request: Request):
+    pool = _pool or await open_pool()  #正常由 lifespan 開好；沒有經過 lifespan(例如腳本)時才在這裡建立
+    if DATABASE_READ_URLS and request.method not in ("GET", "HEAD"):
+        request.session["db_pin_until"] = time.time() + READ_PIN_SECONDS
+    async with _borrow(pool) as conn:
         yield conn
 
+#只讀用(瀏覽、詳情、首頁、評價頁)：輪流走各個副本；沒有副本或剛寫入過資料時走主資料庫
+async def getReadDB(request: Request):
+    pool = _pool or await open_pool()
+    if _read_pools and request.session.get("db_pin_until", 0) < time.time():
+        pool = _read_pools[next(_read_turn) % len(_read_pools)]
+    async with _borrow(pool) as conn:
+        yield conn
+
+#在 handler 裡短暫借一條連線，用完馬上還(例如 SSE 這種會一直開著的回應，不能用 Depends(getDB) 佔住連線)
+#和 getDB 一樣會做負載保護(忙碌時回 503)；背景工作用 shed=False，照常排隊等連線
+@asynccontextmanager
+async def db_connection(shed: bool = True):
+    pool = _pool or await open_pool()
+    if shed:
+        async with _borrow(pool) as conn:
+            yield conn
+    else:
+        async with pool.connection() as conn:
+            yield conn
+
 async def close_pool():
     global _pool
+    for pool in _read_pools:
+        await pool.close()
+    _read_pools.clear()
     if _pool is not None:
         await _pool.close()
-        _pool = None
\ No newline at end of file
+        _pool = None
+
+#主資料庫 pool 目前的狀態：使用中、閒置、排隊中的請求，以及累計的等待逾時次數
+def pool_stats() -> dict:
+    if _pool is None:
+        return {"open": False}
+    return _pool_stats(_pool)
+
+#所有副本 pool 的狀態加總
+def read_pool_stats() -> dict:
+    if not _read_pools:
+        return {"open": False}
+    total = {}
+    for stats in map(_pool_stats, _read_pools):
+        for key, value in stats.items():
+            if key != "open":
+                total[key] = total.get(key, 0) + value
+    return {"open": True, "replicas": len(_read_pools), **total}
+
+def _pool_stats(pool: AsyncConnectionPool) -> dict:
+    stats = pool.get_stats()
+    tracker = _waits.get(pool.name) or _WaitTracker()
+    size = stats.get("pool_size", 0)
+    available = stats.get("pool_available", 0)
+    return {
+        "open": True,
+        "min_size": stats.get("pool_min", 0),
+        "max_size": stats.get("pool_max", 0),
+        "size": size,
+        "in_use": size - available,
+        "available": available,
+        "waiting": stats.get("requests_waiting", 0),
+        "requests": stats.get("requests_num", 0),
+        "queued": stats.get("requests_queued", 0),
+        "wait_ms": stats.get("requests_wait_ms", 0),
+        "timeouts": stats.get("requests_errors", 0),
+        "connections_lost": stats.get("connections_lost", 0),
+        "recent_wait_ms": round(tracker.current() * 1000, 1),
+        "shed": tracker.shed,
+    }
+
+#FastAPI lifespan：啟動時建立並預熱 pool，關閉時釋放
+@asynccontextmanager
+async def lifespan(app):
+    await open_pool()
+    try:
+        yield
+    finally:
+        await close_pool()
@@ -0,0 +1,108 @@
+# downloads.py
+# 檔案下載的共用回應：支援
+#   * Range 續傳(206 / 416)，斷線後可以從中間接著下載
+#   * ETag / If-None-Match、Last-Modified / If-Modified-Since(沒變就回 304，不重傳)
+#   * 結案檔案每個版本內容固定，可以讓瀏覽器長期快取
+# 檔案從 storage.open_stored() 取得，本機或 S3 都一樣處理
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from starlette.responses import Response, StreamingResponse
+
+from metrics import count_bytes
+from storage import BlobStat
+IMMUTABLE_CACHE = "private, max-age=31536000, immutable"   #登入後才看得到，只能存在瀏覽器
+REVALIDATE_CACHE = "private, no-cache"                      #可以快取，但每次都要用 ETag 問一次
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def make_etag(st: BlobStat, sha256: str | None = None) -> str:
+    if sha256:
+        return f'"{sha256}"'
+    return f'"{st.size:x}-{int(st.mtime * 1_000_000):x}"'   #舊檔案沒有雜湊，用大小+修改時間
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:  #有中文等非 ASCII 字元要用 RFC 5987 格式
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return etag in tags or f"W/{etag}" in tags
+
+def _not_modified_since(header: str, mtime: float) -> bool:
+    try:
+        since = parsedate_to_datetime(header).timestamp()
+    except (TypeError, ValueError):
+        return False
+    return int(mtime) <= since
+
+#解析 Range 標頭，回傳 (start, end)；不支援或不用處理時回傳 None，範圍無效時丟 416
+def parse_range(header: str, size: int) -> tuple[int, int] | None:
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None     #多段範圍或其他單位：直接回整個檔案
+    first, last = m.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":     #bytes=-500 → 最後 500 bytes
+        length = int(last)
+        if length == 0:
+            raise HTTPException(416, headers={"Content-Range": f"bytes */{size}"})
+        start, end = max(0, size - length), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+#讀檔(或 S3 的 GET)在 threadpool 裡跑，不卡 event loop
+async def _iter_file(stored, start: int, length: int, kind: str):
+    async for chunk in iterate_in_threadpool(stored.iter_range(start, length)):
+        count_bytes("download", kind, len(chunk))
+        yield chunk
+
+#stored：storage.open_stored() 回傳的檔案(None 代表 DB 沒有記錄路徑)
+async def file_response(request: Request, stored, filename: str, media_type: str,
+                        sha256: str | None = None, immutable: bool = False, kind: str = "file") -> Response:
+    st = await run_in_threadpool(stored.stat) if stored is not None else None
+    if st is None:
+        raise HTTPException(404, "檔案已遺失")
+    etag = make_etag(st, sha256)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.mtime, usegmt=True),
+        "Cache-Control": IMMUTABLE_CACHE if immutable else REVALIDATE_CACHE,
+        "Accept-Ranges": "bytes",
+    }
+    #條件式 GET：瀏覽器手上的版本還是最新的就回 304
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if _etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif request.headers.get("if-modified-since") and _not_modified_since(request.headers["if-modified-since"], st.mtime):
+        return Response(status_code=304, headers=headers)
+
+    headers["Content-Disposition"] = content_disposition(filename)
+    size = st.size
+    byte_range = None
+    range_header = request.headers.get("range")
+    if range_header:
+        #If-Range：檔案已經變了就改回傳整個檔案
+        if_range = request.headers.get("if-range")
+        if if_range is None or if_range.strip() in (etag, headers["Last-Modified"]):
+            byte_range = parse_range(range_header, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_iter_file(stored, 0, size, kind), media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_iter_file(stored, start, end - start + 1, kind), status_code=206,
+                             media_type=media_type, headers=headers)
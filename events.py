@@ -0,0 +1,102 @@
+# events.py
+# 即時更新：案件有新提案、新版本結案檔案、新留言、狀態改變時，通知正在看頁面的人
+#   1. handler 在同一個交易裡呼叫 notify() → PostgreSQL NOTIFY(交易 commit 後才會送出，rollback 就不會送)
+#   2. 每個 worker 有一條專用連線 LISTEN，收到後分送給訂閱這個案件/使用者的 SSE 連線
+#   3. 瀏覽器用 EventSource 接收(templates/_live.html)，收到後只重新抓受影響的區塊，不用一直手動重新整理
+# 多個 worker 時每個 worker 都會收到同一則 NOTIFY，各自分送給自己的 SSE 連線
+import asyncio
+import json
+import logging
+
+import psycopg
+
+import db
+
+CHANNEL = "project_events"
+QUEUE_SIZE = 100            #每條 SSE 連線最多暫存幾則事件(瀏覽器太慢就丟掉，反正同一種事件都是重新抓同一個區塊)
+KEEPALIVE_SECONDS = 15      #沒有事件時多久送一次註解，避免 proxy 把閒置連線切斷
+RECONNECT_SECONDS = 3       #LISTEN 連線斷掉後隔多久重連
+
+logger = logging.getLogger("events")
+
+#在目前的交易裡送出通知；users 是除了看這個案件頁面的人以外，還要通知哪些使用者(他們的首頁)
+async def notify(cur, project_id: int, kind: str, users: list[int | None] = ()):
+    payload = json.dumps({"project_id": project_id, "kind": kind, "users": [u for u in users if u]})
+    await cur.execute("SELECT pg_notify(%s, %s);", (CHANNEL, payload))
+
+class EventBroker:
+    def __init__(self):
+        self._subscribers: dict[tuple, set[asyncio.Queue]] = {}
+        self._task: asyncio.Task | None = None
+
+    #訂閱 ("project", id) 或 ("user", id)；第一次有人訂閱時才開 LISTEN 連線
+    def subscribe(self, key: tuple) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._subscribers.setdefault(key, set()).add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._listen())
+        return queue
+
+    def unsubscribe(self, key: tuple, queue: asyncio.Queue):
+        queues = self._subscribers.get(key)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[key]
+
+    def publish(self, event: dict):
+        keys = [("project", event.get("project_id"))] + [("user", u) for u in event.get("users", [])]
+        for key in keys:
+            for queue in self._subscribers.get(key, ()):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    pass
+
+    async def _listen(self):
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(db.DATABASE_URL, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL};")
+                    async for n in conn.notifies():
+                        try:
+                            self.publish(json.loads(n.payload))
+                        except ValueError:
+                            continue
+            except asyncio.CancelledError:
+                raise
+            except psycopg.Error:
+                await asyncio.sleep(RECONNECT_SECONDS)   #DB 重啟等狀況，過一下再重連
+            except Exception:
+                logger.exception("即時更新的 LISTEN 連線發生錯誤")   #不能讓這個 worker 從此收不到通知
+                await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"channels": len(self._subscribers),
+                "subscribers": sum(len(q) for q in self._subscribers.values())}
+
+broker = EventBroker()
+
+#SSE 的內容：先送 retry 設定，之後每有事件就送一則，閒置時送註解保持連線
+async def event_stream(request, key: tuple):
+    queue = broker.subscribe(key)
+    try:
+        yield f"retry: {RECONNECT_SECONDS * 1000}\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: {event['kind']}\ndata: {json.dumps(event)}\n\n"
+    finally:
+        broker.unsubscribe(key, queue)
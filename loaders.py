@@ -0,0 +1,146 @@
+# loaders.py
+# 一次把頁面需要的資料全部查好：
+# 用 psycopg 的 pipeline mode 把多個查詢一起送出，只等一次 DB 回應(一個 round-trip)
+from psycopg.rows import dict_row
+
+from pagination import order_by
+from reputation import PROPOSAL_SORTS, proposals_sql
+
+#案件詳情頁的各區塊；即時更新只重新產生其中一塊時，只查那一塊需要的資料(案件本身一定會查，用來檢查權限)
+DETAIL_SECTIONS = ("proposals", "closures", "issues", "rated")
+
+#案件詳情頁(委託人/接案人共用)：案件、提案(含接案人信譽，依 proposal_sort 排序)、結案檔案、Issue、留言、是否已評價
+#sections 沒給就全部查；查不到案件回傳 None
+async def load_project_detail(conn, project_id: int, user_id: int, proposal_sort: str = "recent",
+                              sections=DETAIL_SECTIONS) -> dict | None:
+    proposals = closures = issues = comments = []
+    rated = False
+    async with conn.pipeline():
+        project_cur = conn.cursor(row_factory=dict_row)
+        proposals_cur = conn.cursor(row_factory=dict_row)
+        closures_cur = conn.cursor(row_factory=dict_row)
+        issues_cur = conn.cursor(row_factory=dict_row)
+        comments_cur = conn.cursor(row_factory=dict_row)
+        rated_cur = conn.cursor(row_factory=dict_row)
+        #該案件基本資料
+        await project_cur.execute("""
+            SELECT p.*, uc.username AS client_username, ur.username AS contractor_username
+            FROM projects p
+            JOIN users uc ON uc.id = p.client_id
+            LEFT JOIN users ur ON ur.id = p.contractor_id
+            WHERE p.id=%s;
+        """, (project_id,))
+        #該案件有誰已經提出意願(連同接案人的評價、完成案件數、退回比例)
+        if "proposals" in sections:
+            await proposals_cur.execute(f"{proposals_sql()} ORDER BY {order_by(PROPOSAL_SORTS[proposal_sort])};", (project_id,))
+        #該案的結案檔案
+        if "closures" in sections:
+            await closures_cur.execute("""
+                SELECT * FROM closure_files WHERE project_id=%s ORDER BY created_at DESC;
+            """, (project_id,))
+        if "issues" in sections:
+            #該案的 Issues
+            await issues_cur.execute("""
+                SELECT i.*, u.username AS opener_name
+                FROM issues i
+                JOIN users u ON u.id = i.opener_id
+                WHERE i.project_id=%s
+                ORDER BY i.created_at DESC;
+            """, (project_id,))
+            #該案所有 Issue 的留言(直接用 project_id 關聯，不用等 Issue 查完)
+            await comments_cur.execute("""
+                SELECT ic.*, u.username AS author_name
+                FROM issue_comments ic
+                JOIN issues i ON i.id = ic.issue_id
+                JOIN users u ON u.id = ic.author_id
+                WHERE i.project_id=%s
+                ORDER BY ic.created_at ASC;
+            """, (project_id,))
+        #目前登入者是否已經評價過對方(委託人評接案人、接案人評委託人)
+        if "rated" in sections:
+            await rated_cur.execute("""
+                SELECT EXISTS (
+                    SELECT 1 FROM ratings r
+                    JOIN projects p ON p.id = r.project_id
+                    WHERE r.project_id=%s AND r.rater_id=%s
+                      AND r.target_id = CASE WHEN p.client_id=%s THEN p.contractor_id ELSE p.client_id END
+                ) AS rated;
+            """, (project_id, user_id, user_id))
+
+        project = await project_cur.fetchone()
+        if "proposals" in sections:
+            proposals = await proposals_cur.fetchall()
+        if "closures" in sections:
+            closures = await closures_cur.fetchall()
+        if "issues" in sections:
+            issues = await issues_cur.fetchall()
+            comments = await comments_cur.fetchall()
+        if "rated" in sections:
+            rated = (await rated_cur.fetchone())["rated"]
+    if not project:
+        return None
+
+    #把留言整理成：{ issue_id: [comment, comment, ...] }
+    issue_comments_by_issue = {}
+    for c in comments:
+        issue_comments_by_issue.setdefault(c["issue_id"], []).append(c)
+
+    is_client = project["client_id"] == user_id
+    is_contractor = project["contractor_id"] is not None and project["contractor_id"] == user_id
+    return {
+        "project": project,
+        "proposals": proposals,
+        "proposal_sort": proposal_sort,
+        "closures": closures,
+        "issues": issues,
+        "issue_comments_by_issue": issue_comments_by_issue,
+        "has_rated_contractor": rated and is_client,
+        "has_rated_client": rated and is_contractor,
+    }
+
+#案件的 ZIP 匯出：案件、所有版本的結案檔案、提案書、Issue 與留言(同樣一個 round-trip)
+async def load_project_archive(conn, project_id: int) -> dict | None:
+    async with conn.pipeline():
+        project_cur = conn.cursor(row_factory=dict_row)
+        closures_cur = conn.cursor(row_factory=dict_row)
+        proposals_cur = conn.cursor(row_factory=dict_row)
+        issues_cur = conn.cursor(row_factory=dict_row)
+        comments_cur = conn.cursor(row_factory=dict_row)
+        await project_cur.execute("SELECT id, title, client_id, contractor_id FROM projects WHERE id=%s;", (project_id,))
+        await closures_cur.execute("""
+            SELECT id, version, filename, filepath, sha256, created_at
+            FROM closure_files WHERE project_id=%s ORDER BY version;
+        """, (project_id,))
+        await proposals_cur.execute("""
+            SELECT pr.id, pr.proposal_filename, pr.proposal_filepath, pr.proposal_sha256, pr.created_at,
+                   u.username AS contractor_username
+            FROM proposals pr JOIN users u ON u.id = pr.contractor_id
+            WHERE pr.project_id=%s
+            ORDER BY pr.created_at, pr.id;
+        """, (project_id,))
+        await issues_cur.execute("""
+            SELECT i.id, i.title, i.description, i.status, i.created_at, i.resolved_at, u.username AS opener_name
+            FROM issues i JOIN users u ON u.id = i.opener_id
+            WHERE i.project_id=%s
+            ORDER BY i.created_at, i.id;
+        """, (project_id,))
+        await comments_cur.execute("""
+            SELECT ic.issue_id, ic.content, ic.created_at, u.username AS author_name
+            FROM issue_comments ic
+            JOIN issues i ON i.id = ic.issue_id
+            JOIN users u ON u.id = ic.author_id
+            WHERE i.project_id=%s
+            ORDER BY ic.created_at, ic.id;
+        """, (project_id,))
+        project = await project_cur.fetchone()
+        closures = await closures_cur.fetchall()
+        proposals = await proposals_cur.fetchall()
+        issues = await issues_cur.fetchall()
+        comments = await comments_cur.fetchall()
+    if not project:
+        return None
+    comments_by_issue = {}
+    for c in comments:
+        comments_by_issue.setdefault(c["issue_id"], []).append(c)
+    return {"project": project, "closures": closures, "proposals": proposals,
+            "issues": issues, "comments_by_issue": comments_by_issue}
@@ -1,38 +1,76 @@
 # main.py
 from fastapi import FastAPI, Request, Form, UploadFile, File, Depends, HTTPException, status
-from fastapi.responses import RedirectResponse, HTMLResponse, FileResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pathlib import Path
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
-from passlib.hash import pbkdf2_sha256
 from dotenv import load_dotenv
 from psycopg.rows import dict_row
 import os
-import uuid
 from typing import Optional
 from fastapi import Query
 
-from db import getDB, close_pool
-from auth import setup_session, current_user, login_user, logout_user
+from db import getDB, getReadDB, db_connection, lifespan as db_lifespan, pool_stats, read_pool_stats
+from auth import setup_session, current_user, login_user, logout_user, user_cache_stats
+from passwords import hash_password, verify_password, password_stats
+from pagination import SortKey, BROWSE_ORDER, DEFAULT_PAGE_SIZE, fetch_page, page_urls
+from search import SEARCH_ORDER, build_tsquery, highlight
+from ratings import RATING_ROLES, RATINGS_ORDER, add_to_summary, summary_stats
+from reputation import PROPOSAL_SORTS, PROPOSAL_SORT_LABELS, record_decision
+from uploads import UploadLimitMiddleware, store_upload
+from ratelimit import RateLimitMiddleware, limiter
+from storage import UPLOAD_DIR, open_stored
+from downloads import file_response, content_disposition
+from metrics import MetricsMiddleware, render_metrics
+from sqltrace import setup_sql_trace
+from loaders import DETAIL_SECTIONS, load_project_detail, load_project_archive
+from archive import archive_entries, issues_json, stream_archive
+from events import broker, notify, event_stream
+from api import router as api_router
+from scheduler import scheduler, RATING_DEADLINE_DAYS
+from recommend import recommender
 
 templates = Jinja2Templates(directory="templates")  #設定HTML位置
-RATING_DEADLINE_DAYS = 14  #評價期限：結案後 14 天內可以評
-UPLOAD_DIR = Path("uploads")    #設定上傳的檔案要儲存的資料夾
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)   #建立資料夾
 
-app = FastAPI(title="工作委託平台")   #建立 FastAPI 應用
+#即時更新用：只產生頁面裡的一個區塊({% block live_xxx %}，見 templates/_live.html)，不用整頁重畫
+def render_fragment(name: str, block: str, context: dict, headers: dict | None = None) -> HTMLResponse:
+    template = templates.get_template(name)
+    if block not in template.blocks:
+        raise HTTPException(404, "找不到頁面區塊")
+    html = "".join(template.blocks[block](template.new_context(context)))
+    return HTMLResponse(html, headers={"Cache-Control": "no-store", **(headers or {})})
+
+#啟動時建立 DB connection pool 並開始定期處理期限、建立推薦索引，關閉時一併停掉這些背景工作與即時更新的 LISTEN 連線
+@asynccontextmanager
+async def lifespan(app):
+    async with db_lifespan(app):
+        scheduler.start()
+        recommender.start()
+        yield
+        await recommender.close()
+        await scheduler.close()
+        await broker.close()
+
+app = FastAPI(title="工作委託平台", lifespan=lifespan)   #建立 FastAPI 應用
+app.add_middleware(RateLimitMiddleware)     #送出表單的流量限制(要在 session 裡層，所以比 setup_session 先加)
 setup_session(app)  #啟用 session 機制
+app.add_middleware(UploadLimitMiddleware)   #上傳檔案過大時提早回 413
+setup_sql_trace(app)    #SQL_TRACE=1 時記錄每句 SQL、抓出 N+1 與慢查詢(開發/測試環境用)
+app.add_middleware(MetricsMiddleware)   #記錄每個路由的回應時間與 SQL 次數(放最外層，整個請求都算進去)
+app.include_router(api_router)  #JSON API(/api/v1)，給手機 App 與外部系統用
 
 # ------------ 首頁 / 註冊 / 登入 / 登出 ------------
 #顯示平台首頁
 @app.get("/", response_class=HTMLResponse)
-async def index(request: Request, conn = Depends(getDB)):
+async def index(request: Request, conn = Depends(getReadDB)):
     user = await current_user(request, conn)
     return templates.TemplateResponse("index.html", {"request": request, "user": user})
 
-#顯示註冊頁面
+#顯示註冊頁面(不用查 DB，也就不佔用連線)
 @app.get("/register", response_class=HTMLResponse)
-async def register_page(request: Request, conn = Depends(getDB)):
+async def register_page(request: Request):
     return templates.TemplateResponse("register.html", {"request": request})
 #處理註冊送出
 @app.post("/register")
@@ -47,7 +85,7 @@ async def register(request: Request,
         await cur.execute("SELECT 1 FROM users WHERE username=%s;", (username,))
         if await cur.fetchone():
             return templates.TemplateResponse("register.html", {"request": request, "error": "使用者名稱已存在"})
-        hashed = pbkdf2_sha256.hash(password)   #把密碼加密後存入
+        hashed = await hash_password(password)   #把密碼加密後存入(在背景執行緒計算，不卡住其他請求)
         await cur.execute(
             "INSERT INTO users (username, password_hash, role) VALUES (%s,%s,%s);",
             (username, hashed, role)
@@ -56,9 +94,9 @@ async def register(request: Request,
         await conn.commit()
     return RedirectResponse("/login", status_code=status.HTTP_302_FOUND)    #回傳到登入畫面
 
-#顯示登入畫面
+#顯示登入畫面(不用查 DB，也就不佔用連線)
 @app.get("/login", response_class=HTMLResponse)
-async def login_page(request: Request, conn = Depends(getDB)):
+async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 #處理登入送出
 @app.post("/login")
@@ -71,8 +109,12 @@ async def login(request: Request,
         row = await cur.fetchone()
     if not row:
         return templates.TemplateResponse("login.html", {"request": request, "error": "帳號不存在"})
-    if not pbkdf2_sha256.verify(password, row["password_hash"]):
+    ok, new_hash = await verify_password(password, row["password_hash"])
+    if not ok:
         return templates.TemplateResponse("login.html", {"request": request, "error": "帳號或密碼錯誤"})
+    if new_hash:    #雜湊參數調整過，順便換成新的雜湊
+        await conn.execute("UPDATE users SET password_hash=%s WHERE id=%s;", (new_hash, row["id"]))
+        await conn.commit()
 
     login_user(request, row["id"])  #呼叫 auth.py 裡的函式 把使用者的 ID 存進 session
     return RedirectResponse("/dashboard", status_code=status.HTTP_302_FOUND)    #跳到個人首頁的畫面
@@ -84,8 +126,22 @@ async def logout(request: Request):
     return RedirectResponse("/", status_code=status.HTTP_302_FOUND)
 
 # ---------------- 個人首頁 ----------------
+#首頁列表的排序(游標分頁用)
+CLIENT_DASHBOARD_ORDER = [SortKey("p.created_at", desc=True, kind=datetime), SortKey("p.id", desc=True, kind=int)]
+CONTRACTOR_DASHBOARD_ORDER = [
+    SortKey("COALESCE(pr.created_at, p.created_at)", desc=True, column="sort_at", kind=datetime),
+    SortKey("p.id", desc=True, kind=int),
+]
+
 @app.get("/dashboard", response_class=HTMLResponse)
-async def dashboard(request: Request, conn = Depends(getDB)):
+async def dashboard(
+    request: Request,
+    after: str | None = Query(default=None),
+    before: str | None = Query(default=None),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE),
+    fragment: str | None = Query(default=None),    #即時更新只重新產生案件列表
+    conn = Depends(getReadDB)    #只讀的頁面走唯讀副本
+    ):
     user = await current_user(request, conn)    #呼叫 auth.py 裡的函式 從 session（cookie）取出登入者資訊
     if not user:    #如果還沒登入就跳到登入畫面
         return RedirectResponse("/login")
@@ -97,31 +153,37 @@ async def dashboard(request: Request, conn = Depends(getDB)):
     #委託人
     if user["role"] == "client":    
         async with conn.cursor(row_factory=dict_row) as cur:
-            await cur.execute("""
+            page = await fetch_page(cur, """
                 SELECT p.*, ur.username AS contractor_username
                 FROM projects p
                 LEFT JOIN users ur ON ur.id = p.contractor_id
                 WHERE p.client_id=%s
-                ORDER BY p.created_at DESC;
-            """, (user["id"],))
-            projects = await cur.fetchall()
-        return templates.TemplateResponse("dashboard_client.html", {"request": request, "user": user, "projects": projects})
+            """, (user["id"],), CLIENT_DASHBOARD_ORDER, limit, after=after, before=before)
+        context = {"request": request, "user": user, "projects": page["items"], **page_urls(request, page)}
+        if fragment:
+            return render_fragment("dashboard_client.html", f"live_{fragment}", context)
+        return templates.TemplateResponse("dashboard_client.html", context)
     #接案人
     else:
         async with conn.cursor(row_factory=dict_row) as cur:
-            await cur.execute("""
-                SELECT p.*, uc.username AS client_username, pr.created_at AS accepted_at
+            page = await fetch_page(cur, """
+                SELECT p.*, uc.username AS client_username, pr.created_at AS accepted_at,
+                       COALESCE(pr.created_at, p.created_at) AS sort_at
                 FROM projects p
                 JOIN users uc ON uc.id = p.client_id
                 LEFT JOIN proposals pr ON pr.project_id = p.id AND pr.contractor_id = p.contractor_id AND pr.accepted = TRUE
                 WHERE p.contractor_id=%s
-                ORDER BY COALESCE(pr.created_at, p.created_at) DESC;
-            """, (user["id"],))
-            my_projects = await cur.fetchall()
-            await cur.execute("SELECT COUNT(*) AS c FROM projects WHERE status='open' AND (bid_deadline IS NULL OR bid_deadline >= NOW());")
+            """, (user["id"],), CONTRACTOR_DASHBOARD_ORDER, limit, after=after, before=before)
+            if fragment:    #只更新案件列表，不用再算 open 案件數與推薦
+                return render_fragment("dashboard_contractor.html", f"live_{fragment}",
+                    {"request": request, "user": user, "projects": page["items"], **page_urls(request, page)})
+            await cur.execute("SELECT COUNT(*) AS c FROM projects WHERE status='open';")   #投標截止的案件已由 scheduler.py 改成 bid_closed
             open_count = (await cur.fetchone())["c"]
+        #依接案人提過意願、承作過的案件推薦內容相似的 open 案件
+        recommended = await recommender.recommend(conn, user["id"])
         return templates.TemplateResponse("dashboard_contractor.html",
-            {"request": request, "user": user, "projects": my_projects, "open_count": open_count, "notice": notice})
+            {"request": request, "user": user, "projects": page["items"], "open_count": open_count, "notice": notice,
+             "recommended": recommended, **page_urls(request, page)})
 
 # ------------- 委託人：建立、編輯、詳情、選人、結案 -------------
 #顯示建立畫面
@@ -166,8 +228,8 @@ async def project_edit_page(request: Request, project_id: int, conn = Depends(ge
         project = await cur.fetchone()  #取出這個案件的資料
     if not project:
         raise HTTPException(404, "找不到案件")
-    #委託人只有在公開、承作時和結案被退回時可以編輯案件
-    if project["status"] not in ("open", "in_progress","reject"):
+    #委託人只有在公開(含投標已截止)、承作時和結案被退回時可以編輯案件
+    if project["status"] not in ("open", "bid_closed", "in_progress","reject"):
         raise HTTPException(400, "此狀態不可編輯")
     return templates.TemplateResponse("project_edit.html", {"request": request, "user": user, "project": project})  #跳到編輯畫面
 #接收編輯的案件內容
@@ -187,124 +249,48 @@ async def project_edit(
     async with conn.cursor() as cur:
         await cur.execute("""
             UPDATE projects
-            SET title=%s, description=%s, bid_deadline=%s, updated_at=NOW()
+            SET title=%s, description=%s, bid_deadline=%s, updated_at=NOW(),
+                status = CASE WHEN status NOT IN ('open', 'bid_closed') THEN status
+                              WHEN %s::timestamp < NOW() THEN 'bid_closed' ELSE 'open' END
             WHERE id=%s AND client_id=%s;
-        """, (title, description, deadline_dt, project_id, user["id"]))
+        """, (title, description, deadline_dt, deadline_dt, project_id, user["id"]))   #延後截止日會重新開放投標
         await conn.commit()
     return RedirectResponse(f"/projects/{project_id}", status_code=status.HTTP_302_FOUND)
 
 #查看案件詳情(委託人 & 接案人)
 @app.get("/projects/{project_id}", response_class=HTMLResponse)
-async def project_detail(request: Request, project_id: int, conn = Depends(getDB)):
+async def project_detail(request: Request, project_id: int,
+                         sort: str = Query(default="recent", description="提案排序：recent / price / reputation / combined"),
+                         fragment: str | None = Query(default=None, description="即時更新只重新產生的區塊：proposals / closures / issues"),
+                         conn = Depends(getReadDB)):
     user = await current_user(request, conn)
     if not user:
         return RedirectResponse("/login")
     notice = request.query_params.get("notice")
-    async with conn.cursor(row_factory=dict_row) as cur:
-        #查詢該案件基本資料
-        await cur.execute("""
-            SELECT p.*, uc.username AS client_username, ur.username AS contractor_username
-            FROM projects p
-            JOIN users uc ON uc.id = p.client_id
-            LEFT JOIN users ur ON ur.id = p.contractor_id
-            WHERE p.id=%s;
-        """, (project_id,))
-        project = await cur.fetchone()
-        if not project:
-            raise HTTPException(404, "找不到案件")
-        #查詢該案件有誰已經提出意願
-        await cur.execute("""
-            SELECT pr.*, u.username AS contractor_username
-            FROM proposals pr JOIN users u ON u.id = pr.contractor_id
-            WHERE pr.project_id=%s
-            ORDER BY pr.created_at DESC;
-        """, (project_id,))
-        proposals = await cur.fetchall()
-        #查詢該案的結案檔案
-        await cur.execute("""
-            SELECT * FROM closure_files WHERE project_id=%s ORDER BY created_at DESC;
-        """, (project_id,))
-        closures = await cur.fetchall()
-        #新增:查詢該案的Issues & 留言
-        await cur.execute("""
-            SELECT i.*, u.username AS opener_name
-            FROM issues i
-            JOIN users u ON u.id = i.opener_id
-            WHERE i.project_id=%s
-            ORDER BY i.created_at DESC;
-        """, (project_id,))
-        issues = await cur.fetchall()
-
-        #把留言整理成：{ issue_id: [comment, comment, ...] }
-        issue_comments_by_issue = {}
-
-        if issues:
-            issue_ids = [i["id"] for i in issues]  # 取出所有 issue id
-            await cur.execute("""
-                SELECT ic.*, u.username AS author_name
-                FROM issue_comments ic
-                JOIN users u ON u.id = ic.author_id
-                WHERE ic.issue_id = ANY(%s)
-                ORDER BY ic.created_at ASC;
-            """, (issue_ids,))
-            comments = await cur.fetchall()
-
-            for c in comments:
-                issue_comments_by_issue.setdefault(c["issue_id"], []).append(c)
-
-        #查詢「目前登入者是否已經評價過對方」
-        has_rated_contractor = False
-        has_rated_client = False
-        if project["contractor_id"]:
-            if user["role"] == "client" and project["client_id"] == user["id"]:
-                #找委託人有沒有評過這個接案人
-                await cur.execute(
-                    """
-                    SELECT 1 FROM ratings
-                    WHERE project_id=%s AND rater_id=%s AND target_id=%s;
-                    """,
-                    (project_id, user["id"], project["contractor_id"])
-                )
-                has_rated_contractor = bool(await cur.fetchone())   #有資料 → True(評過) / 沒資料 → False（沒評過）
-            elif user["role"] == "contractor" and project["contractor_id"] == user["id"]:
-                #找接案人有沒有評過這個委託人
-                await cur.execute(
-                    """
-                    SELECT 1 FROM ratings
-                    WHERE project_id=%s AND rater_id=%s AND target_id=%s;
-                    """,
-                    (project_id, user["id"], project["client_id"])
-                )
-                has_rated_client = bool(await cur.fetchone())
+    if sort not in PROPOSAL_SORTS:
+        sort = "recent"
+    if fragment is not None and fragment not in DETAIL_SECTIONS:
+        raise HTTPException(404, "找不到頁面區塊")
+    #案件、提案、結案檔案、Issue、留言、評價狀態一次查完(一個 round-trip)；只要一個區塊時只查那一塊
+    detail = await load_project_detail(conn, project_id, user["id"], proposal_sort=sort,
+                                       sections=(fragment,) if fragment else DETAIL_SECTIONS)
+    if not detail:
+        raise HTTPException(404, "找不到案件")
+    project = detail["project"]
 
     #根據身分決定要跳到哪個畫面
     if user["role"] == "client" and project["client_id"] == user["id"]:
-        return templates.TemplateResponse("project_detail_client.html",
-            {
-                "request": request,
-                "user": user,
-                "project": project,
-                "proposals": proposals,
-                "closures": closures,
-                "issues": issues,  
-                "issue_comments_by_issue": issue_comments_by_issue,  
-                "has_rated_contractor": has_rated_contractor,
-                "notice": notice,
-            })
+        name = "project_detail_client.html"
+        context = {"request": request, "user": user, "notice": notice, "proposal_sorts": PROPOSAL_SORT_LABELS, **detail}
     elif user["role"] == "contractor":
-        return templates.TemplateResponse("project_detail_contractor.html",
-            {
-                "request": request,
-                "user": user,
-                "project": project,
-                "proposals": proposals,
-                "closures": closures,
-                "issues": issues,  
-                "issue_comments_by_issue": issue_comments_by_issue,  
-                "has_rated_client": has_rated_client,    
-            })
+        name = "project_detail_contractor.html"
+        context = {"request": request, "user": user, **detail}
     else:
         raise HTTPException(403, "無權限")
+    if fragment:
+        #附上案件狀態：狀態變了代表整頁版面不同，瀏覽器改成提示重新整理
+        return render_fragment(name, f"live_{fragment}", context, headers={"X-Project-Status": project["status"]})
+    return templates.TemplateResponse(name, context)
         
 #委託人要能下載「接案人提案書 PDF」
 @app.get("/proposals/{proposal_id}/file")
@@ -314,7 +300,7 @@ async def download_proposal_file(proposal_id: int, request: Request, conn=Depend
         return RedirectResponse("/login")
     async with conn.cursor(row_factory=dict_row) as cur:
         await cur.execute("""
-            SELECT pr.id, pr.proposal_filename, pr.proposal_filepath,
+            SELECT pr.id, pr.proposal_filename, pr.proposal_filepath, pr.proposal_sha256,
                    p.client_id, p.contractor_id
             FROM proposals pr
             JOIN projects  p ON p.id = pr.project_id
@@ -327,11 +313,9 @@ async def download_proposal_file(proposal_id: int, request: Request, conn=Depend
     # 只有此案委託人或接案人能下載
     if user["id"] not in (row["client_id"], row["contractor_id"]):
         raise HTTPException(403, "無權限下載")
-    path = row["proposal_filepath"]
-    if not path or not os.path.exists(path):
-        raise HTTPException(404, "檔案已遺失")
-
-    return FileResponse(path, media_type="application/pdf", filename=row["proposal_filename"])
+    #支援續傳與 ETag(提案書沒變就回 304)
+    return await file_response(request, open_stored(row["proposal_sha256"], row["proposal_filepath"]), row["proposal_filename"],
+                               "application/pdf", sha256=row["proposal_sha256"], kind="proposal")
 
 #選擇接案人
 @app.post("/projects/{project_id}/select")
@@ -363,6 +347,7 @@ async def select_contractor(request: Request, project_id: int, proposal_id: int
             "UPDATE projects SET contractor_id=%s, status='in_progress', updated_at=NOW() WHERE id=%s;",
             (prop["contractor_id"], project_id)
         )
+        await notify(cur, project_id, "status", [prop["contractor_id"]])   #通知被選中的接案人
         await conn.commit()
     return RedirectResponse(f"/projects/{project_id}", status_code=status.HTTP_302_FOUND)   #一樣回到案件詳情畫面
 
@@ -376,7 +361,7 @@ async def download_closure_file(closure_id: int, request: Request, conn = Depend
         #把檔案的資料(檔名、路徑等)從DB抓出來
         await cur.execute(
             """
-            SELECT cf.id, cf.filename, cf.filepath, p.client_id, p.contractor_id
+            SELECT cf.id, cf.filename, cf.filepath, cf.sha256, p.client_id, p.contractor_id
             FROM closure_files cf
             JOIN projects p ON p.id = cf.project_id
             WHERE cf.id = %s;
@@ -390,12 +375,31 @@ async def download_closure_file(closure_id: int, request: Request, conn = Depend
     #只有此專案的委託人或接案人才能下載
     if user["id"] not in (row["client_id"], row["contractor_id"]):
         raise HTTPException(403, "無權限下載")
-    #DB有記錄但磁碟上找不到
-    path = row["filepath"]
-    if not os.path.exists(path):
-        raise HTTPException(404, "檔案已遺失")
-    #以原檔名下載
-    return FileResponse(path, media_type="application/octet-stream", filename=row["filename"])
+    #以原檔名下載(DB有記錄但磁碟上找不到會回 404)
+    #每個版本的內容不會再變，可以讓瀏覽器長期快取；也支援續傳
+    return await file_response(request, open_stored(row["sha256"], row["filepath"]), row["filename"],
+                               "application/octet-stream", sha256=row["sha256"], immutable=True, kind="closure")
+
+#把案件所有版本的結案檔案打包成 ZIP 下載(邊壓縮邊送出，不產生暫存檔)
+#?proposals=1 一併放入提案書，?issues=1 一併放入 Issue 與留言(issues.json)
+@app.get("/projects/{project_id}/closures.zip")
+async def download_closures_zip(request: Request, project_id: int,
+                                proposals: bool = Query(False), issues: bool = Query(False)):
+    #串流可能很久，只在查資料時短暫借用 DB 連線
+    async with db_connection() as conn:
+        user = await current_user(request, conn)
+        if not user:
+            return RedirectResponse("/login")
+        data = await load_project_archive(conn, project_id)
+    if not data:
+        raise HTTPException(404, "找不到案件")
+    #和單一檔案下載一樣：只有此專案的委託人或接案人才能下載
+    if user["id"] not in (data["project"]["client_id"], data["project"]["contractor_id"]):
+        raise HTTPException(403, "無權限下載")
+    extra = {"issues.json": issues_json(data)} if issues else {}
+    return StreamingResponse(stream_archive(archive_entries(data, proposals), extra), media_type="application/zip",
+                             headers={"Content-Disposition": content_disposition(f"project{project_id}_closures.zip"),
+                                      "Cache-Control": "private, no-cache"})
 
 #決定是否要結案，送出的結果就由這裡接收
 @app.post("/projects/{project_id}/decision")
@@ -408,11 +412,14 @@ async def close_decision(request: Request, project_id: int, decision: str = Form
         raise HTTPException(400, "未知決策")
     async with conn.cursor(row_factory=dict_row) as cur:
         #從DB找出這個案件的委託人是誰
-        await cur.execute("SELECT client_id FROM projects WHERE id=%s;", (project_id,))
+        await cur.execute("SELECT client_id, contractor_id, status FROM projects WHERE id=%s FOR UPDATE;", (project_id,))
         row = await cur.fetchone()
         #如果找不到或不是該案的委託人就禁止
         if not row or row["client_id"] != user["id"]:
             raise HTTPException(403, "無權限")
+        #只有已提交結案檔案的案件可以決定(重複送出不會把完成/退回次數算兩次)
+        if row["status"] != "submitted":
+            raise HTTPException(400, "案件尚未提交結案檔案")
         #如果要「接受結案」，必須先確認所有issue都已經關閉(resolved)
         if decision == "accept":
             #去DB數「未解決 Issue」有幾筆
@@ -428,8 +435,19 @@ async def close_decision(request: Request, project_id: int, decision: str = Form
             if open_cnt > 0:
                 return RedirectResponse(f"/projects/{project_id}?notice=issues_not_resolved",status_code=status.HTTP_302_FOUND)
         #設定新狀態並更新DB(如果按的是 接受結案->closed 退回修改->reject)
-        new_status = "closed" if decision == "accept" else "reject"
-        await cur.execute("UPDATE projects SET status=%s, updated_at=NOW() WHERE id=%s;", (new_status, project_id))
+        #接受結案時記下結案時間並開放評價(期限到了由 scheduler.py 關掉)
+        if decision == "accept":
+            await cur.execute("""
+                UPDATE projects SET status='closed', closed_at=NOW(), rating_open=TRUE, updated_at=NOW() WHERE id=%s;
+            """, (project_id,))
+        else:
+            await cur.execute("""
+                UPDATE projects SET status='reject', reject_count=reject_count+1, updated_at=NOW() WHERE id=%s;
+            """, (project_id,))
+        #接案人的完成案件數/被退回次數(提案列表的信譽分數會用到)
+        if row["contractor_id"]:
+            await record_decision(cur, row["contractor_id"], accepted=decision == "accept")
+        await notify(cur, project_id, "status", [row["contractor_id"]])
         await conn.commit()
     return RedirectResponse(f"/projects/{project_id}", status_code=status.HTTP_302_FOUND)   #回到案件詳情畫面
 
@@ -439,42 +457,40 @@ async def close_decision(request: Request, project_id: int, decision: str = Form
 async def browse_open_projects(
     request: Request,
     q: str | None = Query(default=None, description="搜尋關鍵字"),
-    conn = Depends(getDB)
+    after: str | None = Query(default=None, description="下一頁游標"),
+    before: str | None = Query(default=None, description="上一頁游標"),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, description="每頁筆數"),
+    conn = Depends(getReadDB)
     ):
     #檢查身分
     user = await current_user(request, conn)
     if not user or user["role"] != "contractor":
         return RedirectResponse("/login")
+    tsquery = build_tsquery(q) if q else None
     async with conn.cursor(row_factory=dict_row) as cur:
-        #用搜尋的方式
-        if q:
-            like = f"%{q}%"
-            await cur.execute(
-                """
-                SELECT id, title, description, created_at, bid_deadline
-                FROM projects
+        #用搜尋的方式：走 search_vector 的 GIN 索引，依相關度排序
+        if tsquery:
+            page = await fetch_page(cur, """
+                SELECT id, title, description, created_at, bid_deadline,
+                       ts_rank_cd(search_vector, query)::float8 AS rank
+                FROM projects, to_tsquery('simple', %s) AS query
                 WHERE status='open'
-                  AND (bid_deadline IS NULL OR bid_deadline >= NOW())
-                  AND (title ILIKE %s OR description ILIKE %s)
-                ORDER BY bid_deadline ASC NULLS LAST, created_at DESC, id DESC;
-                """,
-                (like, like),
-            )
-        #直接瀏覽
+                  AND search_vector @@ query
+            """, (tsquery,), SEARCH_ORDER, limit, after=after, before=before)
+            #標出關鍵字、截出描述摘要
+            for p in page["items"]:
+                p["title_html"] = highlight(p["title"], q, radius=None)
+                p["snippet"] = highlight(p["description"], q)
+        #直接瀏覽：依截止日排序
         else:
-            await cur.execute(
-                """
+            page = await fetch_page(cur, """
                 SELECT id, title, description, created_at, bid_deadline
                 FROM projects
                 WHERE status='open'
-                  AND (bid_deadline IS NULL OR bid_deadline >= NOW())
-                ORDER BY bid_deadline ASC NULLS LAST, created_at DESC, id DESC;
-                """
-            )
-        projects = await cur.fetchall()
+            """, (), BROWSE_ORDER, limit, after=after, before=before)
     return templates.TemplateResponse(
         "browse_projects.html",
-        {"request": request, "user": user, "projects": projects, "q": q or ""}
+        {"request": request, "user": user, "projects": page["items"], "q": q or "", **page_urls(request, page)}
     )
 
 #開啟提出承包意願的畫面
@@ -521,34 +537,33 @@ async def submit_proposal(
 
     async with conn.cursor(row_factory=dict_row) as cur:
         #同時檢查案件狀態 + 投標截止期限(新增)
-        await cur.execute("SELECT status, bid_deadline FROM projects WHERE id=%s;", (project_id,))
+        await cur.execute("SELECT status, bid_deadline, client_id FROM projects WHERE id=%s;", (project_id,))
         row = await cur.fetchone()
         if not row:
             raise HTTPException(404, "找不到案件")
+        if row["status"] == "bid_closed":
+            raise HTTPException(400, "已超過投標截止期限，無法提出意願")
         if row["status"] != "open":
             raise HTTPException(400, "案件不可提出意願")
+        #scheduler.py 還沒跑到的空檔再檢查一次截止時間
         if row["bid_deadline"] and datetime.now(tz=row["bid_deadline"].tzinfo) > row["bid_deadline"]:
             raise HTTPException(400, "已超過投標截止期限，無法提出意願")
 
-        #把使用者上傳的PDF存到硬碟
-        content = await proposal_file.read()    #把上傳檔案內容讀成 bytes
-        safe_uid = uuid.uuid4().hex[:10]    #產生一段不容易重複的隨機碼(避免撞檔名 被覆蓋)
-        ts = datetime.now().strftime("%Y%m%d%H%M%S")
-        dest = UPLOAD_DIR / f"proposal_p{project_id}_u{user['id']}_{ts}_{safe_uid}.pdf"
-        with dest.open("wb") as f:
-            f.write(content)
+        #把使用者上傳的PDF分塊存進儲存區(會檢查檔頭與大小上限，內容相同只存一份)
+        blob = await store_upload(proposal_file, "proposal", require_pdf=True)
 
         #把原檔名&實際檔案路徑寫進DB
         await cur.execute("""
             INSERT INTO proposals (
                 project_id, contractor_id, message, price,
-                proposal_filename, proposal_filepath
+                proposal_filename, proposal_filepath, proposal_sha256, proposal_size
             )
-            VALUES (%s,%s,%s,%s,%s,%s);
+            VALUES (%s,%s,%s,%s,%s,%s,%s,%s);
         """, (
             project_id, user["id"], message, price,
-            filename, str(dest)
+            filename, str(blob["path"]), blob["sha256"], blob["size"]
         ))
+        await notify(cur, project_id, "proposal", [row["client_id"]])   #委託人的案件頁面與首頁即時更新
         await conn.commit()
     return RedirectResponse("/dashboard?notice=proposal_sent", status_code=status.HTTP_302_FOUND)   #回到個人首頁畫面並出現已送出意願的通知
 
@@ -588,41 +603,44 @@ async def upload_closure(
 
     async with conn.cursor(row_factory=dict_row) as cur:
         #確認案件是否存在以及權限確認
-        await cur.execute("SELECT contractor_id, status FROM projects WHERE id=%s;", (project_id,))
+        await cur.execute("SELECT contractor_id, client_id, status FROM projects WHERE id=%s;", (project_id,))
         row = await cur.fetchone()
         if not row:
             raise HTTPException(404, "找不到案件")
         if row["contractor_id"] != user["id"]:
             raise HTTPException(403, "無權限")
         
-        #找這個專案目前最大的結案檔案版本號
-        await cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM closure_files WHERE project_id=%s;", (project_id,))
-        vrow = await cur.fetchone()
-        next_version = int(vrow["v"]) + 1  #自動遞增
+        #把使用者上傳的檔案分塊存進儲存區(內容相同只存一份)；先存檔再取號，取號後鎖住案件的時間才會短
+        blob = await store_upload(file, "closure")
 
-        #把使用者上傳的PDF存到硬碟(也會控制檔名)
-        content = await file.read()
-        safe_uid = uuid.uuid4().hex[:10]
-        ts = datetime.now().strftime("%Y%m%d%H%M%S")
-        dest = UPLOAD_DIR / f"closure_p{project_id}_v{next_version}_{ts}_{safe_uid}_{filename}"
-        with dest.open("wb") as f:
-            f.write(content)
+        #取下一個版本號，同時更新案件狀態(上傳結案檔案後 → submitted)
+        #UPDATE 會鎖住這一列直到 commit，同時上傳的人會排隊，不會拿到同一個版本號
+        await cur.execute("""
+            UPDATE projects SET closure_version = closure_version + 1, status='submitted', updated_at=NOW()
+            WHERE id=%s
+            RETURNING closure_version;
+        """, (project_id,))
+        next_version = (await cur.fetchone())["closure_version"]
 
         #都寫入DB
         await cur.execute("""
-            INSERT INTO closure_files (project_id, contractor_id, version, filename, filepath)
-            VALUES (%s,%s,%s,%s,%s);
-        """, (project_id, user["id"], next_version, filename, str(dest)))
-
-        #更新案件狀態(上傳結案檔案後 → submitted)
-        await cur.execute(
-            "UPDATE projects SET status='submitted', updated_at=NOW() WHERE id=%s;",
-            (project_id,)
-        )
+            INSERT INTO closure_files (project_id, contractor_id, version, filename, filepath, sha256, size)
+            VALUES (%s,%s,%s,%s,%s,%s,%s);
+        """, (project_id, user["id"], next_version, filename, str(blob["path"]), blob["sha256"], blob["size"]))
+        await notify(cur, project_id, "closure", [row["client_id"]])
         await conn.commit()
     return RedirectResponse(f"/projects/{project_id}", status_code=status.HTTP_302_FOUND)   #回到案件詳情畫面
 
 # ================= 評價功能：建立評價/查看歷史評價 =================
+#評價期限還剩多少時間；期限到了回傳 None
+#rating_open 由 scheduler.py 到期時關掉，排程還沒跑到的空檔再用結案時間 closed_at 算一次
+def rating_time_left(project) -> timedelta | None:
+    closed_at = project["closed_at"]
+    if not project["rating_open"] or not closed_at:
+        return None
+    left = closed_at + timedelta(days=RATING_DEADLINE_DAYS) - datetime.now(tz=closed_at.tzinfo)
+    return left if left > timedelta(0) else None
+
 #顯示評價畫面
 @app.get("/projects/{project_id}/rate", response_class=HTMLResponse)
 async def rate_project_page(
@@ -676,20 +694,13 @@ async def rate_project_page(
             dim_labels = ["需求合理性", "驗收難度", "合作態度"]
             role_label = "委託人"
         #評價期限 & 計算剩餘時間
-        remain_days = 0
-        remain_hours = 0
-        closed_at = project["updated_at"]   #案件最後更新的時間就是結案時間
-        if closed_at and isinstance(closed_at, datetime):   #確保真的有結案時間且型別正確
-            deadline_at = closed_at + timedelta(days=RATING_DEADLINE_DAYS)  #計算評價截止時間          
-            now = datetime.now(tz=closed_at.tzinfo)   #取得與結案時間同時區的現在時間
-            #如果已經超過評價時間就報錯
-            if now > deadline_at:
-                raise HTTPException(400, "已超過評價期限")
-            #計算剩餘時間
-            diff = deadline_at - now
-            total_hours = int(diff.total_seconds() // 3600)
-            remain_days = total_hours // 24
-            remain_hours = total_hours % 24
+        diff = rating_time_left(project)
+        #如果已經超過評價時間就報錯
+        if diff is None:
+            raise HTTPException(400, "已超過評價期限")
+        total_hours = int(diff.total_seconds() // 3600)
+        remain_days = total_hours // 24
+        remain_hours = total_hours % 24
         #檢查是否已評過
         await cur.execute(
             """
@@ -757,6 +768,8 @@ async def rate_project_submit(
             raise HTTPException(400, "案件尚未結案，無法評價")
         if not project["contractor_id"]:
             raise HTTPException(400, "此案件尚未有接案人")
+        if rating_time_left(project) is None:
+            raise HTTPException(400, "已超過評價期限")
         #判斷「誰評誰」 (決定資料要怎麼寫進DB)
         if target == "contractor":
             #委託人評接案人
@@ -782,12 +795,13 @@ async def rate_project_submit(
         )
         if await cur.fetchone():
             raise HTTPException(400, "您已經評價過此對象")
-        #把這筆評價資料寫入DB
+        #把這筆評價資料寫入DB(同時送出兩次時由 ratings_once_per_target 擋下第二筆)
         await cur.execute(
             """
             INSERT INTO ratings (project_id, target_id, target_role, rater_id,  rater_role,
             score_1, score_2, score_3, comment)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s);
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT DO NOTHING;
             """,
             (
                 project_id, target_id, target_role,
@@ -795,110 +809,56 @@ async def rate_project_submit(
                 s1, s2, s3, comment,
             ),
         )
+        if cur.rowcount == 0:
+            raise HTTPException(400, "您已經評價過此對象")
+        #同一個交易裡更新評價統計
+        await add_to_summary(cur, target_id, target_role, s1, s2, s3)
         await conn.commit()
     #送出之後回到案件詳情畫面
     return RedirectResponse(f"/projects/{project_id}",status_code=status.HTTP_302_FOUND,)
 
-#顯示委託人歷史評價畫面
-@app.get("/ratings/client/{user_id}", response_class=HTMLResponse)
-async def view_client_ratings(request: Request, user_id: int, conn = Depends(getDB)):
+#顯示使用者(委託人/接案人)的歷史評價畫面
+@app.get("/ratings/{role}/{user_id}", response_class=HTMLResponse)
+async def view_user_ratings(request: Request, role: str, user_id: int,
+                            after: str | None = Query(None), before: str | None = Query(None),
+                            limit: int = Query(DEFAULT_PAGE_SIZE), conn = Depends(getReadDB)):
+    if role not in RATING_ROLES:
+        raise HTTPException(404, "找不到頁面")
     user = await current_user(request, conn)
     if not user:
         return RedirectResponse("/login")
-    #從DB找出要被查看的人
     async with conn.cursor(row_factory=dict_row) as cur:
-        await cur.execute("SELECT id, username FROM users WHERE id=%s;", (user_id,))
-        target = await cur.fetchone()
-        if not target:
-            raise HTTPException(404, "找不到使用者")
-        #計算平均分數&共有幾筆評價
+        #從DB找出要被查看的人 & 評價統計(rating_summary 一列就有平均分數與筆數)
         await cur.execute(
             """
-            SELECT 
-                AVG(score_1) AS avg1,
-                AVG(score_2) AS avg2,
-                AVG(score_3) AS avg3,
-                COUNT(*)     AS cnt
-            FROM ratings
-            WHERE target_id=%s AND target_role='client';
+            SELECT u.id, u.username, s.cnt, s.sum_1, s.sum_2, s.sum_3, s.hist_1, s.hist_2, s.hist_3
+            FROM users u
+            LEFT JOIN rating_summary s ON s.user_id = u.id AND s.role = %s
+            WHERE u.id=%s;
             """,
-            (user_id,),
+            (role, user_id),
         )
-        stats = await cur.fetchone()
-        #找出每一筆評價 & 質性評論
-        await cur.execute(
-            """
-            SELECT r.*, u.username AS rater_username, p.title AS project_title
-            FROM ratings r
-            JOIN users    u ON u.id = r.rater_id
-            JOIN projects p ON p.id = r.project_id
-            WHERE r.target_id=%s AND r.target_role='client'
-            ORDER BY r.created_at DESC;
-            """,
-            (user_id,),
-        )
-        items = await cur.fetchall()
-    dim_labels = ["需求合理性", "驗收難度", "合作態度"]  #在HTML顯示用
-    role_label = "委託人"  #在HTML顯示用
-    next_url = request.query_params.get("next") or "/dashboard"
-    return templates.TemplateResponse(
-        "ratings_user.html",
-        {
-            "request": request, "user": user,
-            "target": target, "role": "client",
-            "role_label": role_label,"dim_labels": dim_labels,
-            "stats": stats, "items": items, "next_url": next_url,
-        },
-    )
-#顯示接案人歷史評價畫面
-@app.get("/ratings/contractor/{user_id}", response_class=HTMLResponse)
-async def view_contractor_ratings(request: Request, user_id: int, conn = Depends(getDB)):
-    user = await current_user(request, conn)
-    if not user:
-        return RedirectResponse("/login")
-    #從DB找出要被查看的人
-    async with conn.cursor(row_factory=dict_row) as cur:
-        await cur.execute("SELECT id, username FROM users WHERE id=%s;", (user_id,))
         target = await cur.fetchone()
         if not target:
             raise HTTPException(404, "找不到使用者")
-        #計算平均分數&共有幾筆評價
-        await cur.execute(
-            """
-            SELECT 
-                AVG(score_1) AS avg1,
-                AVG(score_2) AS avg2,
-                AVG(score_3) AS avg3,
-                COUNT(*)     AS cnt
-            FROM ratings
-            WHERE target_id=%s AND target_role='contractor';
-            """,
-            (user_id,),
-        )
-        stats = await cur.fetchone()
-        #找出每一筆評價 & 質性評論
-        await cur.execute(
-            """
+        stats = summary_stats(target)
+        #找出評價 & 質性評論(分頁)
+        page = await fetch_page(cur, """
             SELECT r.*, u.username AS rater_username, p.title AS project_title
             FROM ratings r
             JOIN users    u ON u.id = r.rater_id
             JOIN projects p ON p.id = r.project_id
-            WHERE r.target_id=%s AND r.target_role='contractor'
-            ORDER BY r.created_at DESC;
-            """,
-            (user_id,),
-        )
-        items = await cur.fetchall()
-    dim_labels = ["產出品質", "執行效率", "合作態度"]  #在HTML顯示用
-    role_label = "接案人"  #在HTML顯示用
+            WHERE r.target_id=%s AND r.target_role=%s
+        """, (user_id, role), RATINGS_ORDER, limit, after=after, before=before)
     next_url = request.query_params.get("next") or "/dashboard"
     return templates.TemplateResponse(
         "ratings_user.html",
         {
             "request": request, "user": user,
-            "target": target, "role": "contractor",
-            "role_label": role_label, "dim_labels": dim_labels,
-            "stats": stats, "items": items, "next_url": next_url,
+            "target": target, "role": role,
+            "role_label": RATING_ROLES[role]["label"], "dim_labels": RATING_ROLES[role]["dims"],
+            "stats": stats, "items": page["items"], "next_url": next_url,
+            **page_urls(request, page),
         },
     )
 
@@ -961,6 +921,7 @@ async def issue_create(
             INSERT INTO issues (project_id, opener_id, title, description)
             VALUES (%s,%s,%s,%s);
         """, (project_id, user["id"], title, description))
+        await notify(cur, project_id, "issue")
         await conn.commit()
     return RedirectResponse(f"/projects/{project_id}", status_code=302)  #回到案件詳情畫面
 
@@ -999,6 +960,7 @@ async def issue_comment(
             INSERT INTO issue_comments (issue_id, author_id, content)
             VALUES (%s,%s,%s);
         """, (issue_id, user["id"], content))
+        await notify(cur, row["project_id"], "comment")
         await conn.commit()
     return RedirectResponse(request.headers.get("referer", f"/projects/{row['project_id']}"), status_code=302)  #回到送出留言的那個畫面
 
@@ -1029,9 +991,52 @@ async def issue_resolve(issue_id: int, request: Request, conn=Depends(getDB)):
             SET status='resolved', resolved_at=NOW()
             WHERE id=%s;
         """, (issue_id,))
+        await notify(cur, row["project_id"], "issue")
         await conn.commit()
     return RedirectResponse(request.headers.get("referer", f"/projects/{row['project_id']}"), status_code=302)  #回到點擊關閉按鈕的那個畫面
 
-@app.on_event("shutdown")
-async def _shutdown():
-    await close_pool()
\ No newline at end of file
+# =============== 即時更新(SSE) =================
+#串流期間不佔用 DB 連線，只在檢查權限時短暫借用
+#案件頁面：有新提案、新版本結案檔案、Issue/留言、狀態改變時通知
+@app.get("/projects/{project_id}/events")
+async def project_events(request: Request, project_id: int):
+    async with db_connection() as conn:
+        user = await current_user(request, conn)
+        if not user:
+            raise HTTPException(401, "請先登入")
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute("SELECT client_id FROM projects WHERE id=%s;", (project_id,))
+            row = await cur.fetchone()
+    if not row:
+        raise HTTPException(404, "找不到案件")
+    #和案件詳情頁一樣：案主或接案人才能看
+    if not ((user["role"] == "client" and row["client_id"] == user["id"]) or user["role"] == "contractor"):
+        raise HTTPException(403, "無權限")
+    return StreamingResponse(event_stream(request, ("project", project_id)), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+#個人首頁：自己的案件有變化時通知
+@app.get("/events")
+async def user_events(request: Request):
+    async with db_connection() as conn:
+        user = await current_user(request, conn)
+    if not user:
+        raise HTTPException(401, "請先登入")
+    return StreamingResponse(event_stream(request, ("user", user["id"])), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# =============== 系統狀態 =================
+#健康檢查：確認 DB 連得上，並回傳 connection pool 與密碼雜湊 thread pool 的狀態
+@app.get("/healthz")
+async def healthz(conn=Depends(getDB)):
+    await conn.execute("SELECT 1;")
+    return JSONResponse({"status": "ok", "pool": pool_stats(), "read_pool": read_pool_stats(),
+                         "passwords": password_stats(), "events": broker.stats(), "scheduler": scheduler.stats(),
+                         "rate_limit": limiter.stats(), "recommend": recommender.stats(), "user_cache": user_cache_stats()})
+
+#效能指標(Prometheus 文字格式)
+@app.get("/metrics")
+async def metrics():
+    text = render_metrics({"db_pool": pool_stats(), "db_read_pool": read_pool_stats(), "password_pool": password_stats(),
+                          "rate_limit": limiter.stats(), "user_cache": user_cache_stats()})
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
@@ -0,0 +1,212 @@
+# metrics.py
+# 效能指標：每個路由的回應時間、每個請求下了幾次 SQL、花多少時間在 DB、等 connection pool 多久、
+# 上傳/下載了多少 bytes，用 Prometheus 文字格式從 /metrics 輸出
+#   * MetricsMiddleware：包住整個 app，記錄每個請求(以路由樣板分組，例如 /projects/{project_id})
+#   * MetricsCursor：設定成連線的 cursor_factory，每次 execute 都會計時
+#   * QUERY_LISTENERS：每次 SQL 執行完會呼叫的函式(可以是 async)，其他模組可以掛上來做額外紀錄
+# 指標存在各自的 worker process 記憶體裡，多個 worker 時 Prometheus 要分別抓
+import inspect
+import os
+import time
+from contextvars import ContextVar
+
+from psycopg import AsyncCursor
+
+SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"    #回應加上 Server-Timing 標頭(瀏覽器開發者工具看得到)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30)
+
+class Histogram:
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    #Prometheus 的 bucket 是累計值(<= 上限的筆數)
+    def cumulative(self):
+        total = 0
+        for bound, n in zip(self.buckets, self.counts):
+            total += n
+            yield bound, total
+
+#單一請求的統計，存在 contextvar 裡，同一個請求裡的 cursor 都會加到這裡
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "pool_wait_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+def current_stats() -> RequestStats | None:
+    return _current.get()
+
+#(method, route, status) → 回應時間
+_latency: dict[tuple, Histogram] = {}
+#route → 每個請求的 SQL 次數 / DB 時間
+_queries: dict[str, Histogram] = {}
+_db_time: dict[str, Histogram] = {}
+_pool_wait = Histogram(POOL_WAIT_BUCKETS)
+#(direction, kind) → bytes
+_bytes: dict[tuple, int] = {}
+_queries_total = 0
+
+QUERY_LISTENERS: list = []
+
+#各模組 stats() 裡只會增加的累計值：/metrics 輸出成 counter 並加上 _total(Prometheus 的 rate() 才算得對)，其餘都是 gauge
+COUNTER_KEYS = {
+    "requests", "queued", "wait_ms", "timeouts", "connections_lost", "shed",     #db.pool_stats()
+    "hashed", "verified", "rehashed", "rejected", "work_ms",                     #passwords.password_stats()
+    "allowed", "limited",                                                        #ratelimit.limiter.stats()
+    "hits", "misses", "evictions", "invalidations",                              #auth.user_cache_stats()
+}
+
+# ---------------- 紀錄 ----------------
+def record_pool_wait(seconds: float):
+    _pool_wait.observe(seconds)
+    stats = _current.get()
+    if stats is not None:
+        stats.pool_wait_seconds += seconds
+
+def count_bytes(direction: str, kind: str, n: int):
+    _bytes[(direction, kind)] = _bytes.get((direction, kind), 0) + n
+
+async def _record_query(cur, query, params, seconds: float):
+    global _queries_total
+    if query == "":     #pool 借出連線前 check_connection 送的空指令，算在等 pool 的時間裡
+        return
+    _queries_total += 1
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += seconds
+    for listener in QUERY_LISTENERS:
+        result = listener(cur, query, params, seconds)
+        if inspect.isawaitable(result):
+            await result
+
+#連線的 cursor_factory：execute 前後計時
+#pipeline mode 裡 execute 只是把指令送出，時間會算在之後的 fetch，這裡記到的是送出的時間
+class MetricsCursor(AsyncCursor):
+    async def execute(self, query, params=None, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            await _record_query(self, query, params, time.perf_counter() - start)
+
+    async def executemany(self, query, params_seq, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().executemany(query, params_seq, **kwargs)
+        finally:
+            await _record_query(self, query, None, time.perf_counter() - start)
+
+# ---------------- middleware ----------------
+def _route_name(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"  #找不到路由的一律歸在一起，避免亂打網址讓指標爆量
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if SERVER_TIMING:
+                    message.setdefault("headers", [])
+                    message["headers"] = [*message["headers"], (b"server-timing", _server_timing(stats, start))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - start
+            route = _route_name(scope)
+            key = (scope["method"], route, str(status_code))
+            _latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            _queries.setdefault(route, Histogram(QUERY_COUNT_BUCKETS)).observe(stats.queries)
+            _db_time.setdefault(route, Histogram(LATENCY_BUCKETS)).observe(stats.db_seconds)
+
+def _server_timing(stats: RequestStats, start: float) -> bytes:
+    app_ms = (time.perf_counter() - start) * 1000
+    return (
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+        f"pool;dur={stats.pool_wait_seconds * 1000:.1f}, app;dur={app_ms:.1f}"
+    ).encode()
+
+# ---------------- 輸出 ----------------
+def _labels(**labels) -> str:
+    def esc(v):
+        return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in labels.items()) + "}"
+
+def _histogram_lines(name: str, hist: Histogram, **labels) -> list[str]:
+    lines = []
+    for bound, total in hist.cumulative():
+        lines.append(f"{name}_bucket{_labels(**labels, le=repr(float(bound)))} {total}")
+    lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+    lines.append(f"{name}_sum{_labels(**labels) if labels else ''} {hist.sum}")
+    lines.append(f"{name}_count{_labels(**labels) if labels else ''} {hist.count}")
+    return lines
+
+#產生 Prometheus 文字格式；gauges 是呼叫端另外提供的即時數值，例如 {"db_pool": pool_stats()}
+def render_metrics(gauges: dict[str, dict] | None = None) -> str:
+    out = []
+    out.append("# HELP http_request_duration_seconds 每個路由的回應時間")
+    out.append("# TYPE http_request_duration_seconds histogram")
+    for (method, route, status), hist in sorted(_latency.items()):
+        out += _histogram_lines("http_request_duration_seconds", hist, method=method, route=route, status=status)
+    out.append("# HELP db_queries_per_request 每個請求執行的 SQL 次數")
+    out.append("# TYPE db_queries_per_request histogram")
+    for route, hist in sorted(_queries.items()):
+        out += _histogram_lines("db_queries_per_request", hist, route=route)
+    out.append("# HELP db_time_per_request_seconds 每個請求花在 SQL 的時間")
+    out.append("# TYPE db_time_per_request_seconds histogram")
+    for route, hist in sorted(_db_time.items()):
+        out += _histogram_lines("db_time_per_request_seconds", hist, route=route)
+    out.append("# HELP db_queries_total 執行過的 SQL 總數")
+    out.append("# TYPE db_queries_total counter")
+    out.append(f"db_queries_total {_queries_total}")
+    out.append("# HELP db_pool_wait_seconds 從 connection pool 取得連線的等待時間")
+    out.append("# TYPE db_pool_wait_seconds histogram")
+    out += _histogram_lines("db_pool_wait_seconds", _pool_wait)
+    out.append("# HELP file_bytes_total 上傳/下載的檔案 bytes")
+    out.append("# TYPE file_bytes_total counter")
+    for (direction, kind), n in sorted(_bytes.items()):
+        out.append(f"file_bytes_total{_labels(direction=direction, kind=kind)} {n}")
+    for prefix, values in (gauges or {}).items():
+        for name, value in values.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if name in COUNTER_KEYS:
+                out.append(f"# TYPE {prefix}_{name}_total counter")
+                out.append(f"{prefix}_{name}_total {value}")
+            else:
+                out.append(f"# TYPE {prefix}_{name} gauge")
+                out.append(f"{prefix}_{name} {value}")
+    return "\n".join(out) + "\n"
@@ -0,0 +1,108 @@
+# migrate.py
+# 資料庫版本遷移工具
+#   python migrate.py status          列出每個版本是否已套用
+#   python migrate.py up [版本]        套用到指定版本(不給就套用全部)
+#   python migrate.py down <版本>      退回到指定版本(0 = 全部退回到 DB.sql 的初始結構)
+# 遷移檔放在 migrations/，命名為 NNNN_說明.up.sql / NNNN_說明.down.sql
+# 每個版本在各自的交易裡執行，失敗會整個回滾，不會留下做一半的結構
+import re
+import sys
+from pathlib import Path
+
+import psycopg
+
+from db import DATABASE_URL
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+_FILE_RE = re.compile(r"^(\d+)_(.+)\.(up|down)\.sql$")
+_LOCK_KEY = 8_370_001   #advisory lock 的鍵值，避免兩個人同時跑遷移
+
+def load_migrations(directory: Path = MIGRATIONS_DIR) -> list[dict]:
+    found: dict[int, dict] = {}
+    for path in sorted(directory.glob("*.sql")):
+        m = _FILE_RE.match(path.name)
+        if not m:
+            continue
+        version = int(m.group(1))
+        entry = found.setdefault(version, {"version": version, "name": m.group(2), "up": None, "down": None})
+        entry[m.group(3)] = path
+    for entry in found.values():
+        if entry["up"] is None:
+            raise RuntimeError(f"遷移 {entry['version']:04d} 缺少 up 檔")
+    return [found[v] for v in sorted(found)]
+
+def _ensure_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+
+def applied_versions(conn) -> set[int]:
+    return {r[0] for r in conn.execute("SELECT version FROM schema_migrations;").fetchall()}
+
+def migrate_up(conn, target: int | None = None, out=print):
+    done = applied_versions(conn)
+    for m in load_migrations():
+        if target is not None and m["version"] > target:
+            break
+        if m["version"] in done:
+            continue
+        out(f"↑ {m['version']:04d} {m['name']}")
+        with conn.transaction():
+            conn.execute(m["up"].read_text(encoding="utf-8"))
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s);", (m["version"], m["name"]))
+
+def migrate_down(conn, target: int, out=print):
+    done = applied_versions(conn)
+    for m in reversed(load_migrations()):
+        if m["version"] <= target:
+            break
+        if m["version"] not in done:
+            continue
+        if m["down"] is None:
+            raise RuntimeError(f"遷移 {m['version']:04d} 沒有 down 檔，無法退回")
+        out(f"↓ {m['version']:04d} {m['name']}")
+        with conn.transaction():
+            conn.execute(m["down"].read_text(encoding="utf-8"))
+            conn.execute("DELETE FROM schema_migrations WHERE version=%s;", (m["version"],))
+
+def status(conn, out=print):
+    done = applied_versions(conn)
+    for m in load_migrations():
+        out(f"[{'x' if m['version'] in done else ' '}] {m['version']:04d} {m['name']}")
+
+USAGE = "用法：python migrate.py status | up [版本] | down <版本>"
+
+def main(argv: list[str]) -> int:
+    if not argv or argv[0] not in ("status", "up", "down") or len(argv) > 2:
+        print(USAGE)
+        return 2
+    cmd = argv[0]
+    if len(argv) > 1 and not argv[1].isdigit():
+        print(f"版本必須是非負整數：{argv[1]}")
+        print(USAGE)
+        return 2
+    target = int(argv[1]) if len(argv) > 1 else None
+    if cmd == "down" and target is None:
+        print("down 需要指定要退回到哪個版本，例如：python migrate.py down 0")
+        return 2
+    #autocommit：每個版本自己用 conn.transaction() 包成一個交易
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        _ensure_table(conn)
+        conn.execute("SELECT pg_advisory_lock(%s);", (_LOCK_KEY,))
+        try:
+            if cmd == "status":
+                status(conn)
+            elif cmd == "up":
+                migrate_up(conn, target)
+            else:
+                migrate_down(conn, target)
+        finally:
+            conn.execute("SELECT pg_advisory_unlock(%s);", (_LOCK_KEY,))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,10 @@
+ALTER TABLE ratings DROP CONSTRAINT IF EXISTS ratings_once_per_target;
+DROP INDEX IF EXISTS ratings_target_idx;
+DROP INDEX IF EXISTS issue_comments_issue_id_idx;
+DROP INDEX IF EXISTS issues_project_id_idx;
+DROP INDEX IF EXISTS closure_files_project_id_idx;
+DROP INDEX IF EXISTS proposals_contractor_id_idx;
+DROP INDEX IF EXISTS proposals_project_id_idx;
+DROP INDEX IF EXISTS projects_open_browse_idx;
+DROP INDEX IF EXISTS projects_contractor_id_idx;
+DROP INDEX IF EXISTS projects_client_id_idx;
@@ -0,0 +1,26 @@
+-- 0001 效能索引：main.py 會用來過濾/排序的欄位都補上索引
+
+-- 委託人首頁：WHERE client_id=? ORDER BY created_at DESC, id DESC
+CREATE INDEX projects_client_id_idx ON projects (client_id, created_at DESC, id DESC);
+-- 接案人首頁：WHERE contractor_id=?
+CREATE INDEX projects_contractor_id_idx ON projects (contractor_id);
+-- /browse：只看 open 的案件，順序和 BROWSE_ORDER 一致
+CREATE INDEX projects_open_browse_idx ON projects (bid_deadline ASC NULLS LAST, created_at DESC, id DESC)
+    WHERE status = 'open';
+
+-- 案件詳情的提案列表
+CREATE INDEX proposals_project_id_idx ON proposals (project_id, created_at DESC);
+CREATE INDEX proposals_contractor_id_idx ON proposals (contractor_id);
+
+-- 結案檔案列表與版本號
+CREATE INDEX closure_files_project_id_idx ON closure_files (project_id, version);
+
+-- Issue 與留言
+CREATE INDEX issues_project_id_idx ON issues (project_id, created_at DESC);
+CREATE INDEX issue_comments_issue_id_idx ON issue_comments (issue_id, created_at);
+
+-- 評價頁：WHERE target_id=? AND target_role=? ORDER BY created_at DESC
+CREATE INDEX ratings_target_idx ON ratings (target_id, target_role, created_at DESC);
+-- 同一案件每人對同一對象只能評一次(同時也是「是否評過」查詢用的索引)
+-- 如果既有資料已經有重複評價，這一步會失敗，需先人工清理
+ALTER TABLE ratings ADD CONSTRAINT ratings_once_per_target UNIQUE (project_id, rater_id, target_id);
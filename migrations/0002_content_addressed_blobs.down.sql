@@ -0,0 +1,8 @@
+DROP INDEX IF EXISTS proposals_sha256_idx;
+DROP INDEX IF EXISTS closure_files_sha256_idx;
+ALTER TABLE proposals
+    DROP COLUMN IF EXISTS proposal_size,
+    DROP COLUMN IF EXISTS proposal_sha256;
+ALTER TABLE closure_files
+    DROP COLUMN IF EXISTS size,
+    DROP COLUMN IF EXISTS sha256;
@@ -0,0 +1,12 @@
+-- 0002 內容定址儲存：上傳檔案以 SHA-256 存放，同內容只存一份
+-- 舊資料的 sha256 維持 NULL(仍是原本 uploads/ 底下的檔案路徑)
+ALTER TABLE closure_files
+    ADD COLUMN sha256 TEXT,
+    ADD COLUMN size BIGINT;
+ALTER TABLE proposals
+    ADD COLUMN proposal_sha256 TEXT,
+    ADD COLUMN proposal_size BIGINT;
+
+-- gc 查「這個 blob 還有沒有人用」
+CREATE INDEX closure_files_sha256_idx ON closure_files (sha256) WHERE sha256 IS NOT NULL;
+CREATE INDEX proposals_sha256_idx ON proposals (proposal_sha256) WHERE proposal_sha256 IS NOT NULL;
@@ -0,0 +1,3 @@
+DROP INDEX IF EXISTS ratings_history_idx;
+CREATE INDEX ratings_target_idx ON ratings (target_id, target_role, created_at DESC);
+DROP TABLE IF EXISTS rating_summary;
@@ -0,0 +1,31 @@
+-- 0003 評價統計表：每位使用者、每種角色一列，評價送出時在同一個交易裡更新
+-- 看評價頁面時直接讀這一列，不用每次把全部評價重新 AVG / COUNT
+-- hist_N[k] = 第 N 項評分給 k 顆星的筆數(k = 1..5)
+CREATE TABLE rating_summary (
+    user_id INT NOT NULL REFERENCES users(id),
+    role TEXT NOT NULL CHECK (role IN ('client', 'contractor')),
+    cnt INT NOT NULL DEFAULT 0,
+    sum_1 INT NOT NULL DEFAULT 0,
+    sum_2 INT NOT NULL DEFAULT 0,
+    sum_3 INT NOT NULL DEFAULT 0,
+    hist_1 INT[] NOT NULL DEFAULT '{0,0,0,0,0}',
+    hist_2 INT[] NOT NULL DEFAULT '{0,0,0,0,0}',
+    hist_3 INT[] NOT NULL DEFAULT '{0,0,0,0,0}',
+    updated_at TIMESTAMP DEFAULT NOW(),
+    PRIMARY KEY (user_id, role)
+);
+
+-- 用既有的評價補齊統計
+INSERT INTO rating_summary (user_id, role, cnt, sum_1, sum_2, sum_3, hist_1, hist_2, hist_3)
+SELECT target_id, target_role, COUNT(*),
+       COALESCE(SUM(score_1), 0), COALESCE(SUM(score_2), 0), COALESCE(SUM(score_3), 0),
+       ARRAY[COUNT(*) FILTER (WHERE score_1 = 1), COUNT(*) FILTER (WHERE score_1 = 2), COUNT(*) FILTER (WHERE score_1 = 3), COUNT(*) FILTER (WHERE score_1 = 4), COUNT(*) FILTER (WHERE score_1 = 5)]::int[],
+       ARRAY[COUNT(*) FILTER (WHERE score_2 = 1), COUNT(*) FILTER (WHERE score_2 = 2), COUNT(*) FILTER (WHERE score_2 = 3), COUNT(*) FILTER (WHERE score_2 = 4), COUNT(*) FILTER (WHERE score_2 = 5)]::int[],
+       ARRAY[COUNT(*) FILTER (WHERE score_3 = 1), COUNT(*) FILTER (WHERE score_3 = 2), COUNT(*) FILTER (WHERE score_3 = 3), COUNT(*) FILTER (WHERE score_3 = 4), COUNT(*) FILTER (WHERE score_3 = 5)]::int[]
+FROM ratings
+WHERE target_role IS NOT NULL
+GROUP BY target_id, target_role;
+
+-- 評價頁面的留言分頁(多加 id 讓游標分頁的排序唯一，取代 0001 的 ratings_target_idx)
+DROP INDEX IF EXISTS ratings_target_idx;
+CREATE INDEX ratings_history_idx ON ratings (target_id, target_role, created_at DESC, id DESC);
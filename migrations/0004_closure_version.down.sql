@@ -0,0 +1,3 @@
+ALTER TABLE closure_files DROP CONSTRAINT IF EXISTS closure_files_project_version_key;
+CREATE INDEX closure_files_project_id_idx ON closure_files (project_id, version);
+ALTER TABLE projects DROP COLUMN IF EXISTS closure_version;
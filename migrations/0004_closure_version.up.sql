@@ -0,0 +1,23 @@
+-- 0004 結案檔案版本號：每個案件自己記目前的版本號，上傳時 UPDATE ... RETURNING 取號
+-- 原本用 MAX(version) + 1，同時上傳兩個檔案可能拿到同一個版本號，而且每次都要掃過這個案件的所有版本
+ALTER TABLE projects ADD COLUMN closure_version INT NOT NULL DEFAULT 0;
+
+-- 舊資料裡重複的版本號(同時上傳造成的)，第二筆之後改排到最後面
+WITH numbered AS (
+    SELECT id, project_id, ROW_NUMBER() OVER (PARTITION BY project_id, version ORDER BY id) AS rn
+    FROM closure_files
+), moved AS (
+    SELECT n.id, m.max_version + ROW_NUMBER() OVER (PARTITION BY n.project_id ORDER BY n.id) AS version
+    FROM numbered n
+    JOIN (SELECT project_id, MAX(version) AS max_version FROM closure_files GROUP BY project_id) m USING (project_id)
+    WHERE n.rn > 1
+)
+UPDATE closure_files cf SET version = moved.version FROM moved WHERE cf.id = moved.id;
+
+UPDATE projects p SET closure_version = c.max_version
+FROM (SELECT project_id, MAX(version) AS max_version FROM closure_files GROUP BY project_id) c
+WHERE p.id = c.project_id;
+
+-- 同一個案件的版本號不能重複(唯一索引同時取代 0001 的 closure_files_project_id_idx)
+DROP INDEX IF EXISTS closure_files_project_id_idx;
+ALTER TABLE closure_files ADD CONSTRAINT closure_files_project_version_key UNIQUE (project_id, version);
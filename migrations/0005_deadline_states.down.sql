@@ -0,0 +1,9 @@
+DROP INDEX IF EXISTS projects_rating_open_idx;
+ALTER TABLE projects DROP COLUMN IF EXISTS rating_open;
+ALTER TABLE projects DROP COLUMN IF EXISTS closed_at;
+
+UPDATE projects SET status = 'open' WHERE status = 'bid_closed';
+ALTER TABLE projects DROP CONSTRAINT projects_status_check;
+ALTER TABLE projects ADD CONSTRAINT projects_status_check CHECK (
+    status IN ('open', 'in_progress', 'submitted', 'reject', 'closed')
+);
@@ -0,0 +1,21 @@
+-- 0005 截止狀態：投標截止、評價期限改由 scheduler.py 定期更新到欄位上
+-- 原本每次瀏覽、首頁計數、提案、評價都要拿 bid_deadline / updated_at 和 NOW() 比，
+-- 改成明確的狀態後，熱門查詢只剩 status='open'、rating_open 這種等值條件，可以直接走部分索引
+
+-- 投標截止後、還沒選接案人的案件
+ALTER TABLE projects DROP CONSTRAINT projects_status_check;
+ALTER TABLE projects ADD CONSTRAINT projects_status_check CHECK (
+    status IN ('open', 'bid_closed', 'in_progress', 'submitted', 'reject', 'closed')
+);
+UPDATE projects SET status = 'bid_closed' WHERE status = 'open' AND bid_deadline < NOW();
+
+-- 結案時間另外記(原本借用 updated_at，之後再改案件資料就會讓評價期限跑掉)
+ALTER TABLE projects ADD COLUMN closed_at TIMESTAMP;
+UPDATE projects SET closed_at = updated_at WHERE status = 'closed';
+
+-- 評價期限內(結案後 14 天)為 TRUE，期限到了由 scheduler 關掉
+ALTER TABLE projects ADD COLUMN rating_open BOOLEAN NOT NULL DEFAULT FALSE;
+UPDATE projects SET rating_open = TRUE WHERE status = 'closed' AND closed_at > NOW() - interval '14 days';
+
+-- scheduler 找評價期限到了的案件；投標截止的部分用 0001 的 projects_open_browse_idx(bid_deadline 開頭)
+CREATE INDEX projects_rating_open_idx ON projects (closed_at) WHERE rating_open;
@@ -0,0 +1,2 @@
+DROP TABLE IF EXISTS contractor_reputation;
+ALTER TABLE projects DROP COLUMN IF EXISTS reject_count;
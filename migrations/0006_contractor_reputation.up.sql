@@ -0,0 +1,19 @@
+-- 0006 接案人信譽：完成案件數與被退回次數，結案決定(接受/退回)時在同一個交易裡更新
+-- 委託人看提案列表時和 rating_summary 一起 JOIN 進來，不用逐一打開每位接案人的評價頁
+
+-- 每個案件被退回修改幾次(狀態 reject 只是暫時的，重新上傳後就看不出來被退回過)
+ALTER TABLE projects ADD COLUMN reject_count INT NOT NULL DEFAULT 0;
+UPDATE projects SET reject_count = 1 WHERE status = 'reject';   -- 舊資料只知道目前是退回狀態的案件
+
+CREATE TABLE contractor_reputation (
+    contractor_id INT PRIMARY KEY REFERENCES users(id),
+    completed INT NOT NULL DEFAULT 0,   -- 接受結案的案件數
+    rejects INT NOT NULL DEFAULT 0,     -- 被退回修改的次數
+    updated_at TIMESTAMP DEFAULT NOW()
+);
+
+INSERT INTO contractor_reputation (contractor_id, completed, rejects)
+SELECT contractor_id, COUNT(*) FILTER (WHERE status = 'closed'), COALESCE(SUM(reject_count), 0)
+FROM projects
+WHERE contractor_id IS NOT NULL
+GROUP BY contractor_id;
@@ -0,0 +1 @@
+DROP INDEX IF EXISTS projects_updated_at_idx;
@@ -0,0 +1,2 @@
+-- 0007 推薦索引的增量同步：每個 worker 定期查 updated_at 之後有變動的案件(recommend.py)
+CREATE INDEX projects_updated_at_idx ON projects (updated_at);
@@ -0,0 +1,3 @@
+DROP INDEX IF EXISTS projects_search_idx;
+ALTER TABLE projects DROP COLUMN IF EXISTS search_vector;
+DROP FUNCTION IF EXISTS cjk_tokens(TEXT);
@@ -0,0 +1,38 @@
+-- 0008 案件全文檢索(/browse?q=、/api/v1/projects?q=)
+-- 先前的版本直接寫在 DB.sql，已經用那份 DB.sql 建好的資料庫這裡會略過(IF NOT EXISTS)
+
+-- CJK 連續字切成 bigram(外加最後一個字)，英數字詞維持原樣，結果用空白隔開
+-- 規則要和 search.py 的 cjk_tokens() 一致
+CREATE OR REPLACE FUNCTION cjk_tokens(src TEXT) RETURNS TEXT AS $$
+DECLARE
+    tokens TEXT[] := '{}';
+    run TEXT;
+    n INT;
+BEGIN
+    FOR run IN
+        SELECT m[1] FROM regexp_matches(
+            lower(coalesce(src, '')),
+            '([\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[^[:space:][:punct:]\u3000-\u303f\uff00-\uffef\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+)',
+            'g'
+        ) AS m
+    LOOP
+        n := char_length(run);
+        IF run ~ '^[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]' THEN
+            FOR i IN 1 .. n - 1 LOOP
+                tokens := tokens || substr(run, i, 2);
+            END LOOP;
+            tokens := tokens || substr(run, n, 1);
+        ELSE
+            tokens := tokens || run;
+        END IF;
+    END LOOP;
+    RETURN array_to_string(tokens, ' ');
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+-- 全文檢索向量(標題權重 A、描述權重 B)，由 DB 自動維護；加欄位時會重寫整張 projects
+ALTER TABLE projects ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+    setweight(to_tsvector('simple', cjk_tokens(title)), 'A') ||
+    setweight(to_tsvector('simple', cjk_tokens(description)), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS projects_search_idx ON projects USING GIN (search_vector);
@@ -0,0 +1,180 @@
+# pagination.py
+# 游標(keyset)分頁：用「上一頁最後一筆的排序欄位值」當起點往下查，
+# 不用 OFFSET，也不用把整張表撈出來，頁數再深查詢成本都一樣
+import base64
+import json
+from datetime import datetime, date
+from decimal import Decimal
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+#游標裡可以出現的值(kind 沒指定時)
+_CURSOR_TYPES = (str, int, float, datetime, date, Decimal)
+
+#排序欄位：(SQL 運算式, 是否 DESC, 是否 NULLS LAST, 結果欄位名稱, 值的型別)
+#PostgreSQL 預設 ASC → NULLS LAST、DESC → NULLS FIRST，這裡一律明確寫出來
+class SortKey:
+    def __init__(self, expr: str, desc: bool = False, nulls_last: bool | None = None, column: str | None = None,
+                 kind: type | None = None):
+        self.expr = expr
+        self.desc = desc
+        self.nulls_last = (not desc) if nulls_last is None else nulls_last
+        self.column = column or expr.split(".")[-1]
+        self.kind = kind
+
+    #游標裡的值能不能拿來和這個欄位比較(型別不對代進 SQL 會出錯，例如拿字串和時間比)
+    def accepts(self, v) -> bool:
+        if v is None:
+            return True
+        if isinstance(v, bool) or not isinstance(v, _CURSOR_TYPES):
+            return False
+        if isinstance(v, str) and "\x00" in v:    #PostgreSQL 的字串不能有 NUL
+            return False
+        if isinstance(v, Decimal) and not v.is_finite():
+            return False
+        if self.kind is None:
+            return True
+        if self.kind in (float, Decimal):
+            return isinstance(v, (self.kind, int))
+        return isinstance(v, self.kind)
+
+    def order_sql(self, reverse: bool = False) -> str:
+        desc = self.desc != reverse
+        nulls_last = self.nulls_last != reverse
+        return f"{self.expr} {'DESC' if desc else 'ASC'} NULLS {'LAST' if nulls_last else 'FIRST'}"
+
+#browse 頁的排序：截止日近的在前、沒設截止日的放最後
+BROWSE_ORDER = [
+    SortKey("bid_deadline", kind=datetime),
+    SortKey("created_at", desc=True, kind=datetime),
+    SortKey("id", desc=True, kind=int),
+]
+
+def clamp_page_size(limit: int | None) -> int:
+    if not limit or limit < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
+
+# ---------------- 游標編碼 ----------------
+def _encode_value(v):
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    if isinstance(v, date):
+        return {"d": v.isoformat()}
+    if isinstance(v, Decimal):
+        return {"dec": str(v)}
+    return v
+
+def _decode_value(v):
+    if isinstance(v, dict):
+        if "dt" in v:
+            return datetime.fromisoformat(v["dt"])
+        if "d" in v:
+            return date.fromisoformat(v["d"])
+        if "dec" in v:
+            return Decimal(v["dec"])
+        raise ValueError("unknown cursor value")
+    return v
+
+def encode_cursor(row: dict, keys: list[SortKey]) -> str:
+    payload = [_encode_value(row[k.column]) for k in keys]
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+#游標壞掉(被竄改、版本不同或值的型別不對)就回傳 None，讓呼叫端從第一頁開始
+def decode_cursor(cursor: str | None, keys: list[SortKey]) -> list | None:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(values, list) or len(values) != len(keys):
+        return None
+    try:
+        values = [_decode_value(v) for v in values]
+    except (ValueError, TypeError, ArithmeticError):
+        return None
+    if not all(k.accepts(v) for k, v in zip(keys, values)):
+        return None
+    return values
+
+# ---------------- WHERE 條件 ----------------
+#產生「排在 values 這一筆之後」的條件；reverse=True 則是「排在之前」
+#組成 (k1 之後) OR (k1 相同 AND ((k2 之後) OR (k2 相同 AND ...)))
+def keyset_condition(keys: list[SortKey], values: list, reverse: bool = False) -> tuple[str, list]:
+    sql = "FALSE"
+    params: list = []
+    for k, v in reversed(list(zip(keys, values))):
+        desc = k.desc != reverse
+        nulls_last = k.nulls_last != reverse
+        if v is None:
+            after = "FALSE" if nulls_last else f"{k.expr} IS NOT NULL"
+            after_params = []
+            same = f"{k.expr} IS NULL"
+            same_params = []
+        else:
+            after = f"{k.expr} {'<' if desc else '>'} %s"
+            if nulls_last:
+                after = f"({after} OR {k.expr} IS NULL)"
+            after_params = [v]
+            same = f"{k.expr} = %s"
+            same_params = [v]
+        if sql == "FALSE":
+            sql, params = after, after_params
+        else:
+            sql = f"({after} OR ({same} AND {sql}))"
+            params = after_params + same_params + params
+    return sql, params
+
+def order_by(keys: list[SortKey], reverse: bool = False) -> str:
+    return ", ".join(k.order_sql(reverse) for k in keys)
+
+#執行分頁查詢
+#base_sql 是不含 ORDER BY / LIMIT 的 SELECT，where_joiner 是要接在後面的 "AND" 或 "WHERE"
+#before 有值時往前翻(查反向排序再倒回來)，after 有值時往後翻
+async def fetch_page(cur, base_sql: str, params: list | tuple, keys: list[SortKey],
+                     limit: int, after: str | None = None, before: str | None = None,
+                     where_joiner: str = "AND") -> dict:
+    limit = clamp_page_size(limit)
+    reverse = False
+    cond_sql, cond_params = "", []
+    values = decode_cursor(before, keys) if before else None
+    if values is not None:
+        reverse = True
+    else:
+        values = decode_cursor(after, keys)
+    if values is not None:
+        cond, cond_params = keyset_condition(keys, values, reverse=reverse)
+        cond_sql = f" {where_joiner} {cond}"
+    sql = f"{base_sql}{cond_sql} ORDER BY {order_by(keys, reverse)} LIMIT %s;"
+    await cur.execute(sql, [*params, *cond_params, limit + 1])   #多抓一筆，用來判斷還有沒有下一頁
+    rows = await cur.fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if reverse:
+        rows.reverse()
+        has_next = values is not None
+        has_prev = has_more
+    else:
+        has_next = has_more
+        has_prev = values is not None
+    return {
+        "items": rows,
+        "limit": limit,
+        "next_cursor": encode_cursor(rows[-1], keys) if rows and has_next else None,
+        "prev_cursor": encode_cursor(rows[0], keys) if rows and has_prev else None,
+    }
+
+#產生上一頁/下一頁的網址(保留原本的搜尋條件等參數)
+def page_urls(request, page: dict) -> dict:
+    url = request.url.remove_query_params(["after", "before", "fragment"])  #即時更新抓區塊用的參數不要留在分頁連結上
+    def _link(**params):
+        u = url.include_query_params(**params)
+        return f"{u.path}?{u.query}"
+    return {
+        "next_url": _link(after=page["next_cursor"]) if page["next_cursor"] else None,
+        "prev_url": _link(before=page["prev_cursor"]) if page["prev_cursor"] else None,
+    }
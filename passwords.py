@@ -0,0 +1,76 @@
+# passwords.py
+# 密碼雜湊(pbkdf2)每次要燒掉幾十毫秒的 CPU，直接在 async handler 裡算會卡住整個 event loop
+#   * 雜湊/驗證丟到專用的 thread pool 執行(hashlib 的 pbkdf2 計算時會釋放 GIL，其他請求照常處理)
+#   * 排隊的數量有上限，尖峰時超過就直接回 503，不讓請求無限堆積
+#   * 雜湊參數(rounds)調整後，使用者下次登入成功時自動換成新參數的雜湊
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+PASSWORD_ROUNDS = int(os.getenv("PASSWORD_ROUNDS", "29000"))    #pbkdf2_sha256 的迭代次數(passlib 預設值)
+PASSWORD_WORKERS = int(os.getenv("PASSWORD_WORKERS", str(min(4, os.cpu_count() or 1))))   #同時計算的執行緒數
+PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", "64"))   #計算中+排隊中的上限
+RETRY_AFTER_SECONDS = 1
+
+pwd_context = CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__rounds=PASSWORD_ROUNDS)
+
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="password")
+_pending = 0
+_stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0, "max_pending": 0,
+          "wait_ms": 0.0, "work_ms": 0.0}
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, start, time.perf_counter()
+
+async def _run(fn, *args):
+    global _pending
+    if _pending >= PASSWORD_MAX_PENDING:
+        _stats["rejected"] += 1
+        raise HTTPException(503, "系統忙碌中，請稍後再試", headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+    _pending += 1
+    _stats["max_pending"] = max(_stats["max_pending"], _pending)
+    submitted = time.perf_counter()
+    try:
+        result, start, end = await asyncio.get_running_loop().run_in_executor(_executor, _timed, fn, *args)
+    finally:
+        _pending -= 1
+    _stats["wait_ms"] += (start - submitted) * 1000
+    _stats["work_ms"] += (end - start) * 1000
+    return result
+
+#註冊：產生密碼雜湊
+async def hash_password(password: str) -> str:
+    hashed = await _run(pwd_context.hash, password)
+    _stats["hashed"] += 1
+    return hashed
+
+#登入：驗證密碼，回傳 (是否正確, 新雜湊)；新雜湊不是 None 代表參數已更新，呼叫端要存回 DB
+async def verify_password(password: str, hashed: str) -> tuple[bool, str | None]:
+    try:
+        ok, new_hash = await _run(pwd_context.verify_and_update, password, hashed)
+    except ValueError:  #DB 裡的雜湊格式壞掉
+        ok, new_hash = False, None
+    _stats["verified"] += 1
+    if new_hash:
+        _stats["rehashed"] += 1
+    return ok, new_hash
+
+def password_stats() -> dict:
+    return {
+        "workers": PASSWORD_WORKERS,
+        "max_pending": PASSWORD_MAX_PENDING,
+        "pending": _pending,
+        "peak_pending": _stats["max_pending"],
+        "hashed": _stats["hashed"],
+        "verified": _stats["verified"],
+        "rehashed": _stats["rehashed"],
+        "rejected": _stats["rejected"],
+        "wait_ms": round(_stats["wait_ms"], 1),
+        "work_ms": round(_stats["work_ms"], 1),
+    }
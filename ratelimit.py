@@ -0,0 +1,95 @@
+# ratelimit.py
+# 送出表單的流量限制(token bucket)：每位使用者(沒登入就看 IP)每一類表單各有一個桶子
+#   * 桶子最多裝 burst 個 token，每秒補 per_minute / 60 個；每次送出拿一個，拿不到就回 429 + Retry-After
+#   * 在讀 body 之前就擋下來，超量的上傳不會佔用頻寬、暫存檔和 DB 連線
+#   * 要放在 SessionMiddleware 裡層(main.py 先加這個再 setup_session)，才知道是哪位使用者
+# 桶子存在各自的 worker process 記憶體裡(多個 worker 時上限約是 worker 數倍)
+# 壓力測試時可以設 RATE_LIMIT=0 關掉
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+
+from starlette.responses import PlainTextResponse
+
+RATE_LIMIT = os.getenv("RATE_LIMIT", "1") != "0"
+RATE_LIMIT_KEYS = int(os.getenv("RATE_LIMIT_KEYS", "100000"))  #最多記幾個桶子(太久沒用的先丟)
+
+#各類表單的上限：{種類: (burst 連續幾次, 每分鐘補幾次)}
+RATE_LIMITS = {
+    "login": (20, 20),
+    "register": (10, 10),
+    "proposal": (5, 10),
+    "closure": (5, 10),
+    "issue": (10, 20),
+    "comment": (10, 30),
+}
+#哪些 POST 路徑是哪一類
+RATE_ROUTES = [
+    (re.compile(r"^/login$"), "login"),
+    (re.compile(r"^/register$"), "register"),
+    (re.compile(r"^/projects/\d+/propose$"), "proposal"),
+    (re.compile(r"^/projects/\d+/upload$"), "closure"),
+    (re.compile(r"^/projects/\d+/issues/create$"), "issue"),
+    (re.compile(r"^/issues/\d+/comment$"), "comment"),
+]
+
+class RateLimiter:
+    def __init__(self, max_keys: int = RATE_LIMIT_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[tuple, tuple[float, float]]" = OrderedDict()   #{(種類, 身分): (剩幾個 token, 上次更新時間)}
+        self._stats = {"allowed": 0, "limited": 0}
+
+    #拿一個 token；拿得到回傳 0，拿不到回傳還要等幾秒
+    def take(self, kind: str, who: tuple) -> float:
+        burst, per_minute = RATE_LIMITS[kind]
+        rate = per_minute / 60
+        key = (kind, who)
+        now = time.monotonic()
+        tokens, at = self._buckets.pop(key, (burst, now))
+        tokens = min(burst, tokens + (now - at) * rate)
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+            self._stats["allowed"] += 1
+        else:
+            wait = (1 - tokens) / rate
+            self._stats["limited"] += 1
+        self._buckets[key] = (tokens, now)     #放回最後面(最近使用)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self):
+        self._buckets.clear()
+
+    def stats(self) -> dict:
+        return {**self._stats, "keys": len(self._buckets), "enabled": RATE_LIMIT}
+
+limiter = RateLimiter()
+
+#有登入看使用者，沒登入看 IP(在 proxy 後面時要讓 uvicorn 用 --proxy-headers 取得真正的來源 IP)
+def _identity(scope) -> tuple:
+    uid = scope.get("session", {}).get("user_id")
+    if uid:
+        return ("user", uid)
+    client = scope.get("client")
+    return ("ip", client[0] if client else "")
+
+class RateLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not RATE_LIMIT or scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        kind = next((k for pattern, k in RATE_ROUTES if pattern.match(scope["path"])), None)
+        if kind is None:
+            return await self.app(scope, receive, send)
+        wait = limiter.take(kind, _identity(scope))
+        if wait > 0:
+            response = PlainTextResponse("操作太頻繁，請稍後再試", status_code=429,
+                                         headers={"Retry-After": str(math.ceil(wait)), "Connection": "close"})   #body 沒讀，不能再沿用這條連線
+            return await response(scope, receive, send)
+        await self.app(scope, receive, send)
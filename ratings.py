@@ -0,0 +1,69 @@
+# ratings.py
+# 評價統計：rating_summary 每位使用者、每種角色一列(筆數、各項總分、各項 1~5 星的筆數)
+# 新增評價時和 ratings 在同一個交易裡更新，看評價頁面只要讀一列，不用重算全部評價
+from datetime import datetime
+
+from pagination import SortKey
+
+#各角色在畫面上的名稱與三個評分項目
+RATING_ROLES = {
+    "client": {"label": "委託人", "dims": ["需求合理性", "驗收難度", "合作態度"]},
+    "contractor": {"label": "接案人", "dims": ["產出品質", "執行效率", "合作態度"]},
+}
+
+#評價留言的排序：新的在前
+RATINGS_ORDER = [SortKey("r.created_at", desc=True, kind=datetime), SortKey("r.id", desc=True, kind=int)]
+
+#把一筆新評價加進統計(呼叫端負責 commit)
+async def add_to_summary(cur, target_id: int, target_role: str, s1: int, s2: int, s3: int):
+    def first_hist(score):
+        hist = [0] * 5
+        hist[score - 1] = 1
+        return hist
+    await cur.execute(
+        """
+        INSERT INTO rating_summary (user_id, role, cnt, sum_1, sum_2, sum_3, hist_1, hist_2, hist_3)
+        VALUES (%s, %s, 1, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (user_id, role) DO UPDATE SET
+            cnt = rating_summary.cnt + 1,
+            sum_1 = rating_summary.sum_1 + EXCLUDED.sum_1,
+            sum_2 = rating_summary.sum_2 + EXCLUDED.sum_2,
+            sum_3 = rating_summary.sum_3 + EXCLUDED.sum_3,
+            hist_1[%s] = rating_summary.hist_1[%s] + 1,
+            hist_2[%s] = rating_summary.hist_2[%s] + 1,
+            hist_3[%s] = rating_summary.hist_3[%s] + 1,
+            updated_at = NOW();
+        """,
+        (
+            target_id, target_role, s1, s2, s3,
+            first_hist(s1), first_hist(s2), first_hist(s3),
+            s1, s1, s2, s2, s3, s3,
+        ),
+    )
+
+#把 rating_summary 的一列換成畫面要用的平均分數；沒有任何評價時 row 是 None
+def summary_stats(row: dict | None) -> dict:
+    if not row or not row.get("cnt"):
+        return {"cnt": 0, "avg1": None, "avg2": None, "avg3": None, "hist": [[0] * 5] * 3}
+    cnt = row["cnt"]
+    return {
+        "cnt": cnt,
+        "avg1": row["sum_1"] / cnt,
+        "avg2": row["sum_2"] / cnt,
+        "avg3": row["sum_3"] / cnt,
+        "hist": [row["hist_1"], row["hist_2"], row["hist_3"]],
+    }
+
+#從 ratings 重新計算整張 rating_summary(大量匯入資料後，或統計和實際評價對不上時使用)
+REBUILD_SUMMARY_SQL = """
+    TRUNCATE rating_summary;
+    INSERT INTO rating_summary (user_id, role, cnt, sum_1, sum_2, sum_3, hist_1, hist_2, hist_3)
+    SELECT target_id, target_role, COUNT(*),
+           COALESCE(SUM(score_1), 0), COALESCE(SUM(score_2), 0), COALESCE(SUM(score_3), 0),
+           ARRAY[COUNT(*) FILTER (WHERE score_1 = 1), COUNT(*) FILTER (WHERE score_1 = 2), COUNT(*) FILTER (WHERE score_1 = 3), COUNT(*) FILTER (WHERE score_1 = 4), COUNT(*) FILTER (WHERE score_1 = 5)]::int[],
+           ARRAY[COUNT(*) FILTER (WHERE score_2 = 1), COUNT(*) FILTER (WHERE score_2 = 2), COUNT(*) FILTER (WHERE score_2 = 3), COUNT(*) FILTER (WHERE score_2 = 4), COUNT(*) FILTER (WHERE score_2 = 5)]::int[],
+           ARRAY[COUNT(*) FILTER (WHERE score_3 = 1), COUNT(*) FILTER (WHERE score_3 = 2), COUNT(*) FILTER (WHERE score_3 = 3), COUNT(*) FILTER (WHERE score_3 = 4), COUNT(*) FILTER (WHERE score_3 = 5)]::int[]
+    FROM ratings
+    WHERE target_role IS NOT NULL
+    GROUP BY target_id, target_role;
+"""
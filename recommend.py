@@ -0,0 +1,298 @@
+# recommend.py
+# 接案人首頁的推薦案件：用接案人提過意願、承作過的案件，找出內容最像的 open 案件
+#   * 每個 open 案件轉成 TF-IDF 向量(斷詞和全文檢索一樣用 search.cjk_tokens，標題算兩次)，
+#     詞用 hash 對應到固定 2^18 維，不用維護詞彙表
+#   * 向量存成 CSR 稀疏矩陣(indptr / indices / data 三個 NumPy 陣列)，
+#     算分時整個矩陣一次做完(np.add.reduceat)，幾萬個案件也只要幾毫秒
+#   * 背景每 RECOMMEND_REFRESH_SECONDS 秒用 projects.updated_at 撈出有變動的案件，新增/修改/不再 open 的逐筆更新，
+#     刪掉的列只做標記，累積太多才整理
+#   * 索引在各自的 worker process 記憶體裡；第一次建好之前首頁不顯示推薦
+#   * 有安裝 NumPy 才用矩陣運算，沒有就退回純 Python 的倒排索引(結果一樣，只是案件多時比較慢)
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import Counter
+
+from psycopg.rows import dict_row
+from starlette.concurrency import run_in_threadpool
+
+import db
+from search import cjk_tokens
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RECOMMEND_REFRESH_SECONDS = float(os.getenv("RECOMMEND_REFRESH_SECONDS", "30"))    #幾秒同步一次(0 = 不推薦)
+RECOMMEND_LIMIT = 5         #首頁顯示幾筆
+PROFILE_SIZE = 50           #用接案人最近幾個提案/承作的案件當作興趣
+HASH_BITS = 18
+SYNC_OVERLAP_SECONDS = 60   #同步時往前多看一點，避免漏掉「交易比較久、晚一點才 commit」的修改
+
+logger = logging.getLogger("recommend")
+
+#把標題、描述轉成 {維度: 詞頻權重}(1 + log 次數)
+def vectorize(title: str, description: str) -> dict[int, float]:
+    mask = (1 << HASH_BITS) - 1
+    counts = Counter(hash(t) & mask for t in cjk_tokens(title) * 2 + cjk_tokens(description))
+    return {k: 1 + math.log(n) for k, n in counts.items()}
+
+class _NumpyIndex:
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+        self.indptr = np.zeros(1, dtype=np.int64)
+        self.indices = np.zeros(0, dtype=np.int32)
+        self.data = np.zeros(0, dtype=np.float32)
+        self.df = np.zeros(1 << HASH_BITS, dtype=np.int32)   #每個維度出現在幾個案件裡
+        self.rows = 0   #已使用的列數(含刪除的)
+        self.nnz = 0
+        self.row_of: dict[int, int] = {}
+        self._weights = None    #乘上 idf 之後的 data 與各列的向量長度(idf 會變，有變動就重算)
+        self._norms = None
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def _grow(self, rows: int, nnz: int):
+        if rows > len(self.ids):
+            size = max(rows, 2 * len(self.ids), 1024)
+            self.ids = np.resize(self.ids, size)
+            self.alive = np.resize(self.alive, size)
+            self.indptr = np.resize(self.indptr, size + 1)
+        if nnz > len(self.indices):
+            size = max(nnz, 2 * len(self.indices), 65536)
+            self.indices = np.resize(self.indices, size)
+            self.data = np.resize(self.data, size)
+
+    def add(self, project_id: int, vec: dict[int, float]):
+        self.remove(project_id)
+        if not vec:
+            return
+        self._grow(self.rows + 1, self.nnz + len(vec))
+        idx = np.fromiter(vec.keys(), dtype=np.int32, count=len(vec))
+        end = self.nnz + len(vec)
+        self.indices[self.nnz:end] = idx
+        self.data[self.nnz:end] = np.fromiter(vec.values(), dtype=np.float32, count=len(vec))
+        self.ids[self.rows] = project_id
+        self.alive[self.rows] = True
+        self.indptr[self.rows + 1] = end
+        self.df[idx] += 1
+        self.row_of[project_id] = self.rows
+        self.rows += 1
+        self.nnz = end
+        self._weights = None
+
+    def remove(self, project_id: int):
+        row = self.row_of.pop(project_id, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.df[self.indices[self.indptr[row]:self.indptr[row + 1]]] -= 1
+        self._weights = None
+        if self.rows - len(self.row_of) > max(1024, len(self.row_of)):   #刪掉的列比活著的多就整理
+            self._compact()
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive[:self.rows])
+        if not len(keep):
+            self.__init__()
+            return
+        lengths = np.diff(self.indptr[:self.rows + 1])[keep]
+        starts = self.indptr[keep]
+        take = np.repeat(starts - np.concatenate(([0], np.cumsum(lengths)[:-1])), lengths) + np.arange(lengths.sum())
+        self.indices = self.indices[take]
+        self.data = self.data[take]
+        self.ids = self.ids[keep]
+        self.alive = np.ones(len(keep), dtype=bool)
+        self.indptr = np.concatenate(([0], np.cumsum(lengths)))
+        self.rows = len(keep)
+        self.nnz = len(take)
+        self.row_of = {int(pid): i for i, pid in enumerate(self.ids)}
+
+    def idf(self):
+        return (np.log((len(self.row_of) + 1) / (self.df + 1)) + 1).astype(np.float32)
+
+    #回傳分數最高的 (案件 id, 分數)，分數是 TF-IDF 的 cosine 相似度
+    def top(self, query: dict[int, float], k: int, exclude: set[int]) -> list[tuple[int, float]]:
+        if not self.row_of or not query:
+            return []
+        idf = self.idf()
+        indices = self.indices[:self.nnz]
+        starts = self.indptr[:self.rows]
+        if self._weights is None:
+            self._weights = self.data[:self.nnz] * idf[indices]
+            self._norms = np.sqrt(np.add.reduceat(self._weights * self._weights, starts))
+        weights = self._weights
+        q = np.zeros(1 << HASH_BITS, dtype=np.float32)
+        q_idx = np.fromiter(query.keys(), dtype=np.int32, count=len(query))
+        q[q_idx] = np.fromiter(query.values(), dtype=np.float32, count=len(query)) * idf[q_idx]
+        scores = np.add.reduceat(weights * q[indices], starts) / (self._norms * np.linalg.norm(q) + 1e-9)
+        scores[~self.alive[:self.rows]] = -1
+        for pid in exclude:
+            row = self.row_of.get(pid)
+            if row is not None:
+                scores[row] = -1
+        k = min(k, self.rows)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(self.ids[r]), float(scores[r])) for r in best if scores[r] > 0]
+
+    def stats(self) -> dict:
+        return {"backend": "numpy", "projects": len(self.row_of), "rows": self.rows, "nnz": self.nnz,
+                "bytes": self.indices.nbytes + self.data.nbytes + self.df.nbytes}
+
+class _DictIndex:
+    def __init__(self):
+        self.docs: dict[int, dict[int, float]] = {}
+        self.postings: dict[int, dict[int, float]] = {}     #{維度: {案件 id: 詞頻權重}}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, project_id: int, vec: dict[int, float]):
+        self.remove(project_id)
+        if not vec:
+            return
+        self.docs[project_id] = vec
+        for k, w in vec.items():
+            self.postings.setdefault(k, {})[project_id] = w
+
+    def remove(self, project_id: int):
+        vec = self.docs.pop(project_id, None)
+        for k in vec or ():
+            posting = self.postings[k]
+            del posting[project_id]
+            if not posting:
+                del self.postings[k]
+
+    def top(self, query: dict[int, float], k: int, exclude: set[int]) -> list[tuple[int, float]]:
+        n = len(self.docs)
+        idf = lambda key: math.log((n + 1) / (len(self.postings.get(key, ())) + 1)) + 1
+        q = {key: w * idf(key) for key, w in query.items()}
+        dots: dict[int, float] = {}
+        for key, qw in q.items():
+            i = idf(key)
+            for pid, w in self.postings.get(key, {}).items():
+                dots[pid] = dots.get(pid, 0.0) + qw * w * i
+        q_norm = math.sqrt(sum(w * w for w in q.values())) + 1e-9
+        scores = []
+        for pid, dot in dots.items():
+            if pid not in exclude:
+                norm = math.sqrt(sum((w * idf(key)) ** 2 for key, w in self.docs[pid].items()))
+                scores.append((pid, dot / (norm * q_norm + 1e-9)))
+        scores.sort(key=lambda s: -s[1])
+        return scores[:k]
+
+    def stats(self) -> dict:
+        return {"backend": "python", "projects": len(self.docs), "terms": len(self.postings)}
+
+def _new_index():
+    return _NumpyIndex() if np is not None else _DictIndex()
+
+def _build(rows: list[dict]):
+    index = _new_index()
+    for r in rows:
+        index.add(r["id"], vectorize(r["title"], r["description"]))
+    return index
+
+class Recommender:
+    def __init__(self, interval: float = RECOMMEND_REFRESH_SECONDS):
+        self.interval = interval
+        self.index = None   #第一次建好之前是 None
+        self._versions: dict[int, object] = {}  #{案件 id: updated_at}，同步時沒變的就跳過
+        self._synced_at = None
+        self._task: asyncio.Task | None = None
+        self._errors = 0
+        self._last_ms = None    #上一次算分花了幾毫秒
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            try:
+                async with db.db_connection(shed=False) as conn:
+                    await self.sync(conn)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._errors += 1       #任何錯誤都不能讓同步就此停掉，下一輪再試
+                logger.exception("推薦索引同步失敗")
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    #第一次載入全部 open 案件(斷詞、建矩陣在 threadpool 做)，之後只處理 updated_at 有變的
+    async def sync(self, conn):
+        async with conn.cursor(row_factory=dict_row) as cur:
+            await cur.execute("SELECT NOW() AS now;")
+            now = (await cur.fetchone())["now"]
+            if self.index is None:
+                await cur.execute("SELECT id, title, description, updated_at FROM projects WHERE status='open';")
+                rows = await cur.fetchall()
+                self.index = await run_in_threadpool(_build, rows)
+                self._versions = {r["id"]: r["updated_at"] for r in rows}
+            else:
+                await cur.execute("""
+                    SELECT id, title, description, status, updated_at FROM projects
+                    WHERE updated_at > %s - make_interval(secs => %s);
+                """, (self._synced_at, SYNC_OVERLAP_SECONDS))
+                for r in await cur.fetchall():
+                    if r["status"] != "open":
+                        self.index.remove(r["id"])
+                        self._versions.pop(r["id"], None)
+                    elif self._versions.get(r["id"]) != r["updated_at"]:
+                        self.index.add(r["id"], vectorize(r["title"], r["description"]))
+                        self._versions[r["id"]] = r["updated_at"]
+        self._synced_at = now
+
+    #推薦給接案人的 open 案件；索引還沒建好或沒有任何紀錄時回傳空的
+    async def recommend(self, conn, contractor_id: int, limit: int = RECOMMEND_LIMIT) -> list[dict]:
+        if self.index is None or not len(self.index):
+            return []
+        async with conn.cursor(row_factory=dict_row) as cur:
+            #接案人最近提過意願的案件 + 承作過的案件(承作的算兩次)
+            await cur.execute("""
+                (SELECT p.id, p.title, p.description
+                 FROM proposals pr JOIN projects p ON p.id = pr.project_id
+                 WHERE pr.contractor_id=%s
+                 ORDER BY pr.created_at DESC LIMIT %s)
+                UNION ALL
+                (SELECT id, title, description FROM projects
+                 WHERE contractor_id=%s
+                 ORDER BY id DESC LIMIT %s);
+            """, (contractor_id, PROFILE_SIZE, contractor_id, PROFILE_SIZE))
+            history = await cur.fetchall()
+            if not history:
+                return []
+            query: Counter = Counter()
+            for h in history:
+                query.update(vectorize(h["title"], h["description"]))
+            started = time.perf_counter()
+            top = self.index.top(query, limit, exclude={h["id"] for h in history})
+            self._last_ms = (time.perf_counter() - started) * 1000
+            if not top:
+                return []
+            await cur.execute("""
+                SELECT id, title, bid_deadline FROM projects WHERE id = ANY(%s) AND status='open';
+            """, ([pid for pid, _ in top],))
+            found = {r["id"]: r for r in await cur.fetchall()}
+        return [{**found[pid], "score": score} for pid, score in top if pid in found]
+
+    def stats(self) -> dict:
+        base = {"ready": self.index is not None, "errors": self._errors, "last_ms": self._last_ms}
+        return {**base, **(self.index.stats() if self.index is not None else {})}
+
+recommender = Recommender()
@@ -0,0 +1,75 @@
+# reputation.py
+# 接案人信譽：評價平均(rating_summary)、完成案件數與被退回比例(contractor_reputation)
+# 兩張表都是寫入時在同一個交易裡更新的統計，提案列表一句 SQL 就能把每位接案人的信譽 JOIN 進來並排序，
+# 不用逐一打開每位接案人的評價頁
+from datetime import datetime
+from decimal import Decimal
+
+from pagination import SortKey
+
+PRIOR_RATINGS = 5       #評價筆數少時往 PRIOR_SCORE 拉(貝氏平均)，避免只有一筆五星就排第一
+PRIOR_SCORE = 3.0
+FULL_EXPERIENCE = 10    #完成幾件以上就不再因為經驗少而扣分
+REPUTATION_WEIGHT = 0.6     #綜合排序：信譽佔 60%、價格佔 40%
+
+#信譽分數 0~100 = 貝氏平均評分 / 5 × 經驗(完成 0 件打 8 折，FULL_EXPERIENCE 件以上不打折) × (1 - 退回比例 / 2)
+REPUTATION_SQL = f"""100.0
+    * (COALESCE(rs.sum_1 + rs.sum_2 + rs.sum_3, 0) + {PRIOR_RATINGS * 3 * PRIOR_SCORE}) / (3 * COALESCE(rs.cnt, 0) + {PRIOR_RATINGS * 3}) / 5
+    * (0.8 + 0.2 * LEAST(COALESCE(cr.completed, 0), {FULL_EXPERIENCE}) / {FULL_EXPERIENCE})
+    * (1 - 0.5 * COALESCE(cr.rejects::float8 / NULLIF(cr.completed + cr.rejects, 0), 0))"""
+#價格分數：這個案件最低的報價 = 1，其他依比例遞減
+PRICE_SCORE_SQL = "COALESCE((MIN(pr.price) OVER () / NULLIF(pr.price, 0))::float8, 0)"
+
+#案件的提案加上接案人信譽；外面包一層，排序與游標分頁才能直接用算出來的欄位
+PROPOSALS_SQL = f"""
+    SELECT * FROM (
+        SELECT pr.*, u.username AS contractor_username,
+               COALESCE(rs.cnt, 0) AS rating_count,
+               (rs.sum_1 + rs.sum_2 + rs.sum_3)::float8 / NULLIF(3 * rs.cnt, 0) AS rating_avg,
+               COALESCE(cr.completed, 0) AS completed_count,
+               cr.rejects::float8 / NULLIF(cr.completed + cr.rejects, 0) AS reject_rate,
+               {REPUTATION_SQL} AS reputation,
+               {REPUTATION_WEIGHT} * ({REPUTATION_SQL}) / 100 + {1 - REPUTATION_WEIGHT} * {PRICE_SCORE_SQL} AS combined_score
+        FROM proposals pr
+        JOIN users u ON u.id = pr.contractor_id
+        LEFT JOIN rating_summary rs ON rs.user_id = pr.contractor_id AND rs.role = 'contractor'
+        LEFT JOIN contractor_reputation cr ON cr.contractor_id = pr.contractor_id
+        WHERE pr.project_id=%s {{only_mine}}
+    ) s
+"""
+
+def proposals_sql(only_mine: bool = False) -> str:
+    return PROPOSALS_SQL.format(only_mine="AND pr.contractor_id=%s" if only_mine else "")
+
+#提案列表的排序方式
+PROPOSAL_SORTS = {
+    "recent": [SortKey("created_at", desc=True, kind=datetime), SortKey("id", desc=True, kind=int)],
+    "price": [SortKey("price", kind=Decimal), SortKey("id", kind=int)],
+    "reputation": [SortKey("reputation", desc=True, kind=float), SortKey("id", kind=int)],
+    "combined": [SortKey("combined_score", desc=True, kind=float), SortKey("id", kind=int)],
+}
+PROPOSAL_SORT_LABELS = {"recent": "最新", "price": "報價低到高", "reputation": "信譽", "combined": "綜合"}
+
+#委託人做出結案決定時更新接案人的統計(呼叫端負責 commit)
+async def record_decision(cur, contractor_id: int, accepted: bool):
+    await cur.execute(
+        """
+        INSERT INTO contractor_reputation (contractor_id, completed, rejects)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (contractor_id) DO UPDATE SET
+            completed = contractor_reputation.completed + EXCLUDED.completed,
+            rejects = contractor_reputation.rejects + EXCLUDED.rejects,
+            updated_at = NOW();
+        """,
+        (contractor_id, int(accepted), int(not accepted)),
+    )
+
+#從 projects 重新計算整張 contractor_reputation(大量匯入資料後，或統計和實際對不上時使用)
+REBUILD_REPUTATION_SQL = """
+    TRUNCATE contractor_reputation;
+    INSERT INTO contractor_reputation (contractor_id, completed, rejects)
+    SELECT contractor_id, COUNT(*) FILTER (WHERE status = 'closed'), COALESCE(SUM(reject_count), 0)
+    FROM projects
+    WHERE contractor_id IS NOT NULL
+    GROUP BY contractor_id;
+"""
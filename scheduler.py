@@ -0,0 +1,119 @@
+# scheduler.py
+# 期限處理：定期把「時間到了」的案件改成明確的狀態，頁面上的查詢就不用每次拿 NOW() 比
+#   * open 且 bid_deadline 已過        → status = 'bid_closed'(不再出現在瀏覽/搜尋，委託人還是可以選人)
+#   * 結案超過 RATING_DEADLINE_DAYS 天 → rating_open = FALSE(不能再評價)
+# 網站啟動時在背景每 SCHEDULER_INTERVAL 秒跑一次；多個 worker 同時跑也沒關係(FOR UPDATE SKIP LOCKED，同一列只會被一個處理)
+# 兩次執行之間的空檔由各個 handler 自己再檢查一次期限(例如投標截止後還沒被改成 bid_closed 的案件不能再提案)
+#   python scheduler.py      手動跑一次(例如改用 cron 排程時，設 SCHEDULER_INTERVAL=0 關掉網站內建的)
+import asyncio
+import logging
+import os
+import sys
+import time
+
+import psycopg
+from psycopg.rows import dict_row
+
+import db
+from events import notify
+
+SCHEDULER_INTERVAL = float(os.getenv("SCHEDULER_INTERVAL", "60"))  #幾秒跑一次(0 = 不在網站裡跑)
+RATING_DEADLINE_DAYS = 14   #評價期限：結案後 14 天內可以評
+BATCH_SIZE = 100            #一次交易最多改幾筆(小批次才會走索引逐筆更新，也不會一次鎖住太多列)
+
+logger = logging.getLogger("scheduler")
+
+#每個工作：(名稱, 找出並更新一批案件的 SQL)；RETURNING 的 client_id / contractor_id 用來通知他們的首頁
+_JOBS = [
+    ("bid_closed", """
+        UPDATE projects SET status='bid_closed', updated_at=NOW()
+        WHERE id IN (
+            SELECT id FROM projects
+            WHERE status='open' AND bid_deadline < NOW()
+            ORDER BY bid_deadline LIMIT %(batch)s FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, client_id, contractor_id;
+    """),
+    ("rating_closed", """
+        UPDATE projects SET rating_open=FALSE
+        WHERE id IN (
+            SELECT id FROM projects
+            WHERE rating_open AND closed_at < NOW() - make_interval(days => %(days)s)
+            ORDER BY closed_at LIMIT %(batch)s FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, client_id, contractor_id;
+    """),
+]
+
+#跑一輪所有工作，回傳 {工作名稱: 改了幾筆}
+async def run_deadlines(conn) -> dict[str, int]:
+    params = {"batch": BATCH_SIZE, "days": RATING_DEADLINE_DAYS}
+    done = {}
+    for name, sql in _JOBS:
+        done[name] = 0
+        while True:
+            async with conn.transaction():
+                cur = conn.cursor()
+                await cur.execute(sql, params)
+                rows = await cur.fetchall()
+                for row in rows:
+                    await notify(cur, row["id"], "status", [row["client_id"], row["contractor_id"]])
+            done[name] += len(rows)
+            if len(rows) < BATCH_SIZE:
+                break
+    return done
+
+class DeadlineScheduler:
+    def __init__(self, interval: float = SCHEDULER_INTERVAL):
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._runs = 0
+        self._errors = 0
+        self._last_run: float | None = None
+        self._changed = {name: 0 for name, _ in _JOBS}
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            try:
+                async with db.db_connection(shed=False) as conn:
+                    for name, n in (await run_deadlines(conn)).items():
+                        self._changed[name] += n
+                self._runs += 1
+                self._last_run = time.time()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self._errors += 1       #DB 暫時連不上等狀況，下一輪再試(任何錯誤都不能讓排程就此停掉)
+                logger.exception("期限處理失敗")
+            await asyncio.sleep(self.interval)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"running": self._task is not None and not self._task.done(), "interval": self.interval,
+                "runs": self._runs, "errors": self._errors, "last_run": self._last_run, **self._changed}
+
+scheduler = DeadlineScheduler()
+
+async def _run_once() -> dict[str, int]:
+    async with await psycopg.AsyncConnection.connect(db.DATABASE_URL, row_factory=dict_row) as conn:
+        return await run_deadlines(conn)
+
+def main(argv: list[str]) -> int:
+    for name, n in asyncio.run(_run_once()).items():
+        print(f"{name}: {n} 筆")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
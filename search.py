@@ -0,0 +1,78 @@
+# search.py
+# 案件全文檢索：PostgreSQL 沒有中文斷詞，這裡用「二元切詞(bigram)」處理 CJK 字串
+#   網站前端 → 網站 站前 前端 端(最後一個字另外保留，讓單字搜尋也找得到)
+# 英數字詞維持原樣(轉小寫)。migrations/0008 的 cjk_tokens() 用同樣規則建立 search_vector，
+# 兩邊規則要一致，改這裡也要另外加一個遷移改 DB 裡的函式
+import re
+from markupsafe import Markup, escape
+
+from pagination import SortKey
+
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_CJK_PUNCT = "\u3000-\u303f\uff00-\uffef"
+_ASCII_PUNCT = re.escape("!\"#$%&'()*+,-./:;<=>?@[\\]^_`{|}~")
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\s{_CJK}{_CJK_PUNCT}{_ASCII_PUNCT}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+
+SNIPPET_RADIUS = 40     #摘要在關鍵字前後各取幾個字
+
+def _runs(text: str) -> list[str]:
+    return _TOKEN_RE.findall((text or "").lower())
+
+def cjk_tokens(text: str) -> list[str]:
+    tokens = []
+    for run in _runs(text):
+        if _CJK_RE.match(run):
+            tokens += [run[i:i + 2] for i in range(len(run) - 1)]
+            tokens.append(run[-1])
+        else:
+            tokens.append(run)
+    return tokens
+
+#把使用者輸入轉成 to_tsquery('simple', ...) 的語法；沒有可用的字詞就回傳 None
+#  CJK 連續字 → bigram 用 <-> 串成片語(必須相鄰)、單一字 → 前綴比對
+#  英數字詞 → 前綴比對(pyth 可以找到 python)
+#  多個詞之間是 AND
+def build_tsquery(q: str) -> str | None:
+    parts = []
+    for run in _runs(q):
+        if _CJK_RE.match(run) and len(run) > 1:
+            parts.append("(" + " <-> ".join(f"'{run[i:i + 2]}'" for i in range(len(run) - 1)) + ")")
+        else:
+            parts.append(f"'{run}':*")
+    return " & ".join(parts) if parts else None
+
+#在原文中標出關鍵字(<mark>)並截出一小段摘要，回傳已跳脫的 HTML
+def highlight(text: str, q: str, radius: int | None = SNIPPET_RADIUS) -> Markup:
+    text = text or ""
+    terms = sorted({t for t in _runs(q)}, key=len, reverse=True)
+    if not terms:
+        return escape(text[:radius * 2] if radius else text)
+    pattern = re.compile("|".join(re.escape(t) for t in terms), re.IGNORECASE)
+    start, end = 0, len(text)
+    if radius:
+        m = pattern.search(text)
+        center = m.start() if m else 0
+        start = max(0, center - radius)
+        end = min(len(text), center + radius)
+    out = []
+    pos = start
+    for m in pattern.finditer(text, start, end):
+        out.append(escape(text[pos:m.start()]))
+        out.append(Markup("<mark>") + escape(m.group(0)) + Markup("</mark>"))
+        pos = m.end()
+    out.append(escape(text[pos:end]))
+    snippet = Markup("").join(out)
+    if radius:
+        if start > 0:
+            snippet = Markup("…") + snippet
+        if end < len(text):
+            snippet += Markup("…")
+    return snippet
+
+#搜尋結果依相關度排序(游標分頁用)
+#ts_rank_cd 回傳 real，轉成 float8 游標裡的值才能精確比對
+SEARCH_ORDER = [
+    SortKey("ts_rank_cd(search_vector, query)::float8", desc=True, column="rank", kind=float),
+    SortKey("id", desc=True, kind=int),
+]
@@ -0,0 +1,142 @@
+# sqltrace.py
+# 開發/測試環境用的 SQL 追蹤(預設關閉，設定 SQL_TRACE=1 才會啟用)
+#   * 每句 SQL 都記錄執行時間與是哪一行程式下的
+#   * 一個請求的 SQL 次數超過 SQL_TRACE_BUDGET，或同一句 SQL 重複 SQL_TRACE_REPEAT 次以上(N+1)就發出警告
+#   * SQL_TRACE_EXPLAIN_MS > 0 時，超過這個時間的 SQL 會把執行計畫印出來：
+#     單純的 SELECT 再跑一次 EXPLAIN (ANALYZE, BUFFERS)；會寫入或有副作用的(INSERT/UPDATE、pg_notify、nextval、FOR UPDATE ...)
+#     只跑 EXPLAIN，不會真的再執行。都包在一個一定 rollback 的 savepoint 裡，不影響原本的交易
+# 透過 metrics.QUERY_LISTENERS 接收每句 SQL，本身不改動任何查詢
+import logging
+import os
+import re
+import sys
+import time
+from collections import Counter
+from contextvars import ContextVar
+from pathlib import Path
+
+import psycopg
+from psycopg import pq
+from psycopg.rows import tuple_row
+
+from metrics import QUERY_LISTENERS
+
+SQL_TRACE = os.getenv("SQL_TRACE", "0") == "1"
+SQL_TRACE_BUDGET = int(os.getenv("SQL_TRACE_BUDGET", "10"))            #一個請求最多幾句 SQL
+SQL_TRACE_REPEAT = int(os.getenv("SQL_TRACE_REPEAT", "3"))             #同一句 SQL 重複幾次算 N+1
+SQL_TRACE_EXPLAIN_MS = float(os.getenv("SQL_TRACE_EXPLAIN_MS", "0"))   #超過幾毫秒要印執行計畫(0 = 不印)
+
+logger = logging.getLogger("sqltrace")
+
+_ROOT = Path(__file__).resolve().parent
+_SKIP_FILES = {str(Path(__file__).resolve()), str(_ROOT / "metrics.py")}
+_SPACES = re.compile(r"\s+")
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b", re.IGNORECASE)
+#再執行一次會有副作用的 SQL：寫入(包含 WITH 裡的 INSERT/UPDATE/DELETE)、鎖定列、會改狀態的函式
+_SIDE_EFFECTS = re.compile(
+    r"\b(INSERT|UPDATE|DELETE|MERGE)\b|\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE|KEY\s+SHARE)\b"
+    r"|\b(pg_notify|nextval|setval|set_config|pg_sleep|pg_(try_)?advisory\w*)\s*\(",
+    re.IGNORECASE)
+
+#目前這個請求執行過的 SQL：[(sql, 毫秒, 呼叫位置), ...]
+_statements: ContextVar[list | None] = ContextVar("sqltrace_statements", default=None)
+_explaining: ContextVar[bool] = ContextVar("sqltrace_explaining", default=False)
+
+def sql_text(cur, query) -> str:
+    return _SPACES.sub(" ", _as_bytes(cur, query).decode()).strip()
+
+#找出是專案裡哪一行程式下的 SQL，例如 "pagination.py:153 fetch_page ← main.py:386 browse_projects"
+#skip：額外要略過的檔案(例如呼叫這個函式的工具本身)
+def call_site(limit: int = 2, skip: tuple = ()) -> str:
+    sites = []
+    frame = sys._getframe(1)
+    while frame is not None and len(sites) < limit:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(str(_ROOT)) and filename not in _SKIP_FILES and filename not in skip
+                and "site-packages" not in filename and frame.f_code.co_name != "__call__"):  #略過 ASGI middleware
+            sites.append(f"{Path(filename).name}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return " ← ".join(sites) or "?"
+
+async def _explain(cur, query, params, text: str):
+    conn = cur.connection
+    explain = b"EXPLAIN " if _SIDE_EFFECTS.search(text) else b"EXPLAIN (ANALYZE, BUFFERS) "
+    token = _explaining.set(True)   #EXPLAIN 本身也是 SQL，不要再被追蹤
+    plan = None
+    try:
+        #savepoint 一定 rollback：ANALYZE 做過的事不留下，EXPLAIN 失敗也不會讓原本的交易變成 aborted
+        async with conn.transaction():
+            async with conn.cursor(row_factory=tuple_row) as ecur:
+                await ecur.execute(explain + _as_bytes(cur, query), params)
+                plan = "\n".join(r[0] for r in await ecur.fetchall())
+            raise psycopg.Rollback()
+    except Exception as e:
+        logger.warning("無法取得執行計畫：%s", e)
+    finally:
+        _explaining.reset(token)
+    if plan is not None:
+        logger.warning("執行計畫：\n%s", plan)
+
+def _as_bytes(cur, query) -> bytes:
+    if isinstance(query, bytes):
+        return query
+    if isinstance(query, str):
+        return query.encode()
+    return query.as_bytes(cur.connection)
+
+async def trace_query(cur, query, params, seconds: float):
+    if _explaining.get():
+        return
+    text = sql_text(cur, query)
+    ms = seconds * 1000
+    site = call_site()
+    logger.info("%.1f ms  %s  [%s]", ms, text, site)
+    statements = _statements.get()
+    if statements is not None:
+        statements.append((text, ms, site))
+    if SQL_TRACE_EXPLAIN_MS > 0 and ms >= SQL_TRACE_EXPLAIN_MS and _EXPLAINABLE.match(text):
+        conn = cur.connection
+        #pipeline mode 裡還有結果沒收完；交易已經出錯時也不能再下指令
+        if (conn.pgconn.pipeline_status == pq.PipelineStatus.OFF
+                and conn.info.transaction_status != pq.TransactionStatus.INERROR):
+            logger.warning("慢查詢 %.1f ms  [%s]", ms, site)
+            await _explain(cur, query, params, text)
+
+#請求結束時檢查 SQL 次數與重複的 SQL
+def _report(method: str, path: str, statements: list, elapsed: float):
+    total_ms = sum(ms for _, ms, _ in statements)
+    if len(statements) > SQL_TRACE_BUDGET:
+        logger.warning("%s %s 執行了 %d 句 SQL(上限 %d)，共 %.1f ms", method, path,
+                       len(statements), SQL_TRACE_BUDGET, total_ms)
+    counts = Counter(text for text, _, _ in statements)
+    for text, n in counts.items():
+        if n >= SQL_TRACE_REPEAT:
+            sites = sorted({site for t, _, site in statements if t == text})
+            logger.warning("%s %s 同一句 SQL 執行了 %d 次(可能是 N+1)：%s  [%s]", method, path, n, text, "; ".join(sites))
+    logger.info("%s %s：%d 句 SQL，DB %.1f ms，總共 %.1f ms", method, path, len(statements), total_ms, elapsed * 1000)
+
+class SQLTraceMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        statements = []
+        token = _statements.set(statements)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _statements.reset(token)
+            _report(scope["method"], scope["path"], statements, time.perf_counter() - start)
+
+#SQL_TRACE=1 時掛上 middleware 與 SQL listener
+def setup_sql_trace(app):
+    if not SQL_TRACE:
+        return
+    if not logger.handlers and not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO)
+    logger.setLevel(logging.INFO)
+    QUERY_LISTENERS.append(trace_query)
+    app.add_middleware(SQLTraceMiddleware)
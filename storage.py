@@ -0,0 +1,375 @@
+# storage.py
+# 上傳檔案的內容定址(content-addressed)儲存區：
+#   檔案以 SHA-256 命名，依前綴分層放在 blobs/ab/cd/<sha256>(單一資料夾不會塞進幾百萬個檔案)
+#   同樣內容只存一份；closure_files / proposals 的列就是參照，
+#   沒有任何列參照的 blob 由 gc 清掉
+# 儲存後端用 STORAGE_BACKEND 切換：
+#   local  存在本機 UPLOAD_DIR/blobs/(預設)
+#   s3     存在 S3 相容的物件儲存(AWS S3、MinIO ...)，需要另外安裝 boto3；多台主機可以共用
+#   python storage.py gc [--dry-run] [--grace-hours N]
+#   python storage.py migrate [--dry-run] [--keep]    把舊資料(uploads/ 底下的檔案路徑)搬進目前的後端
+import hashlib
+import os
+import shutil
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import Iterator, NamedTuple
+
+UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR", "uploads"))  #設定上傳的檔案要儲存的資料夾
+BLOB_DIR = UPLOAD_DIR / "blobs"
+TMP_DIR = UPLOAD_DIR / "tmp"    #上傳中的暫存檔(和 blobs 同一個磁碟，rename 才是原子操作)
+GC_GRACE_SECONDS = 24 * 3600    #太新的 blob 不清，避免刪到「剛存好、DB 還沒 commit」的檔案
+READ_CHUNK = 256 * 1024
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+S3_BUCKET = os.getenv("S3_BUCKET", "")
+S3_PREFIX = os.getenv("S3_PREFIX", "blobs/")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL") or None     #MinIO 等 S3 相容服務的網址；帳密用 AWS_ACCESS_KEY_ID 等標準環境變數
+
+def shard(sha256: str) -> str:
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+def blob_path(sha256: str) -> Path:
+    return BLOB_DIR / shard(sha256)
+
+class BlobStat(NamedTuple):
+    size: int
+    mtime: float
+
+# ---------------- 讀取中的檔案 ----------------
+#本機檔案(local 後端的 blob，或還沒搬移的舊資料)
+class LocalFile:
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+
+    def stat(self) -> BlobStat | None:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return BlobStat(st.st_size, st.st_mtime)
+
+    def iter_range(self, start: int, length: int) -> Iterator[bytes]:
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            remaining = length
+            while remaining > 0:
+                chunk = f.read(min(READ_CHUNK, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+class S3File:
+    def __init__(self, client, bucket: str, key: str):
+        self.client, self.bucket, self.key = client, bucket, key
+
+    def stat(self) -> BlobStat | None:
+        from botocore.exceptions import ClientError
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self.key)
+        except ClientError:
+            return None
+        return BlobStat(head["ContentLength"], head["LastModified"].timestamp())
+
+    def iter_range(self, start: int, length: int) -> Iterator[bytes]:
+        if length <= 0:
+            return
+        body = self.client.get_object(Bucket=self.bucket, Key=self.key,
+                                      Range=f"bytes={start}-{start + length - 1}")["Body"]
+        try:
+            yield from body.iter_chunks(READ_CHUNK)
+        finally:
+            body.close()
+
+# ---------------- 儲存後端 ----------------
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root: Path = BLOB_DIR):
+        self.root = root
+
+    def _path(self, sha256: str) -> Path:
+        return self.root / shard(sha256)
+
+    #把暫存檔收進儲存區，回傳存放位置(寫進 DB 的 filepath)；內容已經存在就丟掉暫存檔、直接沿用舊的
+    def put(self, tmp: Path, sha256: str) -> str:
+        dest = self._path(sha256)
+        if dest.exists():
+            try:
+                os.utime(dest)  #更新時間，讓 gc 知道它剛被用到
+                tmp.unlink(missing_ok=True)
+                return str(dest)
+            except FileNotFoundError:
+                pass    #剛好被 gc 刪掉，用這份補回去
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, dest)
+        return str(dest)
+
+    def open(self, sha256: str) -> LocalFile:
+        return LocalFile(self._path(sha256))
+
+    def delete(self, sha256: str):
+        self._path(sha256).unlink(missing_ok=True)
+
+    #gc 用：blob 在 cutoff 之後都沒被用到才刪，回傳釋放的大小(沒刪回傳 None)
+    #先改名搬到暫存區再確認一次時間：改名之後 put() 看不到舊檔會自己補一份，
+    #改名之前剛被 put() 沿用(os.utime)的就搬回去
+    def delete_if_older(self, sha256: str, cutoff: float) -> int | None:
+        path = self._path(sha256)
+        TMP_DIR.mkdir(parents=True, exist_ok=True)
+        trash = TMP_DIR / f"{sha256}.{uuid.uuid4().hex}.trash"
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return None
+        st = trash.stat()
+        if st.st_mtime >= cutoff:
+            os.replace(trash, path)     #內容相同，就算 put() 已經補了一份也沒關係
+            return None
+        trash.unlink()
+        return st.st_size
+
+    #列出所有 blob：(sha256, 修改時間, 大小)
+    def iter_blobs(self) -> Iterator[tuple[str, float, int]]:
+        if not self.root.exists():
+            return
+        for path in self.root.glob("*/*/*"):
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue
+            if path.is_file():
+                yield path.name, st.st_mtime, st.st_size
+
+class S3Storage:
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: str | None = S3_ENDPOINT_URL):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 需要安裝 boto3：pip install boto3")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 需要設定 S3_BUCKET")
+        self.bucket, self.prefix = bucket, prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, sha256: str) -> str:
+        return self.prefix + shard(sha256)
+
+    def put(self, tmp: Path, sha256: str) -> str:
+        from botocore.exceptions import ClientError
+        key = self._key(sha256)
+        try:
+            try:
+                head = self.client.head_object(Bucket=self.bucket, Key=key)
+            except ClientError:
+                head = None
+            if head is not None:
+                #已經有了：複製到自己身上更新修改時間(讓 gc 知道它剛被用到)
+                #REPLACE 會把 metadata 換成這次給的，所以把原本的帶回去
+                try:
+                    self.client.copy_object(Bucket=self.bucket, Key=key, CopySource={"Bucket": self.bucket, "Key": key},
+                                            MetadataDirective="REPLACE", Metadata=head.get("Metadata", {}),
+                                            ContentType=head.get("ContentType", "binary/octet-stream"))
+                    return f"s3://{self.bucket}/{key}"
+                except ClientError as e:
+                    if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                        raise
+                    #剛好被 gc 刪掉，用這份補回去
+            self.client.upload_file(str(tmp), self.bucket, key)
+        finally:
+            tmp.unlink(missing_ok=True)
+        return f"s3://{self.bucket}/{key}"
+
+    def open(self, sha256: str) -> S3File:
+        return S3File(self.client, self.bucket, self._key(sha256))
+
+    def delete(self, sha256: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(sha256))
+
+    #gc 用：S3 不能原子地改名，刪之前再查一次修改時間，把和 put() 撞在一起的機會縮到最小
+    def delete_if_older(self, sha256: str, cutoff: float) -> int | None:
+        st = self.open(sha256).stat()
+        if st is None or st.mtime >= cutoff:
+            return None
+        self.delete(sha256)
+        return st.size
+
+    def iter_blobs(self) -> Iterator[tuple[str, float, int]]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].rsplit("/", 1)[-1], obj["LastModified"].timestamp(), obj["Size"]
+
+_BACKENDS = {"local": LocalStorage, "s3": S3Storage}
+_storage = None
+
+#目前設定的儲存後端(第一次用到時才建立)
+def get_storage():
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND not in _BACKENDS:
+            raise RuntimeError(f"未知的 STORAGE_BACKEND：{STORAGE_BACKEND}")
+        _storage = _BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+def put_blob(tmp: Path, sha256: str) -> str:
+    return get_storage().put(tmp, sha256)
+
+#下載用：有 sha256 的從儲存後端讀；還沒搬移的舊資料直接讀 filepath
+def open_stored(sha256: str | None, filepath: str | None):
+    if sha256:
+        return get_storage().open(sha256)
+    return LocalFile(filepath) if filepath else None
+
+# ---------------- gc ----------------
+#從一批 sha256 中找出沒有被任何資料參照的
+_UNREFERENCED_SQL = """
+    SELECT s.sha FROM unnest(%s::text[]) AS s(sha)
+    WHERE NOT EXISTS (SELECT 1 FROM closure_files cf WHERE cf.sha256 = s.sha)
+      AND NOT EXISTS (SELECT 1 FROM proposals pr WHERE pr.proposal_sha256 = s.sha);
+"""
+
+#清掉沒有被參照的 blob 以及殘留的暫存檔，回傳 (刪除數, 釋放的位元組)
+def gc_orphan_blobs(conn, grace_seconds: float = GC_GRACE_SECONDS, dry_run: bool = False,
+                    batch_size: int = 1000, out=print) -> tuple[int, int]:
+    storage = get_storage()
+    cutoff = time.time() - grace_seconds
+    removed, freed = 0, 0
+
+    def sweep(batch: dict[str, int]):
+        nonlocal removed, freed
+        rows = conn.execute(_UNREFERENCED_SQL, (list(batch),)).fetchall()
+        for (sha,) in rows:
+            if dry_run:
+                st = storage.open(sha).stat()
+                size = None if st is None or st.mtime >= cutoff else st.size
+            else:
+                size = storage.delete_if_older(sha, cutoff)     #查詢期間剛好又被上傳一次的不刪
+            if size is None:
+                continue
+            out(f"{'(dry-run) ' if dry_run else ''}刪除 {sha} ({size} bytes)")
+            removed += 1
+            freed += size
+
+    batch: dict[str, int] = {}
+    for sha, mtime, size in storage.iter_blobs():
+        if mtime >= cutoff:
+            continue
+        batch[sha] = size
+        if len(batch) >= batch_size:
+            sweep(batch)
+            batch = {}
+    if batch:
+        sweep(batch)
+    #上傳中斷留下的暫存檔
+    if TMP_DIR.exists():
+        for path in TMP_DIR.iterdir():
+            try:
+                st = path.stat()
+            except FileNotFoundError:
+                continue    #上傳剛好完成，已經被搬進 blobs
+            if st.st_mtime < cutoff:
+                out(f"{'(dry-run) ' if dry_run else ''}刪除暫存檔 {path}")
+                if not dry_run:
+                    path.unlink(missing_ok=True)
+                removed += 1
+                freed += st.st_size
+    return removed, freed
+
+# ---------------- migrate ----------------
+#(資料表, id 欄位, 路徑欄位, sha256 欄位, 大小欄位)
+_FILE_TABLES = [
+    ("closure_files", "id", "filepath", "sha256", "size"),
+    ("proposals", "id", "proposal_filepath", "proposal_sha256", "proposal_size"),
+]
+
+def _copy_to_tmp(src: Path) -> tuple[Path, str, int]:
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = TMP_DIR / f"{uuid.uuid4().hex}.part"
+    digest = hashlib.sha256()
+    size = 0
+    with open(src, "rb") as fin, open(tmp, "wb") as fout:
+        while chunk := fin.read(READ_CHUNK):
+            digest.update(chunk)
+            size += len(chunk)
+            fout.write(chunk)
+    return tmp, digest.hexdigest(), size
+
+#把檔案搬進目前的後端：
+#  1. 舊資料(sha256 是 NULL，檔案直接放在 uploads/ 底下)：算出雜湊後收進儲存區，更新那一列
+#  2. 後端不是 local 時：本機 blobs/ 裡還有被參照的 blob 就上傳過去，更新 filepath
+#每一列各自 commit，中途中斷可以重跑；搬完後刪掉舊檔(--keep 則保留)
+def migrate_files(conn, dry_run: bool = False, keep: bool = False, out=print) -> tuple[int, int]:
+    storage = get_storage()
+    moved, missing = 0, 0
+    for table, id_col, path_col, sha_col, size_col in _FILE_TABLES:
+        rows = conn.execute(f"SELECT {id_col}, {path_col} FROM {table} WHERE {sha_col} IS NULL ORDER BY {id_col};").fetchall()
+        for row_id, filepath in rows:
+            src = Path(filepath or "")
+            if not filepath or not src.is_file():
+                out(f"找不到檔案：{table} #{row_id} {filepath}")
+                missing += 1
+                continue
+            out(f"{'(dry-run) ' if dry_run else ''}{table} #{row_id} {src}")
+            moved += 1
+            if dry_run:
+                continue
+            tmp, sha, size = _copy_to_tmp(src)
+            location = storage.put(tmp, sha)
+            with conn.transaction():
+                conn.execute(f"UPDATE {table} SET {path_col}=%s, {sha_col}=%s, {size_col}=%s WHERE {id_col}=%s;",
+                             (location, sha, size, row_id))
+            #同一個舊檔可能被好幾列參照，全部搬完才刪
+            still_used = any(conn.execute(f"SELECT 1 FROM {t} WHERE {p} = %s LIMIT 1;", (filepath,)).fetchone()
+                             for t, _, p, _, _ in _FILE_TABLES)
+            if not keep and not still_used:
+                src.unlink(missing_ok=True)
+    if storage.name != "local":
+        local = LocalStorage()
+        for sha, _, _ in list(local.iter_blobs()):
+            referenced = any(conn.execute(f"SELECT 1 FROM {t} WHERE {s} = %s LIMIT 1;", (sha,)).fetchone()
+                             for t, _, _, s, _ in _FILE_TABLES)
+            if not referenced:
+                continue
+            out(f"{'(dry-run) ' if dry_run else ''}上傳 {sha} → {storage.name}")
+            moved += 1
+            if dry_run:
+                continue
+            TMP_DIR.mkdir(parents=True, exist_ok=True)
+            tmp = TMP_DIR / f"{uuid.uuid4().hex}.part"
+            shutil.copyfile(blob_path(sha), tmp)
+            location = storage.put(tmp, sha)
+            with conn.transaction():
+                for t, _, p, s, _ in _FILE_TABLES:
+                    conn.execute(f"UPDATE {t} SET {p}=%s WHERE {s}=%s;", (location, sha))
+            if not keep:
+                local.delete(sha)
+    return moved, missing
+
+def main(argv: list[str]) -> int:
+    if not argv or argv[0] not in ("gc", "migrate"):
+        print("用法：python storage.py gc [--dry-run] [--grace-hours N]\n"
+              "      python storage.py migrate [--dry-run] [--keep]")
+        return 2
+    import psycopg
+    from db import DATABASE_URL
+    dry_run = "--dry-run" in argv
+    with psycopg.connect(DATABASE_URL, autocommit=True) as conn:
+        if argv[0] == "migrate":
+            moved, missing = migrate_files(conn, dry_run, keep="--keep" in argv)
+            print(f"搬移 {moved} 個檔案，{missing} 個找不到")
+            return 1 if missing else 0
+        grace = GC_GRACE_SECONDS
+        if "--grace-hours" in argv:
+            grace = float(argv[argv.index("--grace-hours") + 1]) * 3600
+        removed, freed = gc_orphan_blobs(conn, grace, dry_run)
+    print(f"共 {removed} 個檔案，{freed / 1024 / 1024:.1f} MB")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,112 @@
+# uploads.py
+# 上傳檔案的共用流程：
+#   1. UploadLimitMiddleware 先看 Content-Length，超過上限直接回 413，不讀 body
+#   2. store_upload 先看檔頭(PDF 要是 %PDF-)，再分塊寫到暫存檔(在 threadpool 寫，不卡 event loop)，
+#      同時計算 SHA-256
+#   3. 寫完才交給 storage 後端(本機 rename 或上傳到 S3)，內容重複就沿用舊檔；中途失敗不會留下寫一半的檔案
+import hashlib
+import os
+import re
+import uuid
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import PlainTextResponse
+
+from metrics import count_bytes
+from storage import TMP_DIR, put_blob
+
+MB = 1024 * 1024
+CHUNK_SIZE = 1 * MB     #每次讀寫的大小
+#各類上傳的大小上限(位元組)
+UPLOAD_LIMITS = {
+    "proposal": int(os.getenv("PROPOSAL_MAX_BYTES", str(20 * MB))),
+    "closure": int(os.getenv("CLOSURE_MAX_BYTES", str(500 * MB))),
+}
+MULTIPART_OVERHEAD = 64 * 1024  #multipart 表單欄位與邊界字串的額外空間
+PDF_MAGIC = b"%PDF-"
+
+#哪些路徑是哪一類上傳
+UPLOAD_ROUTES = [
+    (re.compile(r"^/projects/\d+/propose$"), "proposal"),
+    (re.compile(r"^/projects/\d+/upload$"), "closure"),
+]
+
+def _too_large(kind: str) -> HTTPException:
+    return HTTPException(413, f"檔案過大（上限 {UPLOAD_LIMITS[kind] // MB} MB）")
+
+class UploadLimitMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        kind = next((k for pattern, k in UPLOAD_ROUTES if pattern.match(scope["path"])), None)
+        if kind is None:
+            return await self.app(scope, receive, send)
+        limit = UPLOAD_LIMITS[kind] + MULTIPART_OVERHEAD
+        #有 Content-Length 就先擋，連 body 都不用收
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            response = PlainTextResponse(_too_large(kind).detail, status_code=413, headers={"Connection": "close"})
+            return await response(scope, receive, send)
+        #沒有 Content-Length(chunked)就邊收邊數，超過就中止表單解析
+        received = 0
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    raise _too_large(kind)
+            return message
+        await self.app(scope, limited_receive, send)
+
+def _open_tmp():
+    TMP_DIR.mkdir(parents=True, exist_ok=True)
+    tmp = TMP_DIR / f"{uuid.uuid4().hex}.part"
+    return tmp, tmp.open("wb")
+
+def _finish(f):
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+def _discard(f, tmp: Path):
+    f.close()
+    tmp.unlink(missing_ok=True)
+
+#把上傳檔案串流寫進儲存區，回傳 {"sha256", "size", "path"}(path 是存放位置，寫進 DB 的 filepath)
+async def store_upload(upload: UploadFile, kind: str, require_pdf: bool = False) -> dict:
+    limit = UPLOAD_LIMITS[kind]
+    if upload.size is not None and upload.size > limit:
+        raise _too_large(kind)
+    #檢查檔頭，不對就不用往下複製了
+    head = await upload.read(len(PDF_MAGIC))
+    if require_pdf and head != PDF_MAGIC:
+        raise HTTPException(400, "提案書格式不正確（請上傳 PDF）")
+    tmp, f = await run_in_threadpool(_open_tmp)
+    digest = hashlib.sha256(head)
+    size = len(head)
+    try:
+        await run_in_threadpool(f.write, head)
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > limit:
+                raise _too_large(kind)
+            digest.update(chunk)
+            await run_in_threadpool(f.write, chunk)
+        await run_in_threadpool(_finish, f)
+        sha256 = digest.hexdigest()
+        path = await run_in_threadpool(put_blob, tmp, sha256)
+    except BaseException:
+        await run_in_threadpool(_discard, f, tmp)
+        raise
+    count_bytes("upload", kind, size)
+    return {"sha256": sha256, "size": size, "path": path}